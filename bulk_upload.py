@@ -1,18 +1,27 @@
 import requests
 import os
+import re
+import sys
 import json
-from qdrant_client import QdrantClient
+import time
 from qdrant_client.http import models
 
+# Same vector store selection as the gateway (VECTOR_STORE / VECTOR_STORE_PATH)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "gateway"))
+from vector_store import connect
+
 # --- Config ---
 API_URL = "http://localhost:8000/add"
+GATEWAY_URL = API_URL.replace("/add", "")
 IMAGE_FOLDER = "./demo_images"
 MALL_CONFIG = "mall_config.json"
 MALL_NAME = "ABC Achrafieh"
+# Must match the gateway's SHARDING ("mall" = one collection per mall)
+SHARDING = os.getenv("SHARDING", "single")
 
-# Connect to Qdrant directly to check for duplicates
-# (This assumes Qdrant is running on localhost:6333)
-qdrant = QdrantClient("localhost", port=6333)
+# Connect to the vector store directly to check for duplicates
+# (This assumes Qdrant is running on localhost:6333, unless VECTOR_STORE=embedded)
+qdrant = connect("localhost", 6333)
 
 def get_store_info(filename, directory):
     # Heuristic: Split "zara_dress.jpg" -> "Zara"
@@ -24,18 +33,30 @@ def get_store_info(filename, directory):
     # Lookup in config
     return store_key, directory.get(store_key, {"level": "L1"})
 
+def collection_name():
+    """Same naming as gateway/routing.py: locus_items or locus_items__<mall>."""
+    if SHARDING != "mall":
+        return "locus_items"
+    slug = re.sub(r"[^a-z0-9]+", "_", MALL_NAME.lower()).strip("_") or "default"
+    return f"locus_items__{slug}"
+
 def is_already_indexed(filename):
     """
     Asks Qdrant: 'Do you have an item with this filename?'
+    Duplicates merged into another item only appear in its listings.
     """
     try:
         result, _ = qdrant.scroll(
-            collection_name="locus_items",
+            collection_name=collection_name(),
             scroll_filter=models.Filter(
-                must=[
+                should=[
                     models.FieldCondition(
                         key="filename",
                         match=models.MatchValue(value=filename)
+                    ),
+                    models.FieldCondition(
+                        key="listings[].filename",
+                        match=models.MatchValue(value=filename)
                     )
                 ]
             ),
@@ -46,6 +67,36 @@ def is_already_indexed(filename):
         # If collection doesn't exist yet, it's not indexed
         return False
 
+def wait_for_ingest(job_ids, timeout_s=1800):
+    """Waits for the gateway's ingest queue to drain, then reports each job's outcome."""
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            status = requests.get(f"{GATEWAY_URL}/ingest/status", timeout=30).json()
+        except Exception:
+            status = {}
+        if status.get("depth") == 0:
+            break
+        print(f"⏳ Waiting for ingest: {status.get('depth', '?')} jobs left...")
+        time.sleep(5)
+
+    counts = {"saved": 0, "merged": 0, "failed": 0, "pending": 0}
+    for job_id in job_ids:
+        try:
+            job = requests.get(f"{GATEWAY_URL}/ingest/jobs/{job_id}", timeout=30).json()
+        except Exception:
+            counts["pending"] += 1
+            continue
+        if job.get("state") == "done":
+            counts[job["result"]["status"]] = counts.get(job["result"]["status"], 0) + 1
+        elif job.get("state") == "failed":
+            print(f"   ❌ {job.get('filename')}: {job.get('error')}")
+            counts["failed"] += 1
+        else:
+            counts["pending"] += 1
+    print(f"🏁 Complete! {counts['saved']} saved, {counts['merged']} merged as duplicates, "
+          f"{counts['failed']} failed, {counts['pending']} still pending.")
+
 def run_upload():
     # Load Mall Config
     if not os.path.exists(MALL_CONFIG):
@@ -62,6 +113,7 @@ def run_upload():
     
     new_count = 0
     skip_count = 0
+    job_ids = []
 
     for filename in files:
         # 1. CHECK: Is it already there?
@@ -78,6 +130,10 @@ def run_upload():
             "level": store_info['level'],
             "mall": MALL_NAME
         }
+        # Store coordinates → geo payload for nearness ranking
+        if "lat" in store_info and "lon" in store_info:
+            metadata["lat"] = store_info["lat"]
+            metadata["lon"] = store_info["lon"]
         
         # 3. UPLOAD: Send to AI
         print(f"📤 Uploading {filename}...")
@@ -86,15 +142,25 @@ def run_upload():
             try:
                 # Use 'data' for form fields, 'files' for the image
                 r = requests.post(API_URL, data=metadata, files={"file": img}, timeout=30)
-                if r.status_code == 200:
-                    print(f"   ✅ Success")
+                if r.status_code == 202:
+                    # Queued — the gateway's ingest workers vectorize it
+                    print(f"   📥 Queued")
+                    job_ids.append(r.json()["job_id"])
                     new_count += 1
                 else:
                     print(f"   ❌ Failed: {r.text}")
             except Exception as e:
                 print(f"   ❌ Error: {e}")
 
-    print(f"\n🏁 Complete! Added {new_count} new items. Skipped {skip_count} duplicates.")
+    print(f"\n📥 Queued {new_count} new items. Skipped {skip_count} duplicates.")
+    wait_for_ingest(job_ids)
+
+    try:
+        stats = requests.get(f"{GATEWAY_URL}/dedup/stats", timeout=30).json()
+        print(f"🔗 Index: {stats['points']} points for {stats['listings']} listings "
+              f"({stats['index_shrink_pct']}% smaller from near-duplicate collapse)")
+    except Exception:
+        pass
 
 if __name__ == "__main__":
     run_upload()
\ No newline at end of file
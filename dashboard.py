@@ -4,8 +4,10 @@ import requests
 from PIL import Image, ImageDraw
 import io
 import base64
+import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 st.set_page_config(layout="wide", page_title="Locus Lens")
 
@@ -44,21 +46,24 @@ def check_health():
         resp = requests.get(f"{GATEWAY_URL}/health", timeout=3)
         if resp.status_code == 200:
             data = resp.json()
-            return data.get("ready", False), data.get("services", {})
+            return data.get("ready", False), data.get("services", {}), data.get("models", {})
     except Exception:
         pass
-    return False, {}
+    return False, {}, {}
 
 
 # ─── Loading Screen ───────────────────────────────────────────────────────────
-def render_loading_screen(services):
+MODEL_NAMES = {"clip": "CLIP", "rembg": "rembg", "clothing": "DeepFashion2", "accessories": "YOLOS"}
+
+
+def render_loading_screen(services, models):
     ready_count  = sum(1 for v in services.values() if v == "ready")
     total_count  = max(len(services), 1)
     progress_pct = int((ready_count / total_count) * 100)
 
     SERVICE_META = {
         "gateway":       ("🌐", "Gateway",        "API routing &amp; orchestration"),
-        "visual_engine": ("🧠", "Vision Engine",   "CLIP &middot; DeepFashion2 &middot; YOLOv8"),
+        "visual_engine": ("🧠", "Vision Engine",   "CLIP &middot; rembg &middot; DeepFashion2 &middot; YOLOS"),
         "qdrant":        ("🗄️",  "Vector Database", "Qdrant similarity search"),
     }
 
@@ -66,6 +71,12 @@ def render_loading_screen(services):
     for i, (key, meta) in enumerate(SERVICE_META.items()):
         icon, name, desc = meta
         status = services.get(key, "loading")
+        if key == "visual_engine" and models:
+            # Per-model progress: ✓ loaded, … still loading, ✕ failed
+            marks = {"ready": "&#x2713;", "loading": "&hellip;", "error": "&#x2715;"}
+            desc = " &middot; ".join(
+                f"{MODEL_NAMES.get(m, m)} {marks.get(v, '&hellip;')}" for m, v in models.items()
+            )
         if status == "ready":
             card_cls, badge_cls, badge_txt = "ready",   "badge-ready",   "&#x25CF; READY"
         elif status == "loading":
@@ -167,7 +178,7 @@ def render_loading_screen(services):
     <div class="emoji">🔎</div>
   </div>
   <div class="title">Warming Up</div>
-  <div class="sub">AI models are loading into memory.<br>This takes 3–5 min on first launch<span class="cursor">_</span></div>
+  <div class="sub">AI models are loading into memory.<br>First launch downloads them (3–5 min); restarts load from the local cache<span class="cursor">_</span></div>
   <div class="cards">{cards_html}</div>
   <div class="prog-wrap">
     <div class="prog-meta"><span>Loading progress</span><span>{ready_count} / {total_count} ready</span></div>
@@ -182,15 +193,108 @@ def render_loading_screen(services):
 
 
 # ─── Gate: show loading screen until ready ───────────────────────────────────
-is_ready, services = check_health()
+is_ready, services, models = check_health()
 
 if not is_ready:
-    render_loading_screen(services)
+    render_loading_screen(services, models)
     time.sleep(5)
     st.rerun()
     st.stop()
 
 
+# ─── Detection Overlay ────────────────────────────────────────────────────────
+COLORS = ["#e8c547", "#47c5e8", "#e847a3", "#47e8a3", "#e87447", "#a347e8"]
+
+
+def draw_detections(image, detections):
+    annotated = image.copy()
+    draw = ImageDraw.Draw(annotated)
+    for i, det in enumerate(detections):
+        x1, y1, x2, y2 = det["bbox"]
+        color = COLORS[i % len(COLORS)]
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
+        label_text = f"  {i+1}. {det['label'].upper()}  "
+        draw.rectangle([x1, y1 - 22, x1 + len(label_text) * 7, y1], fill=color)
+        draw.text((x1 + 4, y1 - 19), label_text.strip(), fill="#0d0d0d")
+    return annotated
+
+
+# ─── Per-upload Derivatives ──────────────────────────────────────────────────
+# Streamlit reruns the whole script on every click; these only recompute
+# when the upload (or its detections) change.
+@st.cache_data(max_entries=8)
+def load_upload(image_bytes):
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+
+@st.cache_data(max_entries=8)
+def annotated_image(image_bytes, detections):
+    return draw_detections(load_upload(image_bytes), detections)
+
+
+@st.cache_data(max_entries=8)
+def detection_patches(image_bytes, detections):
+    """Base64 PNG of every detection's crop, for the selection cards."""
+    original = load_upload(image_bytes)
+    patches = []
+    for det in detections:
+        buf = io.BytesIO()
+        original.crop(tuple(det["bbox"])).save(buf, format="PNG")
+        patches.append(base64.b64encode(buf.getvalue()).decode())
+    return patches
+
+
+@st.cache_data(max_entries=8)
+def selection_crop(image_bytes, bbox):
+    return load_upload(image_bytes).crop(tuple(bbox))
+
+
+@st.cache_data(max_entries=256)
+def local_thumbnail(path):
+    """Downscaled demo image, for matches without a gateway thumbnail."""
+    image = Image.open(path)
+    image.thumbnail((256, 256))
+    return image.convert("RGB")
+
+
+# ─── Match Prefetch ───────────────────────────────────────────────────────────
+# As soon as detection finishes, matches for every item are fetched in the
+# background with one /search_all call, so "Find Similar Items" is usually
+# instant by the time the user has picked one.
+@st.cache_resource
+def prefetch_pool():
+    return ThreadPoolExecutor(max_workers=2)
+
+
+def fetch_all_matches(image_bytes, detections):
+    files = {"file": ("image.png", image_bytes, "image/png")}
+    data  = {"detections": json.dumps([{"bbox": d["bbox"], "label": d["label"]} for d in detections])}
+    resp  = requests.post(f"{GATEWAY_URL}/search_all", files=files, data=data, timeout=120)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def prefetched_matches(idx):
+    """The /search-shaped result for detection idx, or None to search normally."""
+    future = st.session_state.prefetch
+    if future is None:
+        return None
+    try:
+        result = future.result(timeout=60)
+        entry  = result["results"][idx]
+    except Exception:
+        return None
+    if entry.get("error"):
+        return None
+    return {
+        "matches":           entry["matches"],
+        "debug_image":       entry["debug_image"],
+        "detected_category": entry["detected_category"],
+        "next_cursor":       entry.get("next_cursor"),
+        "degradations":      result.get("degradations", []),
+    }
+
+
 # ─── Session State ────────────────────────────────────────────────────────────
 if "detections" not in st.session_state:
     st.session_state.detections = []
@@ -202,6 +306,8 @@ if "search_results" not in st.session_state:
     st.session_state.search_results = None
 if "uploaded_bytes" not in st.session_state:
     st.session_state.uploaded_bytes = None
+if "prefetch" not in st.session_state:
+    st.session_state.prefetch = None
 
 # ─── STEP 1: Upload ───────────────────────────────────────────────────────────
 st.markdown("<span class='step-badge'>STEP 1</span> Upload your photo", unsafe_allow_html=True)
@@ -216,41 +322,51 @@ if uploaded_file:
         st.session_state.original_image = None
         st.session_state.selected_idx = None
         st.session_state.search_results = None
+        st.session_state.prefetch = None
 
     # ─── STEP 2: Detect ──────────────────────────────────────────────────────
     if not st.session_state.detections:
         st.markdown("<span class='step-badge'>STEP 2</span> AI is scanning the image for items…", unsafe_allow_html=True)
+        # Boxes are drawn as each detection streams in, so clothing shows up
+        # while the slower accessory model is still running.
+        status_slot  = st.empty()
+        preview_slot = st.empty()
         with st.spinner("🔍 Detecting fashion items..."):
             try:
+                original = Image.open(io.BytesIO(new_bytes)).convert("RGB")
+                streamed = []
                 files = {"file": (uploaded_file.name, new_bytes, uploaded_file.type)}
-                resp  = requests.post(f"{GATEWAY_URL}/detect", files=files, timeout=120)
-                if resp.status_code == 200:
-                    result = resp.json()
-                    st.session_state.detections     = result.get("detections", [])
-                    st.session_state.original_image = Image.open(io.BytesIO(new_bytes)).convert("RGB")
-                    if not st.session_state.detections:
-                        st.warning("No fashion items detected. Try a clearer photo.")
-                else:
-                    st.error(f"Detection failed: {resp.status_code}")
+                with requests.post(f"{GATEWAY_URL}/detect_stream", files=files, stream=True, timeout=120) as resp:
+                    if resp.status_code == 200:
+                        for line in resp.iter_lines():
+                            if not line:
+                                continue
+                            event = json.loads(line)
+                            if event["type"] == "detection":
+                                streamed.append(event["detection"])
+                                status_slot.markdown(f"**{len(streamed)} found so far…**")
+                                preview_slot.image(draw_detections(original, streamed), use_container_width=True)
+                            elif event["type"] == "error":
+                                st.error(f"Detection failed: {event.get('detail')}")
+                        st.session_state.detections     = streamed
+                        st.session_state.original_image = original
+                        if streamed:
+                            st.session_state.prefetch = prefetch_pool().submit(fetch_all_matches, new_bytes, streamed)
+                        else:
+                            st.warning("No fashion items detected. Try a clearer photo.")
+                    else:
+                        st.error(f"Detection failed: {resp.status_code}")
             except Exception as e:
                 st.error(f"Connection error: {e}")
+        status_slot.empty()
+        preview_slot.empty()
 
 # ─── STEP 2 RESULTS ───────────────────────────────────────────────────────────
 if st.session_state.detections and st.session_state.original_image:
     detections = st.session_state.detections
-    orig_img   = st.session_state.original_image
-
-    annotated = orig_img.copy()
-    draw = ImageDraw.Draw(annotated)
-    COLORS = ["#e8c547", "#47c5e8", "#e847a3", "#47e8a3", "#e87447", "#a347e8"]
-
-    for i, det in enumerate(detections):
-        x1, y1, x2, y2 = det["bbox"]
-        color = COLORS[i % len(COLORS)]
-        draw.rectangle([x1, y1, x2, y2], outline=color, width=3)
-        label_text = f"  {i+1}. {det['label'].upper()}  "
-        draw.rectangle([x1, y1 - 22, x1 + len(label_text) * 7, y1], fill=color)
-        draw.text((x1 + 4, y1 - 19), label_text.strip(), fill="#0d0d0d")
+    upload     = st.session_state.uploaded_bytes
+    annotated  = annotated_image(upload, detections)
+    patches    = detection_patches(upload, detections)
 
     col_img, col_select = st.columns([2, 1])
 
@@ -265,10 +381,7 @@ if st.session_state.detections and st.session_state.original_image:
             x1, y1, x2, y2 = det["bbox"]
             color = COLORS[i % len(COLORS)]
 
-            patch = orig_img.crop((x1, y1, x2, y2))
-            buf   = io.BytesIO()
-            patch.save(buf, format="PNG")
-            patch_b64 = base64.b64encode(buf.getvalue()).decode()
+            patch_b64 = patches[i]
 
             is_selected  = st.session_state.selected_idx == i
             border_style = f"3px solid {color}" if is_selected else "1px solid #1a1a1a"
@@ -317,29 +430,36 @@ if st.session_state.detections and st.session_state.original_image:
 
             if search_btn:
                 with st.spinner("⚙️ Processing..."):
-                    try:
-                        files = {"file": ("image.png", st.session_state.uploaded_bytes, "image/png")}
-                        data  = {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
-                        resp  = requests.post(f"{GATEWAY_URL}/search", files=files, data=data, timeout=60)
-                        if resp.status_code == 200:
-                            st.session_state.search_results = resp.json()
-                        else:
-                            st.error(f"Search failed: {resp.status_code} — {resp.text}")
-                    except Exception as e:
-                        st.error(f"Connection error: {e}")
+                    prefetched = prefetched_matches(st.session_state.selected_idx)
+                    if prefetched is not None:
+                        st.session_state.search_results = prefetched
+                    else:
+                        try:
+                            files = {"file": ("image.png", st.session_state.uploaded_bytes, "image/png")}
+                            data  = {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+                            resp  = requests.post(f"{GATEWAY_URL}/search", files=files, data=data, timeout=60)
+                            if resp.status_code == 200:
+                                st.session_state.search_results = resp.json()
+                            else:
+                                st.error(f"Search failed: {resp.status_code} — {resp.text}")
+                        except Exception as e:
+                            st.error(f"Connection error: {e}")
 
             if st.session_state.search_results:
                 result_data       = st.session_state.search_results
                 matches           = result_data.get("matches", [])
                 debug_image_b64   = result_data.get("debug_image")
                 detected_category = result_data.get("detected_category")
+                degradations      = result_data.get("degradations", [])
 
                 st.divider()
+                if degradations:
+                    st.caption(f"⚡ Busy right now — used a faster pipeline ({', '.join(degradations)}). Results may be slightly less precise.")
 
                 col_a, col_b, col_c = st.columns([1, 1, 3])
                 with col_a:
                     st.markdown("**Your Selection**")
-                    st.image(st.session_state.original_image.crop((x1, y1, x2, y2)), use_container_width=True)
+                    st.image(selection_crop(st.session_state.uploaded_bytes, selected["bbox"]), use_container_width=True)
                 with col_b:
                     st.markdown("**AI Vision**")
                     if debug_image_b64:
@@ -366,15 +486,19 @@ if st.session_state.detections and st.session_state.original_image:
                             </div>
                         """, unsafe_allow_html=True)
 
-                st.markdown(f"<h3 style='font-family:Syne,sans-serif; margin-top:28px; font-size:1.2rem;'>🎯 Top Matches <span style='color:#444; font-size:0.8rem; font-family:DM Mono,monospace;'>({len(matches)} found)</span></h3>", unsafe_allow_html=True)
+                st.markdown(f"<h3 style='font-family:Syne,sans-serif; margin-top:28px; font-size:1.2rem;'>🎯 Top Matches <span style='color:#444; font-size:0.8rem; font-family:DM Mono,monospace;'>({len(matches)} of {result_data.get('total_candidates', len(matches))})</span></h3>", unsafe_allow_html=True)
 
                 if matches:
                     cols = st.columns(5)
                     for idx, item in enumerate(matches):
                         with cols[idx % 5]:
-                            local_path = os.path.join("demo_images", item['image_filename'])
-                            if os.path.exists(local_path):
-                                st.image(local_path, use_container_width=True)
+                            # Small cached WebP from the gateway; the browser keeps it across reruns
+                            thumbnails = item.get("thumbnails") or {}
+                            local_path = os.path.join("demo_images", item.get('image_filename') or "")
+                            if thumbnails.get("webp"):
+                                st.image(f"{GATEWAY_URL}{thumbnails['webp']}", use_container_width=True)
+                            elif os.path.isfile(local_path):
+                                st.image(local_thumbnail(local_path), use_container_width=True)
                             medal = "🥇" if idx == 0 else ("🥈" if idx == 1 else ("🥉" if idx == 2 else ""))
                             st.markdown(f"**{medal} {item['name']}**")
                             score = item['score']
@@ -383,4 +507,21 @@ if st.session_state.detections and st.session_state.original_image:
                             st.markdown(f"<span class='store-tag'>{item['store']} · {item['level']}</span>", unsafe_allow_html=True)
                             st.markdown("---")
                 else:
-                    st.warning("No matches found. Try adding more items via bulk_upload.py")
\ No newline at end of file
+                    st.warning("No matches found. Try adding more items via bulk_upload.py")
+
+                # Later pages come from the candidate list the gateway kept
+                # for this search, so this doesn't re-run the image pipeline
+                next_cursor = result_data.get("next_cursor")
+                if next_cursor and st.button("Show more", key="show_more"):
+                    try:
+                        resp = requests.get(f"{GATEWAY_URL}/search/next", params={"cursor": next_cursor}, timeout=10)
+                        if resp.status_code == 200:
+                            page = resp.json()
+                            result_data["matches"]     = matches + page["matches"]
+                            result_data["next_cursor"] = page["next_cursor"]
+                            st.rerun()
+                        else:
+                            st.warning("These results have expired — run the search again to see more.")
+                            result_data["next_cursor"] = None
+                    except Exception as e:
+                        st.error(f"Connection error: {e}")
\ No newline at end of file
@@ -0,0 +1,255 @@
+import os
+import re
+import sys
+import json
+import time
+import requests
+import numpy as np
+from qdrant_client.http.models import PointStruct
+
+# Same vector store selection as the gateway (VECTOR_STORE / VECTOR_STORE_PATH)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "gateway"))
+from vector_store import connect
+from routing import CollectionRouter, alias_targets
+from projection import (Projection, create_companion, artifact_name,
+                        filter_payload, normalize, MANIFEST)
+
+# --- Config ---
+# Fits a PCA projection of the catalog's CLIP vectors, builds the compact
+# companion collections the gateway searches first (gateway/projection.py),
+# and reports recall / latency / memory against the full 512-d search.
+GATEWAY_URL = "http://localhost:8000"
+COLLECTION_NAME = "locus_items"
+# Must match the gateway's SHARDING ("mall" = one collection per mall)
+SHARDING = os.getenv("SHARDING", "single")
+# docker-compose mounts this folder into the gateway as PROJECTION_DIR
+PROJECTION_DIR = os.getenv("PROJECTION_DIR", "./projection")
+PROJECTION_DIM = int(os.getenv("PROJECTION_DIM", "128"))
+FIT_SAMPLE = int(os.getenv("FIT_SAMPLE", "50000"))        # vectors the PCA is fitted on
+REPORT_QUERIES = int(os.getenv("REPORT_QUERIES", "200"))  # catalog items used as queries
+REPORT_K = 10
+# Qdrant's default HNSW m: level-0 nodes keep 2*m links of 4 bytes
+DEFAULT_HNSW_M = 16
+OVERSAMPLES = (2, 4, 8)
+BATCH = 256
+
+qdrant = connect("localhost", 6333)
+
+
+def read_collection(name):
+    """(ids, vectors, filter payloads) of every item in a collection."""
+    ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=name, limit=BATCH, offset=offset,
+            with_payload=True, with_vectors=True
+        )
+        for p in points:
+            ids.append(p.id)
+            vectors.append(p.vector)
+            payloads.append(filter_payload(p.payload))
+        if offset is None:
+            return ids, np.asarray(vectors, dtype=np.float32).reshape(-1, 512), payloads
+
+
+def fit_pca(vectors, dim):
+    """Mean, top-dim principal axes and their share of the variance."""
+    rng = np.random.default_rng(0)
+    sample = normalize(vectors[rng.choice(len(vectors), min(len(vectors), FIT_SAMPLE), replace=False)])
+    mean = sample.mean(axis=0)
+    _, singular, axes = np.linalg.svd(sample - mean, full_matrices=False)
+    variance = singular ** 2
+    return mean, axes[:dim], float(variance[:dim].sum() / variance.sum())
+
+
+def write_companion(projection, live, ids, vectors, payloads):
+    name = projection.companion(live)
+    create_companion(qdrant, name, projection.dim)
+    for start in range(0, len(ids), BATCH):
+        compact = projection.project(vectors[start:start + BATCH])
+        qdrant.upsert(collection_name=name, points=[
+            PointStruct(id=point_id, vector=v.tolist(), payload=payload)
+            for point_id, v, payload in zip(ids[start:start + BATCH], compact, payloads[start:start + BATCH])
+        ])
+    print(f"   ✅ {name}: {len(ids)} compact vectors")
+
+
+def catch_up(projection, live, written):
+    """Items /add stored while the companion was being built."""
+    missing, offset = [], None
+    while True:
+        points, offset = qdrant.scroll(collection_name=live, limit=BATCH, offset=offset,
+                                       with_payload=False, with_vectors=False)
+        missing += [p.id for p in points if p.id not in written]
+        if offset is None:
+            break
+    for start in range(0, len(missing), BATCH):
+        points = qdrant.retrieve(collection_name=live, ids=missing[start:start + BATCH],
+                                 with_payload=True, with_vectors=True)
+        projection.upsert(qdrant, live, points)
+    if missing:
+        print(f"   ♻️ {live}: {len(missing)} items added during the fit caught up")
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 2)
+
+
+def hnsw_m(name):
+    try:
+        return qdrant.get_collection(collection_name=name).config.hnsw_config.m or DEFAULT_HNSW_M
+    except Exception:
+        return DEFAULT_HNSW_M
+
+
+def memory_mb(projection, live, ids, payloads):
+    """
+    Estimated resident memory of today's setup and of the two-stage one.
+    The full vectors and their graph stay (they're rescored and remain
+    the fallback), so the companion — compact vectors, its own HNSW graph
+    and the filter payload — is added on top, never a saving.
+    """
+    n = len(ids)
+    graph = lambda name: n * 2 * hnsw_m(name) * 4 * 1.1     # + ~10% upper layers
+    full = n * 512 * 4 + graph(live)
+    companion = (n * projection.dim * 4 + graph(projection.companion(live))
+                 + sum(len(json.dumps(p)) for p in payloads))
+    mb = lambda b: round(b / 2**20, 2)
+    return {"current": mb(full), "two_stage": mb(full + companion), "added": mb(companion)}
+
+
+def report(projection, live, ids, vectors, payloads):
+    """Recall@k against exact 512-d search, for today's search and the two-stage one."""
+    rng = np.random.default_rng(1)
+    queries = rng.choice(len(ids), min(len(ids), REPORT_QUERIES), replace=False)
+    full = normalize(vectors)
+    k = min(REPORT_K, len(ids) - 1)
+    if k < 1:
+        return None
+
+    def recall(found, truth):
+        return len(set(found) & set(truth)) / k
+
+    # Exact neighbours (the query item itself excluded everywhere)
+    exact = {}
+    for i in queries:
+        scores = full @ full[i]
+        scores[i] = -np.inf
+        exact[i] = [ids[j] for j in np.argsort(-scores)[:k]]
+
+    def measure(search):
+        latencies, recalls = [], []
+        for i in queries:
+            started = time.perf_counter()
+            hits = search(vectors[i].tolist())
+            latencies.append(time.perf_counter() - started)
+            found = [hit.id for hit in hits if hit.id != ids[i]][:k]
+            recalls.append(recall(found, exact[i]))
+        return {"recall": round(float(np.mean(recalls)), 3),
+                "p50_ms": percentile_ms(latencies, 50), "p95_ms": percentile_ms(latencies, 95)}
+
+    result = {"items": len(ids), "queries": len(queries), "k": k}
+    result["full"] = measure(lambda q: qdrant.search(
+        collection_name=live, query_vector=q, limit=k + 1, with_payload=False))
+    default_oversample = projection.oversample
+    for oversample in OVERSAMPLES:
+        projection.oversample = oversample
+        result[f"compact_x{oversample}"] = measure(lambda q: projection.search(
+            qdrant, live, query_vector=q, limit=k + 1, with_payload=False))
+    projection.oversample = default_oversample
+    result["memory_mb"] = memory_mb(projection, live, ids, payloads)
+    return result
+
+
+def drop_old_versions(version):
+    """Keeps this version's and the previous version's companions and artifacts."""
+    for c in qdrant.get_collections().collections:
+        match = re.search(r"-pca(\d+)$", c.name)
+        if match and int(match.group(1)) < version - 1:
+            qdrant.delete_collection(collection_name=c.name)
+            print(f"   🗑️ Dropped {c.name}")
+    for filename in os.listdir(PROJECTION_DIR):
+        match = re.fullmatch(r"projection-v(\d+)\.npz", filename)
+        if match and int(match.group(1)) < version - 1:
+            os.remove(os.path.join(PROJECTION_DIR, filename))
+
+
+def fit_projection():
+    router = CollectionRouter(qdrant, COLLECTION_NAME, lambda name: None, mode=SHARDING)
+    aliases = alias_targets(qdrant)
+    catalog = {}
+    for live in router.collections():
+        if qdrant.collection_exists(collection_name=live) or live in aliases:
+            catalog[live] = read_collection(live)
+    catalog = {live: data for live, data in catalog.items() if data[0]}
+    if not catalog:
+        print("❌ The catalog is empty — run bulk_upload.py first.")
+        return
+
+    all_vectors = np.concatenate([vectors for _, vectors, _ in catalog.values()])
+    print(f"📐 Fitting PCA 512 → {PROJECTION_DIM} on {min(len(all_vectors), FIT_SAMPLE)} of {len(all_vectors)} vectors...")
+    mean, components, explained = fit_pca(all_vectors, PROJECTION_DIM)
+    print(f"   Explained variance: {explained:.1%}")
+
+    os.makedirs(PROJECTION_DIR, exist_ok=True)
+    try:
+        with open(os.path.join(PROJECTION_DIR, MANIFEST)) as f:
+            version = json.load(f)["version"] + 1
+    except (OSError, ValueError, KeyError):
+        version = 1
+    np.savez(os.path.join(PROJECTION_DIR, artifact_name(version)),
+             mean=mean, components=components)
+
+    manifest = {
+        "version": version,
+        "file": artifact_name(version),
+        "dim": len(components),
+        "explained_variance": round(explained, 4),
+        "fitted_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        # Generation each companion was built from (gateway falls back to
+        # the full search once a reindex moves the alias)
+        "collections": {live: aliases.get(live, live) for live in catalog},
+    }
+    projection = Projection(mean, components, manifest)
+
+    print(f"🗜️ Building companions for projection v{version}...")
+    reports = {}
+    for live, (ids, vectors, payloads) in catalog.items():
+        write_companion(projection, live, ids, vectors, payloads)
+        reports[live] = report(projection, live, ids, vectors, payloads)
+    manifest["report"] = reports
+
+    # Manifest last, atomically: the gateway only ever sees a complete version
+    tmp_path = os.path.join(PROJECTION_DIR, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(PROJECTION_DIR, MANIFEST))
+    with open(os.path.join(PROJECTION_DIR, f"report-v{version}.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    try:
+        requests.post(f"{GATEWAY_URL}/projection/reload", timeout=30).raise_for_status()
+        print("🔄 Gateway reloaded the projection")
+    except Exception as e:
+        print(f"⚠️ Could not reach the gateway ({e}) — POST /projection/reload or restart it")
+    for live, (ids, _, _) in catalog.items():
+        catch_up(projection, live, set(ids))
+    drop_old_versions(version)
+
+    print(f"\n📊 Projection v{version} — recall@k vs exact 512-d search")
+    for live, r in reports.items():
+        if r is None:
+            continue
+        print(f"   {live} ({r['items']} items, {r['queries']} queries, k={r['k']})")
+        rows = [("full 512-d (current)", r["full"])]
+        rows += [(f"{PROJECTION_DIM}-d x{o} + rescore", r[f"compact_x{o}"]) for o in OVERSAMPLES]
+        for label, m in rows:
+            print(f"     {label:<24} recall {m['recall']:.3f}   p50 {m['p50_ms']} ms   p95 {m['p95_ms']} ms")
+        memory = r["memory_mb"]
+        print(f"     memory (est.): {memory['current']} MB today → {memory['two_stage']} MB two-stage "
+              f"(+{memory['added']} MB companion: vectors, graph, filter payload)")
+
+
+if __name__ == "__main__":
+    fit_projection()
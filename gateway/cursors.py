@@ -0,0 +1,86 @@
+# =============================================================================
+# cursors.py
+# Short-lived cursors over a search's candidate list
+#
+# /search asks Qdrant once for a deep candidate list (SEARCH_CANDIDATES),
+# returns the first page and parks the list here. "Show more" then calls
+# /search/next?cursor=... which slices the next page out of memory — no
+# rembg, no CLIP, no Qdrant.
+#
+# A cursor is "<list id>:<offset>". Lists expire after CURSOR_TTL_S and the
+# store keeps at most CURSOR_MAX_LISTS (oldest dropped first).
+#
+# Env:
+#     SEARCH_PAGE_SIZE    matches per page                 (default 25)
+#     SEARCH_CANDIDATES   candidates fetched per search    (default 200)
+#     CURSOR_TTL_S        seconds a candidate list lives   (default 600)
+#     CURSOR_MAX_LISTS    candidate lists kept at once     (default 1000)
+# =============================================================================
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+SEARCH_PAGE_SIZE  = int(os.getenv("SEARCH_PAGE_SIZE", "25"))
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "200"))
+CURSOR_TTL_S      = float(os.getenv("CURSOR_TTL_S", "600"))
+CURSOR_MAX_LISTS  = int(os.getenv("CURSOR_MAX_LISTS", "1000"))
+
+
+class CursorStore:
+    def __init__(self, ttl=CURSOR_TTL_S, max_lists=CURSOR_MAX_LISTS):
+        self.ttl = ttl
+        self.max_lists = max_lists
+        self._lists = OrderedDict()   # list id -> (expires_at, candidates)
+        self._lock = threading.Lock()
+
+    def first_page(self, candidates, page_size=SEARCH_PAGE_SIZE):
+        """
+        Returns (page, next_cursor). The list is only stored when there is
+        more than one page; next_cursor is None otherwise.
+        """
+        if len(candidates) <= page_size:
+            return candidates, None
+        list_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._lists[list_id] = (time.monotonic() + self.ttl, candidates)
+            while len(self._lists) > self.max_lists:
+                self._lists.popitem(last=False)
+        return candidates[:page_size], f"{list_id}:{page_size}"
+
+    def page(self, cursor, page_size=SEARCH_PAGE_SIZE):
+        """
+        Returns (page, next_cursor) for a cursor from first_page() / page(),
+        or None if the cursor is malformed or its list has expired.
+        """
+        try:
+            list_id, offset = cursor.rsplit(":", 1)
+            offset = int(offset)
+        except (AttributeError, ValueError):
+            return None
+        with self._lock:
+            self._expire()
+            entry = self._lists.get(list_id)
+        if entry is None or offset < 0:
+            return None
+        candidates = entry[1]
+        end = offset + page_size
+        next_cursor = f"{list_id}:{end}" if end < len(candidates) else None
+        return candidates[offset:end], next_cursor
+
+    def _expire(self):
+        now = time.monotonic()
+        # Insertion order == expiry order (fixed TTL)
+        while self._lists:
+            list_id, (expires_at, _) = next(iter(self._lists.items()))
+            if expires_at > now:
+                break
+            del self._lists[list_id]
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {"lists": len(self._lists), "ttl_s": self.ttl, "max_lists": self.max_lists}
@@ -0,0 +1,236 @@
+# =============================================================================
+# dedup.py
+# Near-duplicate collapse at ingest
+#
+# Retailers upload the same photo under several SKUs (get_demo_data.py even
+# maps two filenames to one URL). Stored separately, every copy takes a
+# top-k slot and index memory. Instead, a duplicate is folded into the
+# existing point as one more entry in its "listings" payload.
+#
+#   1. dHash (imaging.dhash) of the upload — before any model runs.
+#   2. The 64-bit hash is split into PHASH_BANDS 8-bit bands stored as
+#      keyword payload ("phash_bands", indexed). Two hashes within Hamming
+#      distance < PHASH_BANDS share at least one band, so a MatchAny on the
+#      bands finds every candidate without scanning the collection. Plain
+#      backgrounds make some band values very common, so every band match
+#      is paged through (hash only) before the closest are fetched.
+#   3. Candidates within PHASH_MAX_DISTANCE bits (same mall only) are
+#      compared pixel by pixel at 16x16 RGB with their source image
+#      (reindex.load_source): a match is a duplicate and the upload never
+#      reaches the visual engine. dHash alone is grayscale, so colour
+#      variants of one product would pass it — the colour check is what
+#      makes skipping the model safe.
+#   4. Otherwise (no source image kept, or pixels differ, e.g. a crop) the
+#      upload is vectorized as usual and candidates are confirmed with the
+#      CLIP vector: cosine >= DEDUP_MIN_SIMILARITY. Uploads repeated
+#      within one ingest batch are caught here too.
+#
+# Merges into stored points re-read the listings under a per-point lock,
+# so two ingest workers merging into one point never drop a listing.
+#
+# Env:
+#     DEDUP_ENABLED          0 stores every upload as its own point  (default 1)
+#     PHASH_MAX_DISTANCE     max differing hash bits                 (default 6)
+#     DEDUP_MIN_SIMILARITY   min cosine similarity to merge          (default 0.95)
+#     DEDUP_MIN_PIXEL_MATCH  min 16x16 RGB similarity, no model      (default 0.97)
+# =============================================================================
+
+import os
+import threading
+
+import numpy as np
+from qdrant_client.http import models
+
+from imaging import tiny_rgb
+
+DEDUP_ENABLED        = os.getenv("DEDUP_ENABLED", "1") == "1"
+PHASH_MAX_DISTANCE   = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+DEDUP_MIN_SIMILARITY = float(os.getenv("DEDUP_MIN_SIMILARITY", "0.95"))
+DEDUP_MIN_PIXEL_MATCH = float(os.getenv("DEDUP_MIN_PIXEL_MATCH", "0.97"))
+
+PHASH_BANDS = 8
+CANDIDATE_LIMIT = 32  # closest hashes compared per upload
+SCROLL_BATCH = 256    # band matches read per scroll page
+MERGE_LOCKS = 64      # striped per point id
+
+LISTING_FIELDS = ("name", "store_name", "floor_level", "mall_name", "filename")
+
+
+def hash_bands(value):
+    """64-bit hash → ["0:a3", "1:07", ...] (band index + 8-bit value)."""
+    return [f"{band}:{(value >> (8 * band)) & 0xFF:02x}" for band in range(PHASH_BANDS)]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def pixel_match(a, b):
+    """1 - mean absolute difference of two tiny_rgb() images, in [0, 1]."""
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return 1.0 - float(np.abs(a - b).mean()) / 255.0
+
+
+def listing(payload):
+    """One store's entry (SKU) for the listings payload."""
+    return {field: payload.get(field) for field in LISTING_FIELDS}
+
+
+class Deduplicator:
+    """
+    Looks for duplicates in the mall's collection of a routing.CollectionRouter.
+    source_fn(point_id, payload) returns (filename, bytes) of a stored
+    point's image, or None (reindex.load_source).
+    """
+
+    def __init__(self, router, source_fn=None):
+        self.router = router
+        self.client = router.client
+        self.source_fn = source_fn
+        self._lock = threading.Lock()
+        self._merge_locks = [threading.Lock() for _ in range(MERGE_LOCKS)]
+        self.checked = self.merged = self.model_skipped = 0
+
+    def hash_payload(self, value):
+        """Payload fields that make a new point findable as a duplicate."""
+        return {"phash": f"{value:016x}", "phash_bands": hash_bands(value)}
+
+    def candidates(self, value, mall):
+        """Stored points of the mall with a hash within PHASH_MAX_DISTANCE, closest first."""
+        with self._lock:
+            self.checked += 1
+        collection_name = self.router.collection_for(mall)
+        band_filter = models.Filter(must=[
+            models.FieldCondition(key="phash_bands", match=models.MatchAny(any=hash_bands(value))),
+            models.FieldCondition(key="mall_name", match=models.MatchValue(value=mall)),
+        ])
+        # Plain backgrounds make some bands very common, so page through every
+        # band match (hash only) rather than trusting the first page
+        distances = {}
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name, scroll_filter=band_filter, limit=SCROLL_BATCH,
+                offset=offset, with_vectors=False, with_payload=["phash"],
+            )
+            for point in points:
+                distance = hamming(int(point.payload["phash"], 16), value)
+                if distance <= PHASH_MAX_DISTANCE:
+                    distances[point.id] = distance
+            if offset is None:
+                break
+        if not distances:
+            return []
+
+        closest = sorted(distances, key=distances.get)[:CANDIDATE_LIMIT]
+        points = self.client.retrieve(
+            collection_name=collection_name, ids=closest,
+            with_vectors=True, with_payload=["phash", "listings", *LISTING_FIELDS],
+        )
+        return sorted(points, key=lambda p: distances[p.id])
+
+    def match_pixels(self, image_bytes, candidates):
+        """The candidate whose source image looks the same as the upload, or None. No model."""
+        if not candidates or self.source_fn is None:
+            return None
+        try:
+            upload = tiny_rgb(image_bytes)
+        except Exception:
+            return None
+        for point in candidates:
+            source = self.source_fn(point.id, point.payload)
+            if source is None:
+                continue
+            try:
+                if pixel_match(upload, tiny_rgb(source[1])) >= DEDUP_MIN_PIXEL_MATCH:
+                    with self._lock:
+                        self.model_skipped += 1
+                    return point
+            except Exception:
+                continue
+        return None
+
+    def find_duplicate(self, value, vector, mall, pending=(), candidates=None):
+        """
+        The point this upload duplicates (same mall, hash within
+        PHASH_MAX_DISTANCE, cosine >= DEDUP_MIN_SIMILARITY), or None.
+        pending: points of the same ingest batch not upserted yet.
+        candidates: from candidates(), if already looked up.
+        """
+        if candidates is None:
+            candidates = self.candidates(value, mall)
+        points = list(candidates)
+        points += [p for p in pending if p.payload.get("mall_name") == mall and "phash" in p.payload
+                   and hamming(int(p.payload["phash"], 16), value) <= PHASH_MAX_DISTANCE]
+        query = np.asarray(vector, dtype=np.float32)
+        best, best_similarity = None, DEDUP_MIN_SIMILARITY
+        for point in points:
+            similarity = float(np.dot(query, np.asarray(point.vector, dtype=np.float32)))
+            if similarity >= best_similarity:
+                best, best_similarity = point, similarity
+        return best
+
+    def merge(self, point, payload, pending=False):
+        """
+        Adds the upload as one more listing on an existing point (or, if
+        pending, on a point of the current batch before it is upserted).
+        Re-uploading the same file for the same store is a no-op.
+        """
+        new_listing = listing(payload)
+
+        def add_to(listings):
+            if any(l.get("filename") == new_listing["filename"] and l.get("store_name") == new_listing["store_name"]
+                   for l in listings):
+                return None
+            return listings + [new_listing]
+
+        if pending:
+            listings = add_to(point.payload.get("listings") or [listing(point.payload)])
+            if listings is None:
+                return False
+            point.payload["listings"] = listings
+        else:
+            collection_name = self.router.collection_for(payload.get("mall_name"))
+            with self._merge_locks[hash(str(point.id)) % MERGE_LOCKS]:
+                # Re-read: another worker may have merged into it since it was found
+                current = self.client.retrieve(
+                    collection_name=collection_name, ids=[point.id],
+                    with_payload=["listings", *LISTING_FIELDS],
+                )
+                if not current:
+                    raise RuntimeError(f"Duplicate {point.id} was deleted meanwhile")
+                listings = add_to(current[0].payload.get("listings") or [listing(current[0].payload)])
+                if listings is None:
+                    return False
+                self.client.set_payload(
+                    collection_name=collection_name, payload={"listings": listings}, points=[point.id],
+                )
+        with self._lock:
+            self.merged += 1
+        return True
+
+    def stats(self):
+        """Points vs listings across the collection — how much dedup shrank the index."""
+        points = listings = 0
+        for collection_name in self.router.collections():
+            offset = None
+            while True:
+                batch, offset = self.client.scroll(
+                    collection_name=collection_name, limit=1024, offset=offset,
+                    with_payload=["listings"], with_vectors=False,
+                )
+                for point in batch:
+                    points += 1
+                    listings += len(point.payload.get("listings") or [None])
+                if offset is None:
+                    break
+        with self._lock:
+            return {
+                "points": points,
+                "listings": listings,
+                "collapsed": listings - points,
+                "index_shrink_pct": round(100.0 * (listings - points) / listings, 1) if listings else 0.0,
+                "checked_since_start": self.checked,
+                "merged_since_start": self.merged,
+                "model_skipped_since_start": self.model_skipped,
+            }
@@ -0,0 +1,706 @@
+# =============================================================================
+# embedded_store.py
+# Embedded vector store (VECTOR_STORE=embedded, see vector_store.py)
+#
+# One directory per collection under the store root:
+#
+#   vectors.f32   float32 matrix, one row per point, np.memmap'd. Cosine
+#                 collections store unit vectors, so scores are dot products.
+#   live.u8       1 byte per row, 0 once the point is deleted (memmap'd)
+#   payload.db    SQLite:
+#                   points    row <-> point id
+#                   fields    payload stored column-wise, one (key, row,
+#                             JSON value) entry per top-level key, clustered
+#                             by key — a filter or a with_payload selector
+#                             only reads the columns it names
+#                   keywords  (field, value, row) for every KEYWORD payload
+#                             index, so keyword must-conditions resolve to
+#                             candidate rows without touching payloads
+#                   meta      dimension, distance, row count, indexes
+#
+# Opening a collection maps the files and reads meta — nothing is loaded
+# into RAM up front; the OS pages vectors in as searches touch them.
+#
+# Search is exact: candidate rows (all live rows, or those left by the
+# filter) are scored in blocks of BLOCK_ROWS with one matrix-vector product
+# per block, keeping a running top-k with argpartition. search_groups
+# groups that top-k by a payload value, widening it until enough groups
+# are found.
+#
+# Aliases live in aliases.json at the store root and are swapped atomically
+# (written to a temp file and renamed).
+# =============================================================================
+
+import os
+import json
+import uuid
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from qdrant_client.http import models
+
+from geo import haversine_km
+
+BLOCK_ROWS = 65536        # rows scored per matrix-vector product
+INITIAL_CAPACITY = 1024   # rows preallocated in a new collection (doubles as needed)
+SQL_CHUNK = 500           # ids per "IN (...)" query
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta     (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS points   (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS fields   (key TEXT NOT NULL, row INTEGER NOT NULL, value TEXT NOT NULL,
+                                     PRIMARY KEY (key, row)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fields_row ON fields (row);
+CREATE TABLE IF NOT EXISTS keywords (field TEXT NOT NULL, value TEXT NOT NULL, row INTEGER NOT NULL,
+                                     PRIMARY KEY (field, value, row)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS keywords_row ON keywords (row);
+"""
+
+
+# -----------------------------------------------------------------------------
+# Ids, payload paths and filters (Qdrant semantics)
+# -----------------------------------------------------------------------------
+def _id_key(point_id):
+    """Stored form of a point id: UUIDs normalized, ints kept as ints."""
+    if isinstance(point_id, str):
+        point_id = str(uuid.UUID(point_id))
+    return json.dumps(point_id)
+
+
+def _top_key(key):
+    return key.split(".")[0].replace("[]", "")
+
+
+def _values(payload, key):
+    """Every value at key ("a.b" descends, lists are flattened, "[]" optional)."""
+    values = [payload]
+    for part in key.replace("[]", "").split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                child = value[part]
+                found.extend(child if isinstance(child, list) else [child])
+        values = found
+    return values
+
+
+def _conditions(clause):
+    """A filter clause as a list (models allow a single condition too)."""
+    if clause is None:
+        return []
+    return clause if isinstance(clause, list) else [clause]
+
+
+def _all_conditions(query_filter):
+    return _conditions(query_filter.must) + _conditions(query_filter.should) + _conditions(query_filter.must_not)
+
+
+def _condition_keys(query_filter):
+    """Top-level payload keys a filter reads."""
+    keys = set()
+    for condition in _all_conditions(query_filter):
+        if isinstance(condition, models.Filter):
+            keys |= _condition_keys(condition)
+        elif isinstance(condition, models.FieldCondition):
+            keys.add(_top_key(condition.key))
+        elif isinstance(condition, models.IsNullCondition):
+            keys.add(_top_key(condition.is_null.key))
+        elif isinstance(condition, models.IsEmptyCondition):
+            keys.add(_top_key(condition.is_empty.key))
+    return keys
+
+
+def _field_matches(condition, payload):
+    values = _values(payload, condition.key)
+    match = condition.match
+    if isinstance(match, models.MatchValue):
+        return any(v == match.value for v in values)
+    if isinstance(match, models.MatchAny):
+        return any(v in match.any for v in values)
+    if isinstance(match, models.MatchExcept):
+        return any(v not in match.except_ for v in values)
+    if isinstance(match, models.MatchText):
+        return any(isinstance(v, str) and match.text in v for v in values)
+    if condition.range is not None:
+        r = condition.range
+        return any(
+            isinstance(v, (int, float))
+            and (r.gt is None or v > r.gt) and (r.gte is None or v >= r.gte)
+            and (r.lt is None or v < r.lt) and (r.lte is None or v <= r.lte)
+            for v in values
+        )
+    if condition.geo_radius is not None:
+        center = condition.geo_radius.center
+        points = [v for v in values if isinstance(v, dict) and "lat" in v and "lon" in v]
+        if not points:
+            return False
+        distance = haversine_km(center.lat, center.lon,
+                                np.array([p["lat"] for p in points]), np.array([p["lon"] for p in points]))
+        return bool((distance * 1000.0 <= condition.geo_radius.radius).any())
+    raise ValueError(f"Unsupported field condition on {condition.key}")
+
+
+def _condition_matches(condition, payload, point_id):
+    if isinstance(condition, models.Filter):
+        return _filter_matches(condition, payload, point_id)
+    if isinstance(condition, models.FieldCondition):
+        return _field_matches(condition, payload)
+    if isinstance(condition, models.IsNullCondition):
+        return any(v is None for v in _values(payload, condition.is_null.key))
+    if isinstance(condition, models.IsEmptyCondition):
+        return not [v for v in _values(payload, condition.is_empty.key) if v is not None]
+    if isinstance(condition, models.HasIdCondition):
+        return _id_key(point_id) in {_id_key(i) for i in condition.has_id}
+    raise ValueError(f"Unsupported condition: {type(condition).__name__}")
+
+
+def _filter_matches(query_filter, payload, point_id):
+    must, should, must_not = (_conditions(query_filter.must), _conditions(query_filter.should),
+                              _conditions(query_filter.must_not))
+    if must and not all(_condition_matches(c, payload, point_id) for c in must):
+        return False
+    if must_not and any(_condition_matches(c, payload, point_id) for c in must_not):
+        return False
+    if should and not any(_condition_matches(c, payload, point_id) for c in should):
+        return False
+    return True
+
+
+def _select_keys(with_payload, keys):
+    """Which of a point's keys a with_payload selector returns."""
+    if with_payload is True:
+        return keys
+    if not with_payload:
+        return []
+    if isinstance(with_payload, models.PayloadSelectorExclude):
+        excluded = set(with_payload.exclude)
+        return [k for k in keys if k not in excluded]
+    if isinstance(with_payload, models.PayloadSelectorInclude):
+        with_payload = with_payload.include
+    return [k for k in keys if k in {_top_key(w) for w in with_payload}]
+
+
+# -----------------------------------------------------------------------------
+# One collection
+# -----------------------------------------------------------------------------
+class _Collection:
+    def __init__(self, directory, size=None, distance=None):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(os.path.join(directory, "payload.db"),
+                                  check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        if size is not None:
+            self._set_meta(size=size, distance=distance, rows=0, capacity=INITIAL_CAPACITY, indexes={})
+            for name, width in (("vectors.f32", size * 4), ("live.u8", 1)):
+                with open(os.path.join(directory, name), "wb") as f:
+                    f.truncate(INITIAL_CAPACITY * width)
+        meta = dict(self.db.execute("SELECT key, value FROM meta").fetchall())
+        self.size = json.loads(meta["size"])
+        self.distance = json.loads(meta["distance"])
+        self.rows = json.loads(meta["rows"])
+        self.capacity = json.loads(meta["capacity"])
+        self.indexes = json.loads(meta["indexes"])
+        self._map()
+
+    def _set_meta(self, **values):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in values.items()],
+        )
+
+    def _map(self):
+        self.vectors = np.memmap(os.path.join(self.directory, "vectors.f32"), dtype=np.float32,
+                                 mode="r+", shape=(self.capacity, self.size))
+        self.live = np.memmap(os.path.join(self.directory, "live.u8"), dtype=np.uint8,
+                              mode="r+", shape=(self.capacity,))
+
+    def _grow(self, rows_needed):
+        if rows_needed <= self.capacity:
+            return
+        capacity = max(rows_needed, self.capacity * 2)
+        self.vectors.flush()
+        self.live.flush()
+        for name, width in (("vectors.f32", self.size * 4), ("live.u8", 1)):
+            with open(os.path.join(self.directory, name), "r+b") as f:
+                f.truncate(capacity * width)
+        self.capacity = capacity
+        self._set_meta(capacity=capacity)
+        self._map()
+
+    @contextmanager
+    def _transaction(self):
+        self.db.execute("BEGIN")
+        try:
+            yield
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def close(self):
+        self.vectors.flush()
+        self.live.flush()
+        self.db.close()
+
+    # -------------------------------------------------------------------------
+    # Rows, ids and payload columns
+    # -------------------------------------------------------------------------
+    def _rows_for(self, ids):
+        """{id key: row} for the ids that exist."""
+        keys = [_id_key(i) for i in ids]
+        found = {}
+        for start in range(0, len(keys), SQL_CHUNK):
+            chunk = keys[start:start + SQL_CHUNK]
+            found.update(self.db.execute(
+                f"SELECT id, row FROM points WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return found
+
+    def _ids_for(self, rows):
+        found = {}
+        rows = [int(r) for r in rows]
+        for start in range(0, len(rows), SQL_CHUNK):
+            chunk = rows[start:start + SQL_CHUNK]
+            found.update(self.db.execute(
+                f"SELECT row, id FROM points WHERE row IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return {row: json.loads(key) for row, key in found.items()}
+
+    def _payloads(self, rows, keys=None):
+        """{row: payload} reading only the given top-level keys (all if None)."""
+        rows = [int(r) for r in rows]
+        payloads = {row: {} for row in rows}
+        for start in range(0, len(rows), SQL_CHUNK):
+            chunk = rows[start:start + SQL_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            if keys is None:
+                cursor = self.db.execute(f"SELECT row, key, value FROM fields WHERE row IN ({marks})", chunk)
+            else:
+                key_marks = ",".join("?" * len(keys))
+                cursor = self.db.execute(
+                    f"SELECT row, key, value FROM fields WHERE key IN ({key_marks}) AND row IN ({marks})",
+                    list(keys) + chunk,
+                )
+            for row, key, value in cursor:
+                payloads[row][key] = json.loads(value)
+        return payloads
+
+    def _write_fields(self, row, payload):
+        """Writes top-level keys of a row (replacing those keys) and their keyword index entries."""
+        self.db.executemany(
+            "INSERT OR REPLACE INTO fields (key, row, value) VALUES (?, ?, ?)",
+            [(key, row, json.dumps(value)) for key, value in payload.items()],
+        )
+        for field, schema in self.indexes.items():
+            if schema != "keyword" or _top_key(field) not in payload:
+                continue
+            self.db.execute("DELETE FROM keywords WHERE field = ? AND row = ?", (field, row))
+            self.db.executemany(
+                "INSERT OR IGNORE INTO keywords (field, value, row) VALUES (?, ?, ?)",
+                [(field, v, row) for v in _values(payload, field) if isinstance(v, str)],
+            )
+
+    def _clear_row(self, row):
+        self.db.execute("DELETE FROM fields WHERE row = ?", (row,))
+        self.db.execute("DELETE FROM keywords WHERE row = ?", (row,))
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+    def _prepare(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.size,):
+            raise ValueError(f"Expected a {self.size}-d vector, got {vector.shape}")
+        if self.distance == "Cosine":
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector = vector / norm
+        return vector
+
+    def upsert(self, points):
+        with self.lock:
+            existing = self._rows_for([p.id for p in points])
+            new = [p for p in points if _id_key(p.id) not in existing]
+            vectors = [self._prepare(p.vector) for p in points]
+            self._grow(self.rows + len(new))
+            rows = self.rows
+            with self._transaction():
+                for point, vector in zip(points, vectors):
+                    key = _id_key(point.id)
+                    row = existing.get(key)
+                    if row is None:
+                        row = existing[key] = rows
+                        rows += 1
+                        self.db.execute("INSERT INTO points (row, id) VALUES (?, ?)", (row, key))
+                    else:
+                        self._clear_row(row)
+                    self.vectors[row] = vector
+                    self.live[row] = 1
+                    self._write_fields(row, point.payload or {})
+                self._set_meta(rows=rows)
+                self.vectors.flush()
+                self.live.flush()
+            self.rows = rows
+
+    def set_payload(self, payload, ids):
+        with self.lock:
+            rows = self._rows_for(ids).values()
+            with self._transaction():
+                for row in rows:
+                    self._write_fields(row, payload)
+
+    def delete(self, ids):
+        with self.lock:
+            rows = list(self._rows_for(ids).values())
+            with self._transaction():
+                for row in rows:
+                    self._clear_row(row)
+                    self.db.execute("DELETE FROM points WHERE row = ?", (row,))
+            self.live[rows] = 0
+            self.live.flush()
+
+    def create_index(self, field_name, schema):
+        with self.lock:
+            if self.indexes.get(field_name) == schema:
+                return
+            self.indexes[field_name] = schema
+            with self._transaction():
+                if schema == "keyword":
+                    self.db.execute("DELETE FROM keywords WHERE field = ?", (field_name,))
+                    cursor = self.db.execute("SELECT row, value FROM fields WHERE key = ?", (_top_key(field_name),))
+                    for row, value in cursor.fetchall():
+                        payload = {_top_key(field_name): json.loads(value)}
+                        self.db.executemany(
+                            "INSERT OR IGNORE INTO keywords (field, value, row) VALUES (?, ?, ?)",
+                            [(field_name, v, row) for v in _values(payload, field_name) if isinstance(v, str)],
+                        )
+                self._set_meta(indexes=self.indexes)
+
+    # -------------------------------------------------------------------------
+    # Reads
+    # -------------------------------------------------------------------------
+    def _live_rows(self):
+        return np.flatnonzero(self.live[:self.rows])
+
+    def _index_rows(self, query_filter):
+        """
+        Rows allowed by the filter's indexed keyword must-conditions, or None
+        if it has none. Also returns whether those conditions were the whole
+        filter (then no payload has to be read).
+        """
+        rows, covered = None, not (query_filter.should or query_filter.must_not)
+        for condition in _conditions(query_filter.must):
+            values = None
+            if (isinstance(condition, models.FieldCondition)
+                    and self.indexes.get(condition.key) == "keyword"):
+                if isinstance(condition.match, models.MatchValue) and isinstance(condition.match.value, str):
+                    values = [condition.match.value]
+                elif isinstance(condition.match, models.MatchAny) and all(isinstance(v, str) for v in condition.match.any):
+                    values = list(condition.match.any)
+            if values is None:
+                covered = False
+                continue
+            matched = set()
+            for start in range(0, len(values), SQL_CHUNK):
+                chunk = values[start:start + SQL_CHUNK]
+                matched.update(row for (row,) in self.db.execute(
+                    f"SELECT row FROM keywords WHERE field = ? AND value IN ({','.join('?' * len(chunk))})",
+                    [condition.key] + chunk,
+                ))
+            rows = matched if rows is None else rows & matched
+        return rows, covered
+
+    def filter_rows(self, query_filter):
+        """Sorted array of live rows matching the filter (all live rows if None)."""
+        if query_filter is None:
+            return self._live_rows()
+        indexed, covered = self._index_rows(query_filter)
+        if indexed is None:
+            rows = self._live_rows()
+        else:
+            rows = np.array(sorted(indexed), dtype=np.int64)
+            rows = rows[self.live[rows] == 1] if len(rows) else rows
+        if covered and indexed is not None:
+            return rows
+
+        keys = _condition_keys(query_filter)
+        ids = self._ids_for(rows) if _needs_ids(query_filter) else {}
+        keep = []
+        for start in range(0, len(rows), SQL_CHUNK):
+            chunk = rows[start:start + SQL_CHUNK]
+            payloads = self._payloads(chunk, keys)
+            keep.extend(row for row in chunk if _filter_matches(query_filter, payloads[int(row)], ids.get(int(row))))
+        return np.array(keep, dtype=np.int64)
+
+    def records(self, rows, with_payload=True, with_vectors=False, scores=None):
+        """Records (or ScoredPoints, if scores are given) for rows, in order."""
+        rows = [int(r) for r in rows]
+        ids = self._ids_for(rows)
+        payloads = {}
+        if with_payload:
+            keys = None
+            if with_payload is not True and not isinstance(with_payload, models.PayloadSelectorExclude):
+                keys = [_top_key(k) for k in (with_payload.include
+                                              if isinstance(with_payload, models.PayloadSelectorInclude)
+                                              else with_payload)]
+            payloads = self._payloads(rows, keys)
+        results = []
+        for i, row in enumerate(rows):
+            payload = None
+            if with_payload:
+                full = payloads[row]
+                payload = {k: full[k] for k in _select_keys(with_payload, list(full))}
+            vector = self.vectors[row].tolist() if with_vectors else None
+            if scores is None:
+                results.append(models.Record(id=ids[row], payload=payload, vector=vector))
+            else:
+                results.append(models.ScoredPoint(id=ids[row], version=0, score=float(scores[i]),
+                                                  payload=payload, vector=vector))
+        return results
+
+    def top_groups(self, query_vector, rows, group_by, limit, group_size, score_threshold=None):
+        """
+        Best `limit` groups of rows by the group_by payload value, each with
+        its best `group_size` rows: [(value, rows, scores)], best group first.
+        Rows without a keyword / integer value at group_by take no part.
+        Widens the scored top-k until enough groups are full.
+        """
+        k = limit * group_size * 4
+        while True:
+            ranked, scores = self.top_k(query_vector, rows, k, score_threshold)
+            values = self._payloads(ranked, [_top_key(group_by)])
+            groups = {}
+            for row, score in zip(ranked, scores):
+                for value in _values(values[int(row)], group_by):
+                    if isinstance(value, bool) or not isinstance(value, (str, int)):
+                        continue
+                    hits = groups.setdefault(value, ([], []))
+                    if len(hits[0]) < group_size:
+                        hits[0].append(int(row))
+                        hits[1].append(float(score))
+            top = list(groups.items())[:limit]
+            complete = len(top) == limit and all(len(hits[0]) == group_size for _, hits in top)
+            if complete or len(ranked) < k:
+                return [(value, hits[0], hits[1]) for value, hits in top]
+            k *= 4
+
+    def top_k(self, query_vector, rows, k, score_threshold=None):
+        """Best k of the given rows by score: (rows, scores), best first."""
+        query = self._prepare(query_vector)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        if k <= 0:
+            return best_rows, best_scores
+        vectors = self.vectors
+        for start in range(0, len(rows), BLOCK_ROWS):
+            block = rows[start:start + BLOCK_ROWS]
+            if len(block) and block[-1] - block[0] == len(block) - 1:
+                scores = vectors[block[0]:block[-1] + 1] @ query     # contiguous: no gather
+            else:
+                scores = vectors[block] @ query
+            best_rows = np.concatenate([best_rows, block])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                top = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[top], best_scores[top]
+        order = np.argsort(-best_scores, kind="stable")
+        best_rows, best_scores = best_rows[order], best_scores[order]
+        if score_threshold is not None:
+            keep = best_scores >= score_threshold
+            best_rows, best_scores = best_rows[keep], best_scores[keep]
+        return best_rows, best_scores
+
+
+def _needs_ids(query_filter):
+    for condition in _all_conditions(query_filter):
+        if isinstance(condition, models.HasIdCondition):
+            return True
+        if isinstance(condition, models.Filter) and _needs_ids(condition):
+            return True
+    return False
+
+
+# -----------------------------------------------------------------------------
+# The store
+# -----------------------------------------------------------------------------
+class EmbeddedStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------------------------------
+    # Collections and aliases
+    # -------------------------------------------------------------------------
+    def _aliases(self):
+        try:
+            with open(os.path.join(self.path, "aliases.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_aliases(self, aliases):
+        path = os.path.join(self.path, "aliases.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(aliases, f)
+        os.replace(path + ".tmp", path)
+
+    def _names(self):
+        return sorted(
+            name for name in os.listdir(self.path)
+            if os.path.isfile(os.path.join(self.path, name, "payload.db"))
+        )
+
+    def _collection(self, collection_name):
+        name = self._aliases().get(collection_name, collection_name)
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                directory = os.path.join(self.path, name)
+                if not os.path.isfile(os.path.join(directory, "payload.db")):
+                    raise ValueError(f"Collection {collection_name} not found")
+                collection = self._collections[name] = _Collection(directory)
+            return collection
+
+    def get_collections(self):
+        return models.CollectionsResponse(
+            collections=[models.CollectionDescription(name=name) for name in self._names()]
+        )
+
+    def collection_exists(self, collection_name):
+        return collection_name in self._names() or collection_name in self._aliases()
+
+    def create_collection(self, collection_name, vectors_config):
+        if collection_name in self._names():
+            raise ValueError(f"Collection {collection_name} already exists")
+        distance = getattr(vectors_config.distance, "value", vectors_config.distance)
+        if distance not in ("Cosine", "Dot"):
+            raise ValueError(f"Unsupported distance: {distance}")
+        directory = os.path.join(self.path, collection_name)
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._collections[collection_name] = _Collection(directory, vectors_config.size, distance)
+        return True
+
+    def delete_collection(self, collection_name):
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+        if collection is not None:
+            collection.close()
+        shutil.rmtree(os.path.join(self.path, collection_name), ignore_errors=True)
+        aliases = self._aliases()
+        self._save_aliases({a: c for a, c in aliases.items() if c != collection_name})
+        return True
+
+    def create_payload_index(self, collection_name, field_name, field_schema=None):
+        schema = getattr(field_schema, "value", field_schema) or "keyword"
+        self._collection(collection_name).create_index(field_name, schema)
+
+    def get_aliases(self):
+        return models.CollectionsAliasesResponse(aliases=[
+            models.AliasDescription(alias_name=alias, collection_name=name)
+            for alias, name in sorted(self._aliases().items())
+        ])
+
+    def update_collection_aliases(self, change_aliases_operations):
+        with self._lock:
+            aliases = self._aliases()
+            for operation in change_aliases_operations:
+                if isinstance(operation, models.CreateAliasOperation):
+                    aliases[operation.create_alias.alias_name] = operation.create_alias.collection_name
+                elif isinstance(operation, models.DeleteAliasOperation):
+                    aliases.pop(operation.delete_alias.alias_name, None)
+                elif isinstance(operation, models.RenameAliasOperation):
+                    rename = operation.rename_alias
+                    aliases[rename.new_alias_name] = aliases.pop(rename.old_alias_name)
+            self._save_aliases(aliases)
+        return True
+
+    # -------------------------------------------------------------------------
+    # Points
+    # -------------------------------------------------------------------------
+    def upsert(self, collection_name, points, **kwargs):
+        self._collection(collection_name).upsert(points)
+
+    def set_payload(self, collection_name, payload, points, **kwargs):
+        self._collection(collection_name).set_payload(payload, points)
+
+    def delete(self, collection_name, points_selector, **kwargs):
+        ids = points_selector.points if isinstance(points_selector, models.PointIdsList) else points_selector
+        self._collection(collection_name).delete(ids)
+
+    def batch_update_points(self, collection_name, update_operations, **kwargs):
+        collection = self._collection(collection_name)
+        for operation in update_operations:
+            if isinstance(operation, models.SetPayloadOperation):
+                collection.set_payload(operation.set_payload.payload, operation.set_payload.points)
+            elif isinstance(operation, models.DeleteOperation):
+                collection.delete(operation.delete.points)
+            elif isinstance(operation, models.UpsertOperation):
+                collection.upsert(operation.upsert.points)
+            else:
+                raise ValueError(f"Unsupported operation: {type(operation).__name__}")
+
+    def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **kwargs):
+        collection = self._collection(collection_name)
+        with collection.lock:
+            found = collection._rows_for(ids)
+            rows = [found[_id_key(i)] for i in ids if _id_key(i) in found]
+            return collection.records(rows, with_payload, with_vectors)
+
+    def scroll(self, collection_name, scroll_filter=None, limit=10, offset=None,
+               with_payload=True, with_vectors=False, **kwargs):
+        """Points in insertion order; offset is the id the page starts at."""
+        collection = self._collection(collection_name)
+        with collection.lock:
+            rows = collection.filter_rows(scroll_filter)
+            if offset is not None:
+                start = collection._rows_for([offset]).get(_id_key(offset), collection.rows)
+                rows = rows[np.searchsorted(rows, start):]
+            page = rows[:limit]
+            next_offset = collection._ids_for(rows[limit:limit + 1]).get(int(rows[limit])) if len(rows) > limit else None
+            return collection.records(page, with_payload, with_vectors), next_offset
+
+    def count(self, collection_name, count_filter=None, exact=True, **kwargs):
+        collection = self._collection(collection_name)
+        with collection.lock:
+            return models.CountResult(count=len(collection.filter_rows(count_filter)))
+
+    # -------------------------------------------------------------------------
+    # Search
+    # -------------------------------------------------------------------------
+    def search(self, collection_name, query_vector, query_filter=None, limit=10, offset=0,
+               with_payload=True, with_vectors=False, score_threshold=None, **kwargs):
+        collection = self._collection(collection_name)
+        with collection.lock:
+            rows = collection.filter_rows(query_filter)
+            rows, scores = collection.top_k(query_vector, rows, limit + (offset or 0), score_threshold)
+            rows, scores = rows[offset or 0:], scores[offset or 0:]
+            return collection.records(rows, with_payload, with_vectors, scores=scores)
+
+    def search_groups(self, collection_name, query_vector, group_by, query_filter=None, limit=10,
+                      group_size=1, with_payload=True, with_vectors=False, score_threshold=None, **kwargs):
+        collection = self._collection(collection_name)
+        with collection.lock:
+            rows = collection.filter_rows(query_filter)
+            groups = collection.top_groups(query_vector, rows, group_by, limit, group_size, score_threshold)
+            return models.GroupsResult(groups=[
+                models.PointGroup(id=value, hits=collection.records(group_rows, with_payload, with_vectors,
+                                                                    scores=group_scores))
+                for value, group_rows, group_scores in groups
+            ])
+
+    def search_batch(self, collection_name, requests, **kwargs):
+        return [
+            self.search(
+                collection_name, request.vector, request.filter, request.limit, request.offset,
+                request.with_payload, request.with_vector, request.score_threshold
+            )
+            for request in requests
+        ]
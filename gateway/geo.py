@@ -0,0 +1,80 @@
+# =============================================================================
+# geo.py
+# Nearness-aware ranking ("ranked by similarity and nearness")
+#
+# Catalog items carry a "location" geo payload ({"lat", "lon"} of their
+# store, from mall_config.json) with a Qdrant geo index. When /search gets
+# the shopper's position:
+#
+#   1. a GeoRadius condition goes into the query filter, so Qdrant only
+#      walks items within radius_km during the filtered HNSW search.
+#      Without a radius, the search is still pre-filtered to
+#      nearby_radius_km(decay_km) (PREFILTER_DECAYS x decay_km, where
+#      nearness has fallen to ~5%), so a close item that is only, say,
+#      500th by similarity catalog-wide can still surface. Only when that
+#      area has fewer than the wanted candidates is the list topped up
+#      with the best matches from further away;
+#   2. the returned candidates are re-scored in one vectorized pass:
+#
+#        fused = (1 - geo_weight) * similarity + geo_weight * exp(-distance / decay_km)
+#
+# qdrant-client is pinned to 1.10, which has no server-side score formula,
+# so step 2 runs here, over the same candidate list /search fetches anyway
+# for pagination.
+# =============================================================================
+
+import numpy as np
+from qdrant_client.http import models
+
+EARTH_RADIUS_KM = 6371.0088
+
+DEFAULT_DECAY_KM   = 5.0    # distance at which nearness has fallen to 1/e
+DEFAULT_GEO_WEIGHT = 0.3    # share of the fused score that comes from nearness
+PREFILTER_DECAYS   = 3.0    # pre-filter radius without radius_km, in decay_km
+
+
+def geo_condition(lat, lon, radius_km):
+    """Qdrant condition: item location within radius_km of (lat, lon)."""
+    return models.FieldCondition(
+        key="location",
+        geo_radius=models.GeoRadius(
+            center=models.GeoPoint(lat=lat, lon=lon), radius=radius_km * 1000.0
+        ),
+    )
+
+
+def nearby_radius_km(decay_km=DEFAULT_DECAY_KM):
+    """Radius searched first when no radius_km is given."""
+    return PREFILTER_DECAYS * max(decay_km, 1e-6)
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distances from (lat, lon) to arrays of points, in km."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def geo_rerank(hits, lat, lon, decay_km=DEFAULT_DECAY_KM, geo_weight=DEFAULT_GEO_WEIGHT):
+    """
+    Re-orders Qdrant hits by the fused similarity + nearness score.
+    Items without a location get no nearness credit.
+    Returns [(hit, fused_score, distance_km or None)], best first.
+    """
+    if not hits:
+        return []
+    similarity = np.array([hit.score for hit in hits], dtype=np.float64)
+    locations = [hit.payload.get("location") or {} for hit in hits]
+    lats = np.array([loc.get("lat", np.nan) for loc in locations], dtype=np.float64)
+    lons = np.array([loc.get("lon", np.nan) for loc in locations], dtype=np.float64)
+
+    distance = haversine_km(lat, lon, lats, lons)
+    nearness = np.nan_to_num(np.exp(-distance / max(decay_km, 1e-6)), nan=0.0)
+    fused = (1.0 - geo_weight) * similarity + geo_weight * nearness
+
+    order = np.argsort(-fused, kind="stable")
+    return [
+        (hits[i], float(fused[i]), None if np.isnan(distance[i]) else float(distance[i]))
+        for i in order
+    ]
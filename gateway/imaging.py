@@ -0,0 +1,102 @@
+# =============================================================================
+# imaging.py
+# Upload shrinking for the gateway
+#
+# Same idea as visual_engine/imaging.py (which the gateway container can't
+# import): decode JPEGs with Image.draft() at 1/2, 1/4 or 1/8 scale so a
+# 12 MP phone photo never has to be decoded in full, and only forward as
+# many pixels as the visual engine will actually use.
+# =============================================================================
+
+import io
+from PIL import Image
+
+# Longest side the visual engine works at, per endpoint
+DETECT_MAX_SIDE    = 1333   # YOLOS image processor's longest edge
+VECTORIZE_MAX_SIDE = 512    # rembg + CLIP path
+
+
+def _encode(image):
+    buf = io.BytesIO()
+    if image.mode == "RGB":
+        image.save(buf, format="JPEG", quality=92)
+        return buf.getvalue(), "image/jpeg"
+    image.save(buf, format="PNG")
+    return buf.getvalue(), "image/png"
+
+
+def shrink_upload(image_bytes, max_side):
+    """
+    Re-encodes an upload so its longest side is at most max_side.
+
+    Returns (image_bytes, content_type, scale) where scale = original / new
+    (1.0 when the upload was already small enough and is passed through
+    untouched). Multiply coordinates from the visual engine by scale to map
+    them back to the original photo.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    W, H = image.size
+    if max(W, H) <= max_side:
+        return image_bytes, Image.MIME.get(image.format, "application/octet-stream"), 1.0
+
+    ratio = max(W, H) / max_side
+    image.draft("RGB", (int(W / ratio), int(H / ratio)))
+    image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    image.thumbnail((max_side, max_side))
+    data, content_type = _encode(image)
+    return data, content_type, W / image.width
+
+
+def decode_crop(image_bytes, bbox, max_side=VECTORIZE_MAX_SIDE):
+    """
+    Crops bbox (original-image coordinates) out of an upload, decoding only
+    at the resolution needed for the crop to still be max_side on its long
+    side. Returns (png_bytes, "image/png").
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    W, H = image.size
+    x1, y1, x2, y2 = bbox
+
+    crop_side = max(x2 - x1, y2 - y1, 1)
+    ratio = crop_side / max_side
+    if ratio > 1:
+        image.draft("RGB", (int(W / ratio), int(H / ratio)))
+    image = image.convert("RGB")
+
+    sx, sy = image.width / W, image.height / H
+    crop = image.crop((int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)))
+    crop.thumbnail((max_side, max_side))
+
+    buf = io.BytesIO()
+    crop.save(buf, format="PNG")
+    return buf.getvalue(), "image/png"
+
+
+def dhash(image_bytes, hash_size=8):
+    """
+    64-bit difference hash of an upload (for hash_size=8): grayscale,
+    shrink to (hash_size + 1) x hash_size and compare neighbouring pixels.
+    Robust to re-encoding and resizing; a few bits differ for small edits.
+    Decoding uses draft mode, so it costs a few milliseconds even for
+    large photos.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def tiny_rgb(image_bytes, side=16):
+    """
+    side x side RGB pixels of an image, for comparing two photos without a
+    model (colour included, which dhash ignores). Draft-mode decode too.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("RGB", (side * 8, side * 8))
+    return list(image.convert("RGB").resize((side, side), Image.LANCZOS).getdata())
@@ -0,0 +1,273 @@
+# =============================================================================
+# ingest_queue.py
+# Durable ingest queue behind /add (SQLite + file spool)
+#
+# /add used to hold the request open through rembg + CLIP and the Qdrant
+# upsert, and anything in flight was lost when the visual engine restarted.
+# Now /add only spools the image to disk, records the job in SQLite and
+# answers 202 with a job id:
+#
+#   /add ──► spool file + row (queued) ──► 202 {job_id}
+#                    │
+#                    ▼
+#   drain() tasks: claim up to INGEST_BATCH queued jobs ──► process_batch()
+#                    │                                       │
+#                    ├── ok ──────────► done (spool file deleted)
+#                    ├── PermanentError ► failed (the image itself is bad)
+#                    └── other error ──► queued again after a backoff,
+#                                        failed after INGEST_MAX_ATTEMPTS
+#
+# Rows and spool files survive restarts; jobs a crashed process was working
+# on go back to queued at startup (recover()). Claims run in an IMMEDIATE
+# transaction, so two drain tasks never take the same job.
+#
+# Env:
+#     INGEST_DB_PATH       SQLite file                         (default ./ingest/queue.db)
+#     INGEST_SPOOL_DIR     where queued images wait            (default ./ingest/spool)
+#     INGEST_WORKERS       drain tasks per gateway process     (default 2)
+#     INGEST_BATCH         jobs claimed per batch              (default 8)
+#     INGEST_MAX_ATTEMPTS  tries before a job is failed        (default 5)
+#     INGEST_RETRY_S       first retry delay, doubles per try  (default 2)
+#     INGEST_KEEP_DAYS     finished jobs kept for /ingest/jobs (default 7)
+# =============================================================================
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+
+INGEST_DB_PATH      = os.getenv("INGEST_DB_PATH", "./ingest/queue.db")
+INGEST_SPOOL_DIR    = os.getenv("INGEST_SPOOL_DIR", "./ingest/spool")
+INGEST_WORKERS      = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_BATCH        = int(os.getenv("INGEST_BATCH", "8"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+INGEST_RETRY_S      = float(os.getenv("INGEST_RETRY_S", "2"))
+INGEST_KEEP_DAYS    = float(os.getenv("INGEST_KEEP_DAYS", "7"))
+
+POLL_S = 1.0          # idle drain tasks look for due retries this often
+MAX_RETRY_S = 300.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    state        TEXT NOT NULL,          -- queued | processing | done | failed
+    fields       TEXT NOT NULL,          -- JSON form fields of the /add request
+    filename     TEXT,
+    content_type TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_try_at  REAL NOT NULL,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL,
+    result       TEXT,                   -- JSON, once done
+    error        TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_try_at);
+"""
+
+
+class PermanentError(Exception):
+    """Retrying won't help (e.g. the visual engine can't decode the image)."""
+
+
+class IngestQueue:
+    def __init__(self, db_path=INGEST_DB_PATH, spool_dir=INGEST_SPOOL_DIR):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self._wake = None
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        os.makedirs(spool_dir, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per call: calls come from the event loop and the threadpool
+        db = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _spool_path(self, job_id):
+        return os.path.join(self.spool_dir, job_id)
+
+    # -------------------------------------------------------------------------
+    # Producer side (/add)
+    # -------------------------------------------------------------------------
+    def enqueue(self, fields, filename, content_type, image_bytes):
+        """Durably stores one /add request. Returns the job id."""
+        job_id = str(uuid.uuid4())
+        path = self._spool_path(job_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(image_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, state, fields, filename, content_type, next_try_at, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(fields), filename, content_type, now, now, now),
+            )
+        return job_id
+
+    def wake(self):
+        """Lets an idle drain task pick new work up right away (call from the event loop)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    # -------------------------------------------------------------------------
+    # Consumer side
+    # -------------------------------------------------------------------------
+    def recover(self):
+        """Jobs left 'processing' by a crashed process are queued again; old finished jobs are pruned."""
+        now = time.time()
+        with self._connect() as db:
+            recovered = db.execute(
+                "UPDATE jobs SET state = 'queued', next_try_at = ?, updated_at = ? WHERE state = 'processing'",
+                (now, now),
+            ).rowcount
+            expired = [row[0] for row in db.execute(
+                "SELECT id FROM jobs WHERE state IN ('done', 'failed') AND updated_at < ?",
+                (now - INGEST_KEEP_DAYS * 86400,),
+            )]
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        # Failed jobs keep their image until they expire
+        for job_id in expired:
+            try:
+                os.remove(self._spool_path(job_id))
+            except OSError:
+                pass
+        if recovered:
+            print(f"♻️ Re-queued {recovered} ingest jobs interrupted by a restart")
+        return recovered
+
+    def claim(self, limit=INGEST_BATCH):
+        """Marks up to `limit` due jobs as processing and returns them (oldest first)."""
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT * FROM jobs WHERE state = 'queued' AND next_try_at <= ? "
+                "ORDER BY created_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            db.executemany(
+                "UPDATE jobs SET state = 'processing', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(now, row["id"]) for row in rows],
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+        return [
+            {
+                "id": row["id"],
+                "fields": json.loads(row["fields"]),
+                "filename": row["filename"],
+                "content_type": row["content_type"],
+                "attempts": row["attempts"] + 1,
+            }
+            for row in rows
+        ]
+
+    def read_image(self, job):
+        with open(self._spool_path(job["id"]), "rb") as f:
+            return f.read()
+
+    def complete(self, job_id, result):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET state = 'done', result = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+        try:
+            os.remove(self._spool_path(job_id))
+        except OSError:
+            pass
+
+    def fail(self, job, error):
+        """Schedules a retry with exponential backoff, or fails the job for good."""
+        now = time.time()
+        permanent = isinstance(error, PermanentError) or job["attempts"] >= INGEST_MAX_ATTEMPTS
+        delay = min(MAX_RETRY_S, INGEST_RETRY_S * 2 ** (job["attempts"] - 1))
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET state = ?, error = ?, next_try_at = ?, updated_at = ? WHERE id = ?",
+                ("failed" if permanent else "queued", str(error) or type(error).__name__,
+                 now + delay, now, job["id"]),
+            )
+        if permanent:
+            print(f"❌ Ingest job {job['id']} ({job['filename']}) failed: {error}")
+
+    async def drain(self, process_batch):
+        """
+        Worker loop (run INGEST_WORKERS of these as background tasks).
+        process_batch(jobs) returns {job id: result dict or Exception}.
+        """
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        while True:
+            try:
+                jobs = await asyncio.to_thread(self.claim)
+            except sqlite3.Error as e:
+                print(f"⚠️ Ingest queue unavailable: {e}")
+                jobs = []
+            if not jobs:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=POLL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                outcomes = await process_batch(jobs)
+            except Exception as e:
+                outcomes = {job["id"]: e for job in jobs}
+            for job in jobs:
+                outcome = outcomes.get(job["id"], RuntimeError("No result"))
+                if isinstance(outcome, Exception):
+                    await asyncio.to_thread(self.fail, job, outcome)
+                else:
+                    await asyncio.to_thread(self.complete, job["id"], outcome)
+
+    # -------------------------------------------------------------------------
+    # Status
+    # -------------------------------------------------------------------------
+    def job(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "state": row["state"],
+            "attempts": row["attempts"],
+            "filename": row["filename"],
+            "item": json.loads(row["fields"]).get("name"),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def stats(self):
+        with self._connect() as db:
+            by_state = dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            oldest = db.execute("SELECT MIN(created_at) FROM jobs WHERE state = 'queued'").fetchone()[0]
+        by_state = {state: by_state.get(state, 0) for state in ("queued", "processing", "done", "failed")}
+        return {
+            "depth": by_state["queued"] + by_state["processing"],
+            "by_state": by_state,
+            "oldest_queued_s": round(time.time() - oldest, 1) if oldest else 0.0,
+            "workers": INGEST_WORKERS,
+            "batch": INGEST_BATCH,
+        }
@@ -1,13 +1,35 @@
 import os
 import uuid
-import io
+import json
+import time
+import asyncio
 import httpx
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from typing import List
+from pydantic import BaseModel
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
-from qdrant_client import QdrantClient
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
 from qdrant_client.http import models
 from qdrant_client.http.models import Distance, VectorParams, PointStruct
-from PIL import Image
+
+from imaging import shrink_upload, decode_crop, dhash, DETECT_MAX_SIDE, VECTORIZE_MAX_SIDE
+from result_cache import ResultCache, query_key
+from cursors import CursorStore, SEARCH_CANDIDATES
+from similarity import SimilarityGraph, PAYLOAD_KEY as SIMILAR_PAYLOAD_KEY
+from taste_profiles import TasteProfileStore, INTERACTION_WEIGHTS
+from outfits import complementary_slots, slot_filter
+from geo import geo_condition, geo_rerank, nearby_radius_km, DEFAULT_DECAY_KM, DEFAULT_GEO_WEIGHT
+from dedup import Deduplicator, listing, DEDUP_ENABLED
+from vector_store import connect
+from routing import CollectionRouter, alias_targets, generation_name
+from reindex import Reindexer, save_original, load_source
+from ingest_queue import IngestQueue, PermanentError, INGEST_WORKERS
+from projection import Projection
+from products import (PRODUCT_KEY, VIEW_KEY, view_names, best_views,
+                      backfill_product_ids)
+from thumbnails import (make_thumbnails, thumbnail_path, thumbnail_urls,
+                        FORMATS as THUMB_FORMATS, CACHE_CONTROL as THUMB_CACHE_CONTROL, POINT_ID)
 
 app = FastAPI()
 
@@ -26,15 +48,135 @@ QDRANT_HOST = "qdrant"
 QDRANT_PORT = 6333
 COLLECTION_NAME = "locus_items"
 
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+# End-to-end latency ceiling (15 s in the scope). The visual engine is told
+# how much of it is left and takes cheaper paths instead of timing out.
+REQUEST_BUDGET_S = float(os.getenv("REQUEST_BUDGET_S", "15"))
+QDRANT_RESERVE_S = 1.0        # kept back for the Qdrant query after /vectorize
+VISUAL_TIMEOUT_GRACE_S = 5.0  # hard httpx timeout = budget + grace
+BUDGET_HEADER = "X-Locus-Budget-Ms"
 
-@app.on_event("startup")
-def startup_event():
-    if not client.collection_exists(collection_name=COLLECTION_NAME):
+# Qdrant, or the embedded store with VECTOR_STORE=embedded (vector_store.py)
+client = connect(host=QDRANT_HOST, port=QDRANT_PORT)
+
+def create_collection(collection_name):
+    """Creates a physical catalog collection and its payload indexes (idempotent)."""
+    if not client.collection_exists(collection_name=collection_name):
         client.create_collection(
-            collection_name=COLLECTION_NAME,
+            collection_name=collection_name,
             vectors_config=VectorParams(size=512, distance=Distance.COSINE),
         )
+    # The similarity graph, outfit completion and duplicate lookup filter
+    # on these, grouped searches group by product_id (no-op if the index exists)
+    for field in ("category_tag", "mall_name", "style_tags", "phash_bands", PRODUCT_KEY):
+        client.create_payload_index(
+            collection_name=collection_name, field_name=field,
+            field_schema=models.PayloadSchemaType.KEYWORD
+        )
+    # Store coordinates, for the radius filter in /search
+    client.create_payload_index(
+        collection_name=collection_name, field_name="location",
+        field_schema=models.PayloadSchemaType.GEO
+    )
+
+def setup_collection(collection_name):
+    """
+    Makes sure a live collection exists. New ones are created as generation
+    1 behind an alias of that name, so they can be reindexed blue/green.
+    """
+    target = alias_targets(client).get(collection_name)
+    if target is None and not client.collection_exists(collection_name=collection_name):
+        # Generation 0 without an alias: a reindex moved a pre-alias
+        # collection there and stopped before creating the alias
+        target = generation_name(collection_name, 0)
+        if not client.collection_exists(collection_name=target):
+            target = generation_name(collection_name, 1)
+            create_collection(target)
+        client.update_collection_aliases(change_aliases_operations=[
+            models.CreateAliasOperation(create_alias=models.CreateAlias(
+                collection_name=target, alias_name=collection_name
+            ))
+        ])
+        return
+    create_collection(target or collection_name)
+
+# One collection, or one per mall (SHARDING=mall) — every query goes through this
+router = CollectionRouter(client, COLLECTION_NAME, setup_collection)
+
+# Identical vector + filter queries skip Qdrant; /add invalidates
+result_cache = ResultCache()
+
+# Deep candidate lists behind "show more" (/search/next)
+cursor_store = CursorStore()
+
+# Precomputed neighbour lists behind /similar/{point_id}
+similarity_graph = SimilarityGraph(router)
+
+# Near-duplicate uploads become extra listings on one point
+deduplicator = Deduplicator(router, source_fn=load_source)
+
+# Per-user taste vectors behind /recommend/{user_id}
+taste_profiles = TasteProfileStore()
+
+def after_switch():
+    """Everything derived from the old generation's vectors."""
+    result_cache.bump_version()
+    # The projection's companions were built from the old generation
+    if router.projection is not None:
+        router.projection.invalidate()
+    similarity_graph.rebuild()
+
+# Blue/green re-embedding of the whole catalog (/reindex/*)
+reindexer = Reindexer(router, create_collection, on_switch=after_switch)
+
+# /add only queues; workers started at startup vectorize and store
+ingest_queue = IngestQueue()
+
+# Compact first stage + full rescore, once fit_projection.py has run
+router.projection = Projection.load()
+if router.projection is not None:
+    print(f"✅ Projection v{router.projection.version} loaded ({router.projection.dim}-d first stage)")
+
+# Neighbour lists live in the payload but are never needed in search results
+SEARCH_PAYLOAD = models.PayloadSelectorExclude(exclude=[SIMILAR_PAYLOAD_KEY])
+
+def visual_budget(started, reserve=0.0):
+    """
+    Time left for a visual engine call in a request that began at `started`
+    (time.monotonic()). Returns (headers, httpx_timeout).
+    """
+    left = REQUEST_BUDGET_S - (time.monotonic() - started) - reserve
+    headers = {BUDGET_HEADER: str(max(0, int(left * 1000)))}
+    return headers, max(left, 1.0) + VISUAL_TIMEOUT_GRACE_S
+
+def backfill_products(collection_name):
+    """Items stored before products existed become one-view products (and its companion's copies)."""
+    names = [collection_name]
+    projection = router.projection
+    if projection is not None and projection.covers(client, collection_name):
+        names.append(projection.companion(collection_name))
+    for name in names:
+        try:
+            updated = backfill_product_ids(client, name)
+        except Exception as e:
+            print(f"⚠️ product_id backfill failed for {name}: {e}")
+            continue
+        if updated:
+            print(f"♻️ {name}: {updated} items given a product_id")
+
+@app.on_event("startup")
+def startup_event():
+    # Mall collections are created on their first /add
+    for collection_name in router.collections():
+        setup_collection(collection_name)
+        backfill_products(collection_name)
+    if reindexer.interrupted:
+        print("⚠️ A reindex was interrupted — POST /reindex/start to resume it")
+
+@app.on_event("startup")
+async def start_ingest_workers():
+    await run_in_threadpool(ingest_queue.recover)
+    for _ in range(INGEST_WORKERS):
+        asyncio.create_task(ingest_queue.drain(process_ingest_batch))
 
 @app.get("/")
 def read_root():
@@ -49,20 +191,27 @@ async def health_check():
 
     Returns:
         ready: true only when the visual engine is fully loaded
+        search_ready: true once CLIP + rembg are up (/search, /add work)
         services: individual status of each service
+        models: per-model status reported by the visual engine
     """
     status = {
         "gateway":       "ready",
         "visual_engine": "not_ready",
         "qdrant":        "not_ready",
     }
+    models = {}
+    search_ready = False
 
-    # Check visual engine
+    # Check visual engine — it reports readiness per model
     try:
         async with httpx.AsyncClient() as http_client:
             resp = await http_client.get(f"{VISUAL_URL}/", timeout=3.0)
             if resp.status_code == 200:
-                status["visual_engine"] = "ready"
+                body = resp.json()
+                models = body.get("models", {})
+                search_ready = body.get("vectorize_ready", False)
+                status["visual_engine"] = "ready" if body.get("ready") else "loading"
     except Exception:
         status["visual_engine"] = "loading"
 
@@ -74,128 +223,923 @@ async def health_check():
         status["qdrant"] = "loading"
 
     all_ready = all(v == "ready" for v in status.values())
-    return {"ready": all_ready, "services": status}
+    return {
+        "ready": all_ready,
+        "search_ready": search_ready and status["qdrant"] == "ready",
+        "services": status,
+        "models": models
+    }
+
+async def shrunk_upload_file(file, max_side):
+    """
+    Reads an upload and shrinks it to max_side before it is forwarded.
+    Returns ((filename, bytes, content_type), scale) — scale maps the visual
+    engine's coordinates back to the original photo. Anything PIL can't
+    decode is passed through untouched so the visual engine reports it.
+    """
+    image_bytes = await file.read()
+    try:
+        data, content_type, scale = await run_in_threadpool(shrink_upload, image_bytes, max_side)
+    except Exception:
+        return (file.filename, image_bytes, file.content_type), 1.0
+    if scale == 1.0:
+        return (file.filename, image_bytes, file.content_type), 1.0
+    return (file.filename, data, content_type), scale
+
+def rescale_detection(detection, scale, width, height):
+    x1, y1, x2, y2 = detection["bbox"]
+    detection["bbox"] = [
+        min(width,  int(round(x1 * scale))), min(height, int(round(y1 * scale))),
+        min(width,  int(round(x2 * scale))), min(height, int(round(y2 * scale))),
+    ]
+    return detection
 
 @app.post("/detect")
 async def detect_objects(file: UploadFile = File(...)):
     """
     NEW ENDPOINT: Pass-through to visual engine's /detect.
     Step 1 of the new flow: user uploads photo, we return all detected items.
+    Oversized photos are shrunk before forwarding; boxes come back in
+    original-photo coordinates.
     """
+    started = time.monotonic()
+    upload, scale = await shrunk_upload_file(file, DETECT_MAX_SIDE)
+    headers, timeout = visual_budget(started)
     async with httpx.AsyncClient() as http_client:
-        files = {"file": (file.filename, await file.read(), file.content_type)}
         response = await http_client.post(
-            f"{VISUAL_URL}/detect", files=files, timeout=60.0
+            f"{VISUAL_URL}/detect", files={"file": upload}, headers=headers, timeout=timeout
         )
         response.raise_for_status()
-        return response.json()
+        result = response.json()
+
+    if scale != 1.0:
+        W = int(round(result["image_width"] * scale))
+        H = int(round(result["image_height"] * scale))
+        result["detections"] = [rescale_detection(d, scale, W, H) for d in result["detections"]]
+        result["image_width"], result["image_height"] = W, H
+    return result
+
+@app.post("/detect_stream")
+async def detect_objects_stream(file: UploadFile = File(...)):
+    """
+    Streaming pass-through to visual engine's /detect_stream (NDJSON).
+    Chunks are relayed as they arrive — nothing is buffered here, so the
+    dashboard can draw clothing boxes before the accessory model finishes.
+    If the upload had to be shrunk, events are rescaled line by line.
+    """
+    started = time.monotonic()
+    upload, scale = await shrunk_upload_file(file, DETECT_MAX_SIDE)
+    headers, timeout = visual_budget(started)
+
+    # The upstream status is checked before anything is sent, so a visual
+    # engine error (503 while models load, 4xx for a bad image) reaches
+    # the client as that status instead of an empty 200 stream. The client
+    # then stays open for as long as the stream is being relayed.
+    http_client = httpx.AsyncClient()
+    try:
+        response = await http_client.send(
+            http_client.build_request(
+                "POST", f"{VISUAL_URL}/detect_stream", files={"file": upload},
+                headers=headers, timeout=timeout
+            ),
+            stream=True
+        )
+    except httpx.HTTPError as e:
+        await http_client.aclose()
+        raise HTTPException(status_code=502, detail=f"Visual engine unreachable: {e}")
+    if response.status_code != 200:
+        body = await response.aread()
+        await response.aclose()
+        try:
+            detail = json.loads(body).get("detail", body.decode(errors="replace"))
+        except (ValueError, AttributeError):
+            detail = body.decode(errors="replace")
+        await http_client.aclose()
+        raise HTTPException(status_code=response.status_code, detail=detail)
+
+    async def relay():
+        try:
+            if scale == 1.0:
+                async for chunk in response.aiter_raw():
+                    yield chunk
+                return
+
+            W = H = 0
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "image":
+                    W = event["image_width"]  = int(round(event["image_width"] * scale))
+                    H = event["image_height"] = int(round(event["image_height"] * scale))
+                elif event["type"] == "detection":
+                    rescale_detection(event["detection"], scale, W, H)
+                yield json.dumps(event) + "\n"
+        except httpx.HTTPError as e:
+            # Cut off mid-stream: same error event the visual engine sends (on
+            # a line of its own, in case a raw chunk ended mid-line)
+            yield "\n" + json.dumps({"type": "error", "detail": f"Visual engine stream interrupted: {e}"}) + "\n"
+        finally:
+            await response.aclose()
+            await http_client.aclose()
+
+    return StreamingResponse(relay(), media_type="application/x-ndjson")
+
+def build_filter(category, geo=None):
+    """
+    Qdrant filter restricting results to the detected category and, if a
+    geo condition is given, to items within its radius (or None).
+    """
+    if not category and geo is None:
+        return None
+    should = None
+    if category:
+        print(f"🎯 Filter: {category}")
+        should = [models.FieldCondition(
+            key="name", match=models.MatchText(text=category)
+        )]
+    return models.Filter(must=[geo] if geo is not None else None, should=should)
+
+def format_hits(hits):
+    """Qdrant hits → the match dicts the dashboard renders."""
+    return [
+        {
+            "id": str(hit.id),
+            "name": hit.payload.get("name", "Unknown"),
+            "store": hit.payload.get("store_name", "Unknown"),
+            "level": hit.payload.get("floor_level", "Unknown"),
+            "mall": hit.payload.get("mall_name", "Unknown"),
+            "score": round(hit.score, 3),
+            "image_filename": hit.payload.get("filename"),
+            # Multi-view products: which view matched best
+            "product_id": hit.payload.get(PRODUCT_KEY) or str(hit.id),
+            "view": hit.payload.get(VIEW_KEY),
+            "thumbnails": thumbnail_urls(hit.id, hit.payload),
+            # Same product listed by other stores (collapsed duplicates)
+            "also_at": [
+                {"name": l.get("name"), "store": l.get("store_name"), "level": l.get("floor_level")}
+                for l in (hit.payload.get("listings") or [])[1:]
+            ]
+        }
+        for hit in hits
+    ]
+
+def format_geo_ranked(ranked):
+    """geo_rerank() output → match dicts with fused score, similarity and distance."""
+    matches = format_hits([hit for hit, _, _ in ranked])
+    for match, (hit, fused, distance_km) in zip(matches, ranked):
+        match["similarity"] = match["score"]
+        match["score"] = round(fused, 3)
+        match["distance_km"] = None if distance_km is None else round(distance_km, 2)
+    return matches
+
+def search_products(query_vector, query_filter, mall=None, limit=SEARCH_CANDIDATES):
+    """Best `limit` products, each as the hit of its best-matching view."""
+    return best_views(router.search_groups(
+        query_vector=query_vector,
+        group_by=PRODUCT_KEY,
+        query_filter=query_filter,
+        limit=limit,
+        group_size=1,
+        mall=mall,
+        with_payload=SEARCH_PAYLOAD
+    ))
+
+def search_candidates(query_vector, category, lat=None, lon=None, radius_km=None,
+                      decay_km=DEFAULT_DECAY_KM, geo_weight=DEFAULT_GEO_WEIGHT, mall=None):
+    """
+    The Qdrant side of /search and /search_text: category filter, optional
+    geo radius (applied inside the filtered HNSW search) and nearness
+    rerank. With a position but no radius, the area within
+    nearby_radius_km(decay_km) is searched first and topped up with
+    farther matches only if it has too few. A mall scope only touches
+    that mall's collection; without one all malls are searched
+    concurrently and merged. Hits are grouped by product, so each
+    product appears once, as its best-matching view.
+    Returns the full candidate list (SEARCH_CANDIDATES), served from the
+    result cache when an identical query ran before.
+    """
+    located = lat is not None and lon is not None
+    geo = geo_condition(lat, lon, radius_km) if located and radius_km else None
+    query_filter = build_filter(category, geo)
+    rerank = (lat, lon, decay_km, geo_weight) if located else None
+
+    key = query_key(query_vector, query_filter, SEARCH_CANDIDATES, (rerank, mall))
+    matches = result_cache.get(key)
+    if matches is None:
+        version = result_cache.version_snapshot()
+        if located and not radius_km:
+            nearby = build_filter(category, geo_condition(lat, lon, nearby_radius_km(decay_km)))
+            search_result = search_products(query_vector, nearby, mall)
+            if len(search_result) < SEARCH_CANDIDATES:
+                seen = {hit.payload.get(PRODUCT_KEY) or str(hit.id) for hit in search_result}
+                search_result += [
+                    hit for hit in search_products(query_vector, query_filter, mall)
+                    if (hit.payload.get(PRODUCT_KEY) or str(hit.id)) not in seen
+                ][:SEARCH_CANDIDATES - len(search_result)]
+        else:
+            search_result = search_products(query_vector, query_filter, mall)
+        if located:
+            matches = format_geo_ranked(geo_rerank(search_result, lat, lon, decay_km, geo_weight))
+        else:
+            matches = format_hits(search_result)
+        result_cache.put(key, matches, version)
+    return matches
 
 @app.post("/search")
 async def search(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     # Optional bounding box — if provided, we crop to that region first
     x1: int = Form(None),
     y1: int = Form(None),
     x2: int = Form(None),
     y2: int = Form(None),
+    # Optional — the query is folded into this user's taste profile
+    user_id: str = Form(None),
+    # Optional — only search this mall
+    mall: str = Form(None),
+    # Optional shopper position: results are limited to radius_km (if given)
+    # and ranked by similarity fused with nearness
+    lat: float = Form(None),
+    lon: float = Form(None),
+    radius_km: float = Form(None),
+    decay_km: float = Form(DEFAULT_DECAY_KM),
+    geo_weight: float = Form(DEFAULT_GEO_WEIGHT),
 ):
     """
     Updated /search endpoint.
     Now accepts an optional bounding box (x1,y1,x2,y2).
     If a bbox is provided, we crop the image to that region before vectorizing.
     This is how the user's selected object is isolated.
+    The visual engine gets the remaining end-to-end budget; any cheaper
+    paths it had to take are returned as "degradations".
+    Only the first page of matches is returned; pass next_cursor to
+    /search/next for more.
+    With lat/lon, each match also gets distance_km and its pure visual
+    similarity; "score" becomes the fused similarity + nearness score.
     """
-    image_bytes = await file.read()
+    started = time.monotonic()
 
-    # If the user selected a specific detected object, crop to it
+    # If the user selected a specific detected object, crop to it.
+    # Only the resolution the crop needs is decoded (JPEG draft mode).
     if all(v is not None for v in [x1, y1, x2, y2]):
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        img = img.crop((x1, y1, x2, y2))
-        buf = io.BytesIO()
-        img.save(buf, format="PNG")
-        image_bytes = buf.getvalue()
-        filename = "cropped_selection.png"
-        content_type = "image/png"
+        image_bytes, content_type = await run_in_threadpool(
+            decode_crop, await file.read(), (x1, y1, x2, y2)
+        )
+        upload = ("cropped_selection.png", image_bytes, content_type)
     else:
-        filename = file.filename
-        content_type = file.content_type
+        upload, _ = await shrunk_upload_file(file, VECTORIZE_MAX_SIDE)
 
     # 1. Vectorize the (possibly cropped) image
+    headers, timeout = visual_budget(started, reserve=QDRANT_RESERVE_S)
     async with httpx.AsyncClient() as http_client:
-        files = {"file": (filename, image_bytes, content_type)}
+        files = {"file": upload}
         vis_response = await http_client.post(
-            f"{VISUAL_URL}/vectorize", files=files, timeout=40.0
+            f"{VISUAL_URL}/vectorize", files=files, headers=headers, timeout=timeout
         )
         data = vis_response.json()
         query_vector = data.get("vector")
         processed_image = data.get("processed_image")
         detected_category = data.get("category")
+        degradations = data.get("degradations", [])
 
     if not query_vector:
         raise HTTPException(status_code=400, detail="Could not vectorize image")
+    if user_id:
+        background_tasks.add_task(taste_profiles.record, user_id, query_vector, "search")
+
+    # 2. Filtered (and optionally geo-ranked) Qdrant search
+    matches = search_candidates(
+        query_vector, detected_category, lat, lon, radius_km, decay_km, geo_weight, mall
+    )
+    page, next_cursor = cursor_store.first_page(matches)
 
-    # 2. Build Filter
-    query_filter = None
-    if detected_category:
-        print(f"🎯 Filter: {detected_category}")
-        query_filter = models.Filter(
-            should=[models.FieldCondition(
-                key="name", match=models.MatchText(text=detected_category)
-            )]
+    return {
+        "matches": page,
+        "next_cursor": next_cursor,
+        "total_candidates": len(matches),
+        "debug_image": processed_image,
+        "detected_category": detected_category,
+        "degradations": degradations
+    }
+
+@app.post("/search_text")
+async def search_text(
+    text: str = Form(...),
+    mall: str = Form(None),
+    lat: float = Form(None),
+    lon: float = Form(None),
+    radius_km: float = Form(None),
+    decay_km: float = Form(DEFAULT_DECAY_KM),
+    geo_weight: float = Form(DEFAULT_GEO_WEIGHT),
+):
+    """
+    Text-to-image catalog search ("red satin slip dress").
+    The visual engine embeds the query with CLIP's text tower (batched
+    across concurrent queries, cached per query text); the Qdrant side is
+    the same filtered search as /search, including paging via next_cursor.
+    """
+    async with httpx.AsyncClient() as http_client:
+        vis_response = await http_client.post(
+            f"{VISUAL_URL}/embed_text", data={"text": text}, timeout=10.0
         )
+        if vis_response.status_code != 200:
+            raise HTTPException(status_code=vis_response.status_code, detail=vis_response.text)
+        data = vis_response.json()
 
-    # 3. Search Qdrant
-    search_result = client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_vector,
-        query_filter=query_filter,
-        limit=25
+    detected_category = data.get("category")
+    matches = search_candidates(
+        data["vector"], detected_category, lat, lon, radius_km, decay_km, geo_weight, mall
     )
-    
-    matches = []
-    for hit in search_result:
-        matches.append({
-            "name": hit.payload.get("name", "Unknown"),
-            "store": hit.payload.get("store_name", "Unknown"),
-            "level": hit.payload.get("floor_level", "Unknown"),
-            "mall": hit.payload.get("mall_name", "Unknown"),
-            "score": round(hit.score, 3), 
-            "image_filename": hit.payload.get("filename")
-        })
-        
+    page, next_cursor = cursor_store.first_page(matches)
+
     return {
-        "matches": matches,
-        "debug_image": processed_image,
+        "matches": page,
+        "next_cursor": next_cursor,
+        "total_candidates": len(matches),
+        "query": text,
         "detected_category": detected_category
     }
 
-@app.post("/add")
+@app.get("/search/next")
+def search_next(cursor: str):
+    """
+    Next page of an earlier /search (or /search_all group), served from the
+    candidate list stored under the cursor — no re-vectorizing, no Qdrant.
+    """
+    result = cursor_store.page(cursor)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Cursor expired or unknown — run the search again")
+    page, next_cursor = result
+    return {"matches": page, "next_cursor": next_cursor}
+
+@app.post("/search_all")
+async def search_all(
+    file: UploadFile = File(...),
+    # JSON list of detections from /detect (each needs a "bbox")
+    detections: str = Form(...),
+    mall: str = Form(None),
+):
+    """
+    /search for every detected item at once.
+    All regions are vectorized in one /vectorize_batch call (one batched
+    CLIP pass); their grouped product searches then run concurrently
+    (Qdrant has no batched form of search_groups).
+    Returns one result group per detection, in the same order.
+    """
+    started = time.monotonic()
+    try:
+        items = json.loads(detections)
+        bboxes = [item["bbox"] for item in items]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="detections must be a JSON list of {bbox: [x1, y1, x2, y2]}")
+    if not bboxes:
+        return {"results": [], "degradations": []}
+
+    # Boxes are in original-photo pixels. The original is sent unshrunk so
+    # each region is cropped at the resolution /search's decode_crop gives
+    # it (the visual engine decodes only what the smallest box needs)
+    upload = (file.filename, await file.read(), file.content_type)
+    boxes = [[int(v) for v in bbox] for bbox in bboxes]
+
+    # 1. Vectorize every region in one round trip
+    headers, timeout = visual_budget(started, reserve=QDRANT_RESERVE_S)
+    async with httpx.AsyncClient() as http_client:
+        vis_response = await http_client.post(
+            f"{VISUAL_URL}/vectorize_batch",
+            files={"file": upload},
+            data={"bboxes": json.dumps(boxes)},
+            headers=headers, timeout=timeout
+        )
+        vis_response.raise_for_status()
+        data = vis_response.json()
+
+    # 2. Product searches for all regions that could be vectorized and
+    #    aren't already in the result cache
+    vectorized = [r for r in data.get("results", []) if r.get("vector")]
+    vectors_by_index = {r["index"]: r for r in vectorized}
+    matches_by_index = {}
+    pending = []
+    for r in vectorized:
+        query_filter = build_filter(r.get("category"))
+        key = query_key(r["vector"], query_filter, SEARCH_CANDIDATES, (None, mall))
+        cached = result_cache.get(key)
+        if cached is not None:
+            matches_by_index[r["index"]] = cached
+        else:
+            pending.append((r["index"], key, r["vector"], query_filter))
+
+    if pending:
+        version = result_cache.version_snapshot()
+        batch_hits = await asyncio.gather(*(
+            run_in_threadpool(search_products, vector, query_filter, mall)
+            for _, _, vector, query_filter in pending
+        ))
+        for (index, key, _, _), hits in zip(pending, batch_hits):
+            matches_by_index[index] = format_hits(hits)
+            result_cache.put(key, matches_by_index[index], version)
+
+    results = []
+    for index, item in enumerate(items):
+        region = vectors_by_index.get(index)
+        page, next_cursor = cursor_store.first_page(matches_by_index.get(index, []))
+        results.append({
+            "index": index,
+            "bbox": item["bbox"],
+            "label": item.get("label"),
+            "matches": page,
+            "next_cursor": next_cursor,
+            "debug_image": region.get("processed_image") if region else None,
+            "detected_category": region.get("category") if region else None,
+            "error": None if region else "Could not vectorize region"
+        })
+
+    return {"results": results, "degradations": data.get("degradations", [])}
+
+@app.post("/add", status_code=202)
 async def add_item(
     name: str = Form(...),
     store: str = Form(...),
     level: str = Form(...),
     mall: str = Form(...),
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    # Store coordinates (bulk_upload.py sends them from mall_config.json)
+    lat: float = Form(None),
+    lon: float = Form(None)
+):
+    """
+    Queues a catalog item and answers right away with a job id (202).
+    The ingest workers vectorize and store it; poll /ingest/jobs/{job_id}.
+    """
+    upload, _ = await shrunk_upload_file(file, VECTORIZE_MAX_SIDE)
+    fields = {"name": name, "store": store, "level": level, "mall": mall, "lat": lat, "lon": lon}
+    filename, image_bytes, content_type = upload
+    job_id = await run_in_threadpool(ingest_queue.enqueue, fields, filename, content_type, image_bytes)
+    ingest_queue.wake()
+    return {"status": "queued", "item": name, "job_id": job_id}
+
+@app.post("/add_product", status_code=202)
+async def add_product(
+    name: str = Form(...),
+    store: str = Form(...),
+    level: str = Form(...),
+    mall: str = Form(...),
+    # One image per view of the same product
+    files: List[UploadFile] = File(...),
+    # Comma-separated view names in file order, e.g. "front,back,lifestyle"
+    views: str = Form(None),
+    # Adds views to an existing product when given
+    product_id: str = Form(None),
+    lat: float = Form(None),
+    lon: float = Form(None)
 ):
+    """
+    Queues every view of one product under a shared product_id (one ingest
+    job, and one point, per view). Searches return the product once, scored
+    by its best-matching view.
+    """
+    try:
+        names = view_names(views, len(files))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"views: {e}")
+    product_id = product_id or str(uuid.uuid4())
+    job_ids = []
+    for file, view in zip(files, names):
+        upload, _ = await shrunk_upload_file(file, VECTORIZE_MAX_SIDE)
+        fields = {"name": name, "store": store, "level": level, "mall": mall, "lat": lat, "lon": lon,
+                  "product_id": product_id, "view": view}
+        filename, image_bytes, content_type = upload
+        job_ids.append(await run_in_threadpool(ingest_queue.enqueue, fields, filename, content_type, image_bytes))
+    ingest_queue.wake()
+    return {"status": "queued", "item": name, "product_id": product_id, "views": names, "job_ids": job_ids}
+
+async def vectorize_job(http_client, job, image_bytes):
+    """Visual engine side of one ingest job. Returns the vectorize response."""
+    vis_response = await http_client.post(
+        f"{VISUAL_URL}/vectorize",
+        files={"file": (job["filename"], image_bytes, job["content_type"])},
+        timeout=30.0
+    )
+    if 400 <= vis_response.status_code < 500:
+        raise PermanentError(vis_response.text)
+    vis_response.raise_for_status()
+    data = vis_response.json()
+    if not data.get("vector"):
+        raise PermanentError(data.get("error") or "Could not vectorize image")
+    return data
+
+def screen_job(job):
+    """
+    Model-free first look at an ingest job: its image, perceptual hash and
+    stored duplicate candidates. "duplicate" is set when a candidate's
+    source image matches — that job never goes to the visual engine.
+    """
+    image_bytes = ingest_queue.read_image(job)
+    screen = {"image_bytes": image_bytes, "hash": None, "candidates": [], "duplicate": None}
+    try:
+        screen["hash"] = dhash(image_bytes) if DEDUP_ENABLED else None
+    except Exception:
+        return screen
+    # Views of a product are meant to look alike
+    if screen["hash"] is not None and not job["fields"].get("product_id"):
+        screen["candidates"] = deduplicator.candidates(screen["hash"], job["fields"]["mall"])
+        screen["duplicate"] = deduplicator.match_pixels(image_bytes, screen["candidates"])
+    return screen
+
+def store_jobs(jobs, screened, vectorized):
+    """
+    Qdrant side of an ingest batch. A near-duplicate of an item the same
+    mall already has (or of an earlier item in this batch) is added to that
+    point's "listings" instead of becoming a new point — except for views
+    of a product, which are meant to look alike. New points are upserted
+    with one request per collection.
+    screened: screen_job() results; vectorized: vectorize responses (None
+    for jobs screening already found a duplicate for).
+    Returns {job id: result or Exception}.
+    """
+    outcomes = {}
+    pending = {}      # collection -> [PointStruct]
+    added = []        # (job id, point_id, image_bytes)
+    merged = []       # (job id, point id) merged into a point of this batch
+    for job, screen, data in zip(jobs, screened, vectorized):
+        for result in (screen, data):
+            if isinstance(result, Exception):
+                outcomes[job["id"]] = result
+        if job["id"] in outcomes:
+            continue
+        image_bytes, image_hash = screen["image_bytes"], screen["hash"]
+        fields = job["fields"]
+        mall = fields["mall"]
+
+        point_id = str(uuid.uuid4())
+        payload = {
+            "name": fields["name"], "store_name": fields["store"], "floor_level": fields["level"],
+            "mall_name": mall, "filename": job["filename"],
+            # A single /add item is a product with one view
+            PRODUCT_KEY: fields.get("product_id") or point_id
+        }
+        if fields.get("view"):
+            payload[VIEW_KEY] = fields["view"]
+        if fields.get("lat") is not None and fields.get("lon") is not None:
+            payload["location"] = {"lat": fields["lat"], "lon": fields["lon"]}
+
+        collection_name = router.collection_for(mall)
+        batch_points = pending.setdefault(collection_name, [])
+        duplicate = screen["duplicate"]
+        if duplicate is None and image_hash is not None and not fields.get("product_id"):
+            duplicate = deduplicator.find_duplicate(
+                image_hash, data["vector"], mall, batch_points, candidates=screen["candidates"]
+            )
+        if duplicate is not None:
+            in_batch = any(duplicate is p for p in batch_points)
+            try:
+                deduplicator.merge(duplicate, payload, pending=in_batch)
+            except Exception as e:
+                outcomes[job["id"]] = e
+                continue
+            if in_batch:
+                merged.append((job["id"], str(duplicate.id)))
+            outcomes[job["id"]] = {"status": "merged", "item": fields["name"], "id": str(duplicate.id)}
+            continue
+
+        payload["category_tag"] = data.get("category")
+        payload["style_tags"] = data.get("style_tags") or []
+        if image_hash is not None:
+            payload.update(deduplicator.hash_payload(image_hash))
+        payload["listings"] = [listing(payload)]
+        # Small WebP / JPEG for result grids, served by /thumbs
+        thumbnails = make_thumbnails(point_id, image_bytes)
+        if thumbnails:
+            payload["thumbnails"] = thumbnails
+
+        batch_points.append(PointStruct(id=point_id, vector=data["vector"], payload=payload))
+        added.append((job["id"], point_id, image_bytes))
+        outcomes[job["id"]] = {"status": "saved", "item": fields["name"], "id": point_id}
+
+    for collection_name, points in pending.items():
+        if not points:
+            continue
+        try:
+            client.upsert(collection_name=collection_name, points=points)
+        except Exception as e:
+            # Jobs merged into these points failed with them
+            ids = {str(p.id) for p in points}
+            for job_id, point_id in [(job_id, point_id) for job_id, point_id, _ in added] + merged:
+                if point_id in ids:
+                    outcomes[job_id] = e
+            continue
+        # Compact copies, so the first stage finds the new items too
+        projection = router.projection
+        if projection is not None:
+            try:
+                projection.upsert(client, collection_name, points)
+            except Exception as e:
+                print(f"⚠️ Compact vectors not written for {collection_name}: {e}")
+    result_cache.bump_version()
+
+    points_by_id = {str(p.id): p for points in pending.values() for p in points}
+    for job_id, point_id, image_bytes in added:
+        if isinstance(outcomes[job_id], Exception):
+            continue
+        point = points_by_id[point_id]
+        # Link the new item into the similar-items graph
+        try:
+            similarity_graph.add_point(point_id, point.vector, point.payload)
+        except Exception as e:
+            print(f"⚠️ Similar-items update failed for {point_id}: {e}")
+        # Kept so a reindex can re-embed the item with a new model
+        save_original(point_id, image_bytes)
+    return outcomes
+
+async def process_ingest_batch(jobs):
+    """
+    Hashes and duplicate lookups first (no model), then the images that
+    still need a vector go to the visual engine concurrently, then one
+    store pass.
+    """
+    screened = await asyncio.gather(
+        *(run_in_threadpool(screen_job, job) for job in jobs), return_exceptions=True
+    )
+
+    async def vectorize(http_client, job, screen):
+        if isinstance(screen, Exception) or screen["duplicate"] is not None:
+            return None
+        return await vectorize_job(http_client, job, screen["image_bytes"])
+
     async with httpx.AsyncClient() as http_client:
-        files = {"file": (file.filename, await file.read(), file.content_type)}
-        vis_response = await http_client.post(
-            f"{VISUAL_URL}/vectorize", files=files, timeout=30.0
+        vectorized = await asyncio.gather(
+            *(vectorize(http_client, job, screen) for job, screen in zip(jobs, screened)),
+            return_exceptions=True
         )
-        vis_response.raise_for_status()
-        data = vis_response.json()
+    return await run_in_threadpool(store_jobs_locked, jobs, screened, vectorized)
+
+def store_jobs_locked(jobs, screened, vectorized):
+    # A reindex pauses catalog writes while it repoints an alias
+    with router.write_lock:
+        return store_jobs(jobs, screened, vectorized)
+
+@app.get("/ingest/status")
+def ingest_status():
+    """Queue depth (queued + processing), jobs per state and the oldest waiting job."""
+    return ingest_queue.stats()
+
+@app.get("/ingest/jobs/{job_id}")
+def ingest_job(job_id: str):
+    """State of one /add job: queued, processing, done (with the item id) or failed."""
+    job = ingest_queue.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+@app.get("/thumbs/{name}")
+def thumbnail(name: str):
+    """
+    A catalog item's thumbnail: /thumbs/<point id>.webp or .jpg. Cached for
+    a year by browsers and proxies; made on the spot for items ingested
+    before thumbnails existed.
+    """
+    point_id, _, ext = name.rpartition(".")
+    if ext not in THUMB_FORMATS or not POINT_ID.match(point_id):
+        raise HTTPException(status_code=404, detail="Unknown thumbnail")
+    path = thumbnail_path(point_id, ext)
+    if not os.path.isfile(path):
+        point_key = int(point_id) if point_id.isdigit() else point_id
+        _, point = router.locate(point_key, with_payload=True)
+        source = load_source(point.id, point.payload) if point is not None else None
+        if source is None or not make_thumbnails(point_id, source[1]):
+            raise HTTPException(status_code=404, detail="Unknown thumbnail")
+    return FileResponse(
+        path, media_type=THUMB_FORMATS[ext][1],
+        headers={"Cache-Control": THUMB_CACHE_CONTROL}
+    )
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit ratio and memory use of the search result cache, plus open cursors."""
+    return {**result_cache.stats(), "cursors": cursor_store.stats()}
+
+@app.get("/similar/status")
+def similar_status():
+    """Neighbour count per item and the last full rebuild."""
+    return similarity_graph.stats()
+
+@app.post("/similar/rebuild")
+def similar_rebuild(background_tasks: BackgroundTasks):
+    """
+    Recomputes every item's neighbour list in the background (blocked
+    numpy matrix products per category + mall). Poll /similar/status.
+    """
+    if similarity_graph.rebuilding:
+        return {"status": "already_running"}
+    background_tasks.add_task(similarity_graph.rebuild)
+    return {"status": "started"}
+
+@app.get("/similar/{point_id}")
+def similar_items(point_id: str):
+    """
+    "More like this" for a catalog item: its precomputed neighbours from
+    the same category and mall, read with a single lookup by point id.
+    """
+    try:
+        neighbours = similarity_graph.similar(point_id)
+    except Exception:
+        neighbours = None
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail="Unknown item")
+    return {
+        "id": point_id,
+        "matches": [
+            {
+                "id": n["id"],
+                "name": n.get("name") or "Unknown",
+                "store": n.get("store_name") or "Unknown",
+                "level": n.get("floor_level") or "Unknown",
+                "mall": n.get("mall_name") or "Unknown",
+                "score": round(n["score"], 3),
+                "image_filename": n.get("filename"),
+                "thumbnails": thumbnail_urls(n["id"], n)
+            }
+            for n in neighbours
+        ]
+    }
+
+class Interaction(BaseModel):
+    user_id: str
+    point_id: str
+    kind: str = "click"
+
+@app.post("/interactions")
+def record_interaction(interaction: Interaction):
+    """
+    Folds a catalog item the user clicked (or saved) into their taste
+    profile, using the vector already stored in Qdrant.
+    """
+    if interaction.kind not in INTERACTION_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {sorted(INTERACTION_WEIGHTS)}")
+    _, point = router.locate(interaction.point_id, with_vectors=True, with_payload=False)
+    if point is None:
+        raise HTTPException(status_code=404, detail="Unknown item")
+    profile = taste_profiles.record(interaction.user_id, point.vector, interaction.kind)
+    return {"status": "recorded", "centroids": len(profile.weights)}
+
+@app.get("/recommend/{user_id}")
+async def recommend(user_id: str, limit: int = 25, mall: str = None):
+    """
+    Persona recommendations from the user's taste profile.
+    One grouped product search per profile centroid, run concurrently;
+    each centroid's share of the results follows its share of the user's
+    (decayed) interest. A product found by several centroids keeps its
+    best score.
+    """
+    profile = taste_profiles.get(user_id)
+    queries = profile.query_vectors() if profile is not None else []
+    if not queries:
+        raise HTTPException(status_code=404, detail="No history for this user yet")
+
+    batch_hits = await asyncio.gather(*(
+        run_in_threadpool(search_products, vector, None, mall, max(1, round(limit * share)) + 5)
+        for vector, share in queries
+    ))
+
+    best = {}
+    for hits in batch_hits:
+        for hit in hits:
+            product = hit.payload.get(PRODUCT_KEY) or str(hit.id)
+            if product not in best or hit.score > best[product].score:
+                best[product] = hit
+    ranked = sorted(best.values(), key=lambda hit: hit.score, reverse=True)[:limit]
+    return {"user_id": user_id, "centroids": len(queries), "matches": format_hits(ranked)}
+
+@app.post("/complete_outfit")
+async def complete_outfit(
+    # Either a catalog item...
+    point_id: str = Form(None),
+    # ...or a photo of the item (optionally cropped to a detection)
+    file: UploadFile = File(None),
+    x1: int = Form(None),
+    y1: int = Form(None),
+    x2: int = Form(None),
+    y2: int = Form(None),
+    mall: str = Form(None),
+    per_slot: int = Form(5),
+):
+    """
+    "Vibe-Check" outfit completion. Finds items in complementary categories
+    that share the anchor item's style tags, one filtered grouped product
+    search per slot, run concurrently (a product fills one slot position
+    whatever its number of views). Catalog style tags were computed at
+    /add, so no model runs for the candidates.
+    Slots with no style match are retried without the style filter.
+    """
+    if point_id:
+        _, point = router.locate(
+            point_id, with_vectors=True, with_payload=["category_tag", "style_tags"]
+        )
+        if point is None:
+            raise HTTPException(status_code=404, detail="Unknown item")
+        vector = point.vector
+        category = point.payload.get("category_tag")
+        style_tags = point.payload.get("style_tags") or []
+    elif file is not None:
+        if all(v is not None for v in [x1, y1, x2, y2]):
+            image_bytes, content_type = await run_in_threadpool(
+                decode_crop, await file.read(), (x1, y1, x2, y2)
+            )
+            upload = ("cropped_selection.png", image_bytes, content_type)
+        else:
+            upload, _ = await shrunk_upload_file(file, VECTORIZE_MAX_SIDE)
+        async with httpx.AsyncClient() as http_client:
+            vis_response = await http_client.post(
+                f"{VISUAL_URL}/vectorize", files={"file": upload}, timeout=30.0
+            )
+            data = vis_response.json()
         vector = data.get("vector")
-        detected_category = data.get("category")
+        category = data.get("category")
+        style_tags = data.get("style_tags") or []
+        if not vector:
+            raise HTTPException(status_code=400, detail="Could not vectorize image")
+    else:
+        raise HTTPException(status_code=400, detail="Send a point_id or an image file")
 
-    point_id = str(uuid.uuid4())
-    payload = {
-        "name": name, "store_name": store, "floor_level": level, 
-        "mall_name": mall, "filename": file.filename, 
-        "category_tag": detected_category
+    slots = complementary_slots(category)
+
+    async def run_batch(slot_names, tags):
+        return await asyncio.gather(*(
+            run_in_threadpool(search_products, vector, slot_filter(slot, tags), mall, per_slot)
+            for slot in slot_names
+        ))
+
+    outfit = dict(zip(slots, (format_hits(hits) for hits in await run_batch(slots, style_tags))))
+    empty = [slot for slot in slots if not outfit[slot]]
+    if style_tags and empty:
+        outfit.update(zip(empty, (format_hits(hits) for hits in await run_batch(empty, None))))
+
+    return {
+        "category": category,
+        "style_tags": style_tags,
+        "outfit": outfit,
+        "relaxed_slots": empty if style_tags else []
     }
 
-    client.upsert(
-        collection_name=COLLECTION_NAME,
-        points=[PointStruct(id=point_id, vector=vector, payload=payload)]
-    )
-    return {"status": "saved", "item": name}
\ No newline at end of file
+@app.get("/dedup/stats")
+def dedup_stats():
+    """Points vs. listings — how much near-duplicate collapse shrank the index."""
+    return deduplicator.stats()
+
+@app.get("/reindex/status")
+def reindex_status():
+    """Progress of the current (or last) blue/green reindex, per collection."""
+    return reindexer.status()
+
+@app.post("/reindex/start")
+def reindex_start(max_per_s: float = None):
+    """
+    Re-embeds every catalog item through REINDEX_VISUAL_URL into a new
+    generation of each collection, in the background and at most max_per_s
+    items per second. Live search keeps using the current generation.
+    An interrupted or stopped job resumes from its checkpoint.
+    """
+    return {"status": reindexer.start(max_per_s), **reindexer.status()}
+
+@app.post("/reindex/stop")
+def reindex_stop():
+    """Stops after the current batch; /reindex/start resumes from the checkpoint."""
+    reindexer.stop()
+    return {"status": "stopping"}
+
+@app.post("/reindex/verify")
+def reindex_verify():
+    """Top-k recall of the new generation against the live one, on a sample of items."""
+    try:
+        return reindexer.verify()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/reindex/switch", status_code=202)
+def reindex_switch(force: bool = False):
+    """
+    In the background: catches the new generation up with items added
+    meanwhile, checks its recall and swaps every live alias to it in one
+    atomic alias update (/reindex/status shows "switched", or the error).
+    force=true switches even if recall is below REINDEX_MIN_RECALL or
+    some items could not be re-embedded.
+    """
+    try:
+        return reindexer.switch(force=force)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/projection/status")
+def projection_status():
+    """Loaded projection version, which collections search compact-first, and its fit report."""
+    if router.projection is None:
+        return {"enabled": False}
+    return {"enabled": True, **router.projection.stats(client)}
+
+@app.post("/projection/reload")
+def projection_reload():
+    """Picks up the artifact fit_projection.py just wrote (no restart needed)."""
+    router.projection = Projection.load()
+    result_cache.bump_version()
+    return projection_status()
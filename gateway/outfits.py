@@ -0,0 +1,57 @@
+# =============================================================================
+# outfits.py
+# "Vibe-Check" outfit completion rules
+#
+# Every catalog item carries style_tags (computed once at /add by the visual
+# engine from its CLIP embedding vs. a set of cached style prompts). To
+# complete an outfit, each complementary slot gets one filtered query:
+# category in the slot AND at least one shared style tag. All slots go to
+# Qdrant in a single search_batch request (the mall scope is applied by
+# routing.CollectionRouter).
+# =============================================================================
+
+from qdrant_client.http import models
+
+# CLIP category labels (LocusVisualizer.clip_labels) grouped into outfit slots
+OUTFIT_SLOTS = {
+    "dress":     ["dress"],
+    "top":       ["shirt", "t-shirt"],
+    "bottom":    ["jeans", "pants", "skirt", "shorts"],
+    "outerwear": ["jacket", "coat"],
+    "shoes":     ["shoes", "sneakers"],
+    "bag":       ["bag", "handbag"],
+    "accessory": ["hat", "glasses", "watch"],
+}
+
+# Which slots complete an item in a given slot
+COMPLEMENTARY_SLOTS = {
+    "dress":     ["outerwear", "shoes", "bag", "accessory"],
+    "top":       ["bottom", "outerwear", "shoes", "bag"],
+    "bottom":    ["top", "outerwear", "shoes", "bag"],
+    "outerwear": ["top", "bottom", "shoes", "bag"],
+    "shoes":     ["top", "bottom", "bag"],
+    "bag":       ["dress", "top", "bottom", "shoes"],
+    "accessory": ["dress", "top", "bottom", "shoes"],
+}
+
+# Unknown category (CLIP wasn't confident): suggest the basics
+DEFAULT_SLOTS = ["top", "bottom", "shoes", "bag"]
+
+
+def slot_for(category):
+    for slot, categories in OUTFIT_SLOTS.items():
+        if category in categories:
+            return slot
+    return None
+
+
+def complementary_slots(category):
+    return COMPLEMENTARY_SLOTS.get(slot_for(category), DEFAULT_SLOTS)
+
+
+def slot_filter(slot, style_tags=None):
+    """Items in the slot's categories, sharing a style tag if given."""
+    must = [models.FieldCondition(key="category_tag", match=models.MatchAny(any=OUTFIT_SLOTS[slot]))]
+    if style_tags:
+        must.append(models.FieldCondition(key="style_tags", match=models.MatchAny(any=style_tags)))
+    return models.Filter(must=must)
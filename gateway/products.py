@@ -0,0 +1,64 @@
+# =============================================================================
+# products.py
+# Multi-view products: several points, one product_id
+#
+# A product can be photographed from several sides (Front, Back,
+# Lifestyle...). /add_product stores each view as its own point with the
+# same "product_id" (and its "view" name); a plain /add item is a product
+# with one view, its product_id being its point id.
+#
+# Searches group by product_id (Qdrant search_groups, group_size 1), so a
+# product fills one result slot, scored by its best-matching view, and
+# the grouping happens inside the vector store instead of over-fetching
+# and deduplicating here.
+#
+# Points without a product_id take no part in grouped searches. Items
+# stored before products existed get product_id = point id from
+# backfill_product_ids() (gateway startup and repair_db.py).
+# =============================================================================
+
+from qdrant_client.http import models
+
+PRODUCT_KEY = "product_id"
+VIEW_KEY = "view"
+
+# View names used when /add_product isn't told them
+DEFAULT_VIEWS = ("front", "back", "lifestyle")
+
+SCROLL_BATCH = 256
+
+
+def view_names(views, count):
+    """The view name of each of `count` files from a comma-separated form field."""
+    names = [v.strip().lower() for v in (views or "").split(",") if v.strip()]
+    if names and len(names) != count:
+        raise ValueError(f"{len(names)} view names for {count} files")
+    if not names:
+        names = [DEFAULT_VIEWS[i] if i < len(DEFAULT_VIEWS) else f"view{i + 1}" for i in range(count)]
+    return names
+
+
+def best_views(groups):
+    """search_groups result → its best hit per product, best product first."""
+    return [group.hits[0] for group in groups if group.hits]
+
+
+def backfill_product_ids(client, collection_name):
+    """Gives every point without a product_id its own point id. Returns how many."""
+    missing = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key=PRODUCT_KEY))])
+    updated = 0
+    while True:
+        # Updated points drop out of the filter, so always read the first page
+        points, _ = client.scroll(
+            collection_name=collection_name, scroll_filter=missing, limit=SCROLL_BATCH,
+            with_payload=False, with_vectors=False
+        )
+        if not points:
+            return updated
+        client.batch_update_points(collection_name=collection_name, update_operations=[
+            models.SetPayloadOperation(set_payload=models.SetPayload(
+                payload={PRODUCT_KEY: str(point.id)}, points=[point.id]
+            ))
+            for point in points
+        ])
+        updated += len(points)
@@ -0,0 +1,248 @@
+# =============================================================================
+# projection.py
+# Optional compact first stage: PCA-projected vectors, rescored in full
+#
+# Every search scores 512-d CLIP vectors. fit_projection.py fits a PCA
+# projection (e.g. 512 → 128) on the catalog offline and writes a versioned
+# artifact. Each live collection then gets a compact companion collection,
+# <live>-pca<version>: the same point ids, the projected vector, and only the
+# payload fields searches filter on. Searches through the router become:
+#
+#   1. project the query, search the companion for limit * PROJECTION_OVERSAMPLE
+#      candidates (same filter)
+#   2. retrieve those candidates' full vectors from the live collection
+#   3. rescore them by exact 512-d cosine in numpy, keep the top `limit`
+#
+# Scores are full cosine similarities, so callers see no difference apart
+# from recall (reported by fit_projection.py).
+#
+# A companion is only used while its live collection still points at the
+# generation it was built from (recorded in the manifest). After a reindex
+# switch, or for a mall added after the fit, that collection falls back to
+# the full search until fit_projection.py is run again. The gateway keeps
+# companions it uses up to date on /add.
+#
+# Artifact: PROJECTION_DIR/current.json (manifest) → projection-v<N>.npz
+# (mean, components). Reloaded by POST /projection/reload.
+#
+# Env:
+#     PROJECTION_DIR         artifacts from fit_projection.py   (default ./projection)
+#     PROJECTION_OVERSAMPLE  first-stage candidates per result  (default 4)
+# =============================================================================
+
+import os
+import json
+import threading
+
+import numpy as np
+from qdrant_client.http import models
+from qdrant_client.http.models import Distance, VectorParams, PointStruct, ScoredPoint
+
+from routing import alias_targets
+
+PROJECTION_DIR        = os.getenv("PROJECTION_DIR", "./projection")
+PROJECTION_OVERSAMPLE = int(os.getenv("PROJECTION_OVERSAMPLE", "4"))
+
+MANIFEST = "current.json"
+
+# Payload copied into the companion: what search filters look at
+# (and product_id, which grouped searches group by)
+FILTER_FIELDS = ("name", "mall_name", "category_tag", "style_tags", "location", "product_id")
+KEYWORD_FIELDS = ("mall_name", "category_tag", "style_tags", "product_id")
+
+
+def companion_name(live_name, version):
+    return f"{live_name}-pca{version}"
+
+
+def artifact_name(version):
+    return f"projection-v{version}.npz"
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def filter_payload(payload):
+    return {field: payload[field] for field in FILTER_FIELDS if field in (payload or {})}
+
+
+def create_companion(client, name, dim):
+    """Creates a companion collection and its filter indexes (idempotent)."""
+    if not client.collection_exists(collection_name=name):
+        client.create_collection(
+            collection_name=name,
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+        )
+    for field in KEYWORD_FIELDS:
+        client.create_payload_index(
+            collection_name=name, field_name=field,
+            field_schema=models.PayloadSchemaType.KEYWORD
+        )
+    client.create_payload_index(
+        collection_name=name, field_name="location",
+        field_schema=models.PayloadSchemaType.GEO
+    )
+
+
+class Projection:
+    def __init__(self, mean, components, manifest):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)   # (dim, 512)
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.dim = len(self.components)
+        self.oversample = PROJECTION_OVERSAMPLE
+        self._covered = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, directory=PROJECTION_DIR):
+        """The current artifact, or None when no projection has been fitted."""
+        try:
+            with open(os.path.join(directory, MANIFEST)) as f:
+                manifest = json.load(f)
+            with np.load(os.path.join(directory, manifest["file"])) as artifact:
+                return cls(artifact["mean"], artifact["components"], manifest)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Projection artifact unreadable, searching full vectors: {e}")
+            return None
+
+    def project(self, vectors):
+        """Full vectors → unit-length compact vectors."""
+        return normalize((normalize(vectors) - self.mean) @ self.components.T)
+
+    def companion(self, live_name):
+        return companion_name(live_name, self.version)
+
+    # -------------------------------------------------------------------------
+    # Which collections use it
+    # -------------------------------------------------------------------------
+    def covers(self, client, live_name):
+        """True if live_name's companion was built from its current generation."""
+        with self._lock:
+            if live_name in self._covered:
+                return self._covered[live_name]
+        built_from = self.manifest.get("collections", {}).get(live_name)
+        covered = (
+            built_from is not None
+            and alias_targets(client).get(live_name, live_name) == built_from
+            and client.collection_exists(collection_name=self.companion(live_name))
+        )
+        with self._lock:
+            self._covered[live_name] = covered
+        return covered
+
+    def invalidate(self):
+        """Re-checks coverage on the next search (after a reindex switch)."""
+        with self._lock:
+            self._covered.clear()
+
+    def stats(self, client):
+        names = self.manifest.get("collections", {})
+        return {
+            "version": self.version,
+            "dim": self.dim,
+            "fitted_at": self.manifest.get("fitted_at"),
+            "oversample": self.oversample,
+            "collections": {name: self.covers(client, name) for name in names},
+            "report": self.manifest.get("report"),
+        }
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+    def upsert(self, client, live_name, points):
+        """Mirrors new points into live_name's companion, if it's in use."""
+        if not points or not self.covers(client, live_name):
+            return
+        compact = self.project([p.vector for p in points])
+        client.upsert(collection_name=self.companion(live_name), points=[
+            PointStruct(id=p.id, vector=v.tolist(), payload=filter_payload(p.payload))
+            for p, v in zip(points, compact)
+        ])
+
+    # -------------------------------------------------------------------------
+    # Two-stage search
+    # -------------------------------------------------------------------------
+    def _fetch(self, client, live_name, candidates, with_payload):
+        """{point id: point with its full vector} for first-stage hits."""
+        ids = list({hit.id: None for hit in candidates})
+        if not ids:
+            return {}
+        points = client.retrieve(
+            collection_name=live_name, ids=ids, with_payload=with_payload, with_vectors=True
+        )
+        return {p.id: p for p in points}
+
+    @staticmethod
+    def _rescore(query_vector, candidates, full, limit, with_payload, score_threshold=None):
+        points = [full[hit.id] for hit in candidates if hit.id in full]
+        if not points:
+            return []
+        scores = normalize([p.vector for p in points]) @ normalize(query_vector)
+        order = np.argsort(-scores)[:limit]
+        return [
+            ScoredPoint(id=points[i].id, version=0, score=float(scores[i]),
+                        payload=points[i].payload if with_payload else None)
+            for i in order
+            if score_threshold is None or scores[i] >= score_threshold
+        ]
+
+    def search(self, client, live_name, query_vector, query_filter=None, limit=10,
+               with_payload=True, score_threshold=None, **kwargs):
+        """client.search for a covered collection: compact first stage, full rescore."""
+        candidates = client.search(
+            collection_name=self.companion(live_name),
+            query_vector=self.project(query_vector).tolist(),
+            query_filter=query_filter, limit=limit * self.oversample,
+            with_payload=False
+        )
+        full = self._fetch(client, live_name, candidates, with_payload)
+        return self._rescore(query_vector, candidates, full, limit, with_payload, score_threshold)
+
+    def search_groups(self, client, live_name, query_vector, group_by, query_filter=None, limit=10,
+                      group_size=1, with_payload=True, score_threshold=None, **kwargs):
+        """
+        client.search_groups for a covered collection: the compact stage
+        finds candidate groups, the full rescore ranks them and their hits.
+        """
+        compact = client.search_groups(
+            collection_name=self.companion(live_name),
+            query_vector=self.project(query_vector).tolist(), group_by=group_by,
+            query_filter=query_filter, limit=limit * self.oversample,
+            group_size=group_size, with_payload=False
+        ).groups
+        group_of = {hit.id: group.id for group in compact for hit in group.hits}
+        candidates = [hit for group in compact for hit in group.hits]
+        full = self._fetch(client, live_name, candidates, with_payload)
+        rescored = self._rescore(query_vector, candidates, full, len(candidates),
+                                 with_payload, score_threshold)
+        groups = {}
+        for hit in rescored:
+            hits = groups.setdefault(group_of[hit.id], [])
+            if len(hits) < group_size:
+                hits.append(hit)
+        return [models.PointGroup(id=value, hits=hits) for value, hits in list(groups.items())[:limit]]
+
+    def search_batch(self, client, live_name, requests):
+        """client.search_batch for a covered collection (one retrieve for the whole batch)."""
+        compact = self.project([request.vector for request in requests])
+        batch = client.search_batch(collection_name=self.companion(live_name), requests=[
+            models.SearchRequest(
+                vector=vector.tolist(), filter=request.filter,
+                limit=request.limit * self.oversample, with_payload=False
+            )
+            for request, vector in zip(requests, compact)
+        ])
+        selectors = {repr(request.with_payload) for request in requests}
+        with_payload = requests[0].with_payload if len(selectors) == 1 else True
+        full = self._fetch(client, live_name, [hit for hits in batch for hit in hits], with_payload)
+        return [
+            self._rescore(request.vector, candidates, full, request.limit,
+                          request.with_payload, request.score_threshold)
+            for request, candidates in zip(requests, batch)
+        ]
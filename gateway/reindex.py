@@ -0,0 +1,563 @@
+# =============================================================================
+# reindex.py
+# Zero-downtime re-embedding: blue/green collections behind aliases
+#
+# A new CLIP checkpoint, preprocessing change or rembg model makes every
+# stored vector stale. Instead of dropping locus_items and re-running
+# bulk_upload.py, the catalog is re-embedded into a new generation of each
+# live collection while search keeps reading the current one:
+#
+#   start()   for every live collection (routing.CollectionRouter), scrolls
+#             the items in id order, sends each source image through
+#             REINDEX_VISUAL_URL /vectorize and upserts the new vector (same
+#             point id, same payload, fresh category and style tags) into
+#             <live>-v<N>. At most REINDEX_MAX_PER_S items per second, one
+#             at a time, so live /search latency is unaffected. The scroll
+#             offset is checkpointed to REINDEX_STATE_PATH after every
+#             batch; a stopped or crashed job resumes from there.
+#   verify()  samples items and compares their top-k neighbours in the live
+#             collection (old vectors) with the new generation (new
+#             vectors): recall = shared neighbours / k.
+#   switch()  in the background too: re-embeds items added or merged while
+#             the job ran (at the same throttled rate), verifies, then
+#             pauses catalog writes (router.write_lock) for a last catch-up
+#             and repoints every live alias in ONE update_collection_aliases
+#             call — all malls flip at once, no request ever sees a missing
+#             collection and no write lands on the old generation after its
+#             last catch-up. The previous generation is kept for rollback;
+#             older ones are dropped. on_switch runs afterwards.
+#
+# Source images: /add keeps the vectorized upload in ORIGINALS_DIR (by
+# point id). Items indexed before that are looked up by filename in the
+# demo_images folder (mounted into the gateway by docker-compose).
+#
+# Run the new model as a second visual engine and point REINDEX_VISUAL_URL
+# at it; after the switch, point the gateway's VISUAL_URL at it too.
+#
+# A collection created before aliases existed is moved behind an alias
+# when the job starts: copied as-is (vectors included, no model) into
+# <live>-v0, caught up with writes paused, then replaced by an alias to the
+# copy. The original is only deleted once the copy is complete, and the
+# alias follows right after (a search in those milliseconds fails; no data
+# is at risk). If the alias can't be created, the copy stays and the next
+# /reindex/start (or gateway start) points the alias at it. Generation 0
+# is also the rollback target of that collection's first switch.
+#
+# Env:
+#     REINDEX_VISUAL_URL     visual engine with the new model   (default the live one)
+#     REINDEX_MAX_PER_S      throughput cap, items per second    (default 2)
+#     REINDEX_BATCH          items per upsert / checkpoint       (default 16)
+#     REINDEX_MIN_RECALL     switch() refuses below this         (default 0.7)
+#     REINDEX_RECALL_SAMPLE  items sampled by verify()           (default 50)
+#     REINDEX_STATE_PATH     checkpoint file                     (default ./reindex_state.json)
+#     ORIGINALS_DIR          source images kept by /add          (default ./originals)
+# =============================================================================
+
+import os
+import json
+import time
+import random
+import threading
+
+import httpx
+from qdrant_client.http import models
+from qdrant_client.http.models import PointStruct
+
+from imaging import shrink_upload, VECTORIZE_MAX_SIDE
+from routing import alias_targets, generation_name, generation_of
+
+REINDEX_VISUAL_URL    = os.getenv("REINDEX_VISUAL_URL", "http://visual_engine:8001")
+REINDEX_MAX_PER_S     = float(os.getenv("REINDEX_MAX_PER_S", "2"))
+REINDEX_BATCH         = int(os.getenv("REINDEX_BATCH", "16"))
+REINDEX_MIN_RECALL    = float(os.getenv("REINDEX_MIN_RECALL", "0.7"))
+REINDEX_RECALL_SAMPLE = int(os.getenv("REINDEX_RECALL_SAMPLE", "50"))
+REINDEX_STATE_PATH    = os.getenv("REINDEX_STATE_PATH", "./reindex_state.json")
+ORIGINALS_DIR         = os.getenv("ORIGINALS_DIR", "./originals")
+
+# Same folders main.py serves under /static
+IMAGE_DIRS = ("../demo_images", "./demo_images")
+
+RECALL_K = 10
+SCROLL_BATCH = 256
+
+
+def save_original(point_id, image_bytes):
+    """Keeps the image /add vectorized, so a later reindex can re-embed it."""
+    try:
+        os.makedirs(ORIGINALS_DIR, exist_ok=True)
+        with open(os.path.join(ORIGINALS_DIR, str(point_id)), "wb") as f:
+            f.write(image_bytes)
+    except OSError as e:
+        print(f"⚠️ Could not keep original image: {e}")
+
+
+def load_source(point_id, payload):
+    """(filename, bytes) of the image behind a point, or None if it's gone."""
+    filename = payload.get("filename") or str(point_id)
+    paths = [os.path.join(ORIGINALS_DIR, str(point_id))]
+    if payload.get("filename"):
+        paths += [os.path.join(d, payload["filename"]) for d in IMAGE_DIRS]
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                return filename, f.read()
+    return None
+
+
+class Reindexer:
+    """
+    create_fn(collection_name) creates a physical collection with the
+    catalog's payload indexes (main.create_collection). on_switch() is
+    called after a switch (caches and data derived from the old vectors).
+    """
+
+    def __init__(self, router, create_fn, state_path=REINDEX_STATE_PATH,
+                 visual_url=REINDEX_VISUAL_URL, max_per_s=REINDEX_MAX_PER_S, on_switch=None):
+        self.router = router
+        self.client = router.client
+        self.create_fn = create_fn
+        self.on_switch = on_switch
+        self.state_path = state_path
+        self.visual_url = visual_url
+        self.max_per_s = max_per_s
+        self.state = self._load()
+        if self.state is not None and self.state["phase"] == "switching":
+            # The process stopped mid-switch, before the alias swap
+            self.state["phase"] = "ready"
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def interrupted(self):
+        """A job that was copying when the process stopped (or was stopped)."""
+        return not self.running and self.state is not None and self.state["phase"] == "copying"
+
+    # -------------------------------------------------------------------------
+    # Checkpoint
+    # -------------------------------------------------------------------------
+    def _load(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self):
+        try:
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"⚠️ Could not save reindex checkpoint: {e}")
+
+    def status(self):
+        if self.state is None:
+            return {"phase": "idle", "running": False}
+        collections = self.state["collections"]
+        total = sum(job["total"] for job in collections.values())
+        copied = sum(job["copied"] for job in collections.values())
+        return {
+            **self.state,
+            "running": self.running,
+            "max_per_s": self.max_per_s,
+            "progress_pct": round(100.0 * copied / total, 1) if total else 100.0,
+        }
+
+    # -------------------------------------------------------------------------
+    # Background copy
+    # -------------------------------------------------------------------------
+    def start(self, max_per_s=None):
+        """Starts a new job, or resumes an unfinished one. Returns what it did."""
+        with self._lock:
+            if self.running:
+                return "already_running"
+            if max_per_s is not None:
+                self.max_per_s = max_per_s
+            resumed = self.state is not None and self.state["phase"] in ("copying", "ready")
+            if not resumed:
+                self.state = self._new_job()
+            self.state["phase"] = "copying"
+            self.state["error"] = None
+            self._save()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="reindex", daemon=True)
+            self._thread.start()
+            return "resumed" if resumed else "started"
+
+    def stop(self):
+        self._stop.set()
+
+    def _new_job(self):
+        lives = self.router.collections()
+        names = [c.name for c in self.client.get_collections().collections]
+        generation = 1 + max(
+            [g for live in lives for g in (generation_of(n, live) for n in names) if g is not None],
+            default=0
+        )
+        aliases = alias_targets(self.client)
+        collections = {}
+        for live in lives:
+            shadow = generation_name(live, generation)
+            self.create_fn(shadow)
+            collections[live] = {
+                "shadow": shadow,
+                # Pre-alias collection, moved behind an alias first
+                "migrate": live not in aliases,
+                "offset": None,
+                "total": self.client.count(collection_name=live, exact=True).count,
+                "copied": 0,
+                "skipped": [],
+                "done": False,
+            }
+        return {
+            "generation": generation,
+            "phase": "copying",
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "finished_at": None,
+            "collections": collections,
+            "verification": None,
+            "error": None,
+        }
+
+    def _run(self):
+        try:
+            for live, job in self.state["collections"].items():
+                if job.get("migrate"):
+                    self._migrate(live)
+                    job["migrate"] = False
+                    self._save()
+            with httpx.Client(timeout=60.0) as http:
+                for live, job in self.state["collections"].items():
+                    while not job["done"]:
+                        if self._stop.is_set():
+                            print(f"⏸️ Reindex stopped at {job['copied']}/{job['total']} in {live}")
+                            return
+                        self._copy_batch(http, live, job)
+            self.state["phase"] = "ready"
+            self.state["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            self._save()
+            print(f"✅ Reindex copied generation {self.state['generation']} — POST /reindex/switch")
+        except Exception as e:
+            # Checkpoint still points at the failed batch: /reindex/start retries it
+            self.state["error"] = str(e)
+            self._save()
+            print(f"❌ Reindex paused: {e}")
+
+    def _copy_batch(self, http, live, job):
+        points, next_offset = self.client.scroll(
+            collection_name=live, limit=REINDEX_BATCH, offset=job["offset"],
+            with_payload=True, with_vectors=False,
+        )
+        new_points, skipped = self._reembed_all(http, points)
+        if new_points:
+            self.client.upsert(collection_name=job["shadow"], points=new_points)
+        job["copied"] += len(new_points)
+        job["skipped"] += skipped
+        job["offset"] = next_offset
+        job["done"] = next_offset is None
+        self._save()
+
+    def _reembed_all(self, http, points):
+        """Re-embeds points at no more than max_per_s. Returns (PointStructs, skipped ids)."""
+        interval = 1.0 / self.max_per_s if self.max_per_s > 0 else 0.0
+        new_points, skipped = [], []
+        for point in points:
+            t0 = time.monotonic()
+            new_point = self._reembed(http, point.id, point.payload)
+            if new_point is None:
+                skipped.append(str(point.id))
+            else:
+                new_points.append(new_point)
+            time.sleep(max(0.0, interval - (time.monotonic() - t0)))
+        return new_points, skipped
+
+    def _reembed(self, http, point_id, payload):
+        """Same point with a vector from the new model, or None if it can't be."""
+        source = load_source(point_id, payload)
+        if source is None:
+            return None
+        filename, image_bytes = source
+        try:
+            data, content_type, _ = shrink_upload(image_bytes, VECTORIZE_MAX_SIDE)
+        except Exception:
+            return None
+        response = http.post(
+            f"{self.visual_url}/vectorize", files={"file": (filename, data, content_type)}
+        )
+        if 400 <= response.status_code < 500:
+            return None
+        response.raise_for_status()
+        result = response.json()
+        if not result.get("vector"):
+            return None
+        payload = {
+            **payload,
+            "category_tag": result.get("category"),
+            "style_tags": result.get("style_tags") or [],
+        }
+        return PointStruct(id=point_id, vector=result["vector"], payload=payload)
+
+    # -------------------------------------------------------------------------
+    # Pre-alias collections
+    # -------------------------------------------------------------------------
+    def _migrate(self, live):
+        """Replaces a pre-alias collection by an alias to a full copy, <live>-v0."""
+        target = generation_name(live, 0)
+        if live in alias_targets(self.client):
+            return
+        if not self.client.collection_exists(collection_name=live):
+            # Deleted, but the alias was never created: the copy is complete
+            self._create_alias(live, target)
+            return
+        if self.client.collection_exists(collection_name=target):
+            # Partial copy from an interrupted attempt
+            self.client.delete_collection(collection_name=target)
+        self.create_fn(target)
+        print(f"📦 Copying {live} into {target} (moving it behind an alias)...")
+        self._copy_points(live, target)
+        with self.router.write_lock:
+            self._catch_up(live, target, reembed=False)
+            self.client.delete_collection(collection_name=live)
+            self._create_alias(live, target)
+        print(f"✅ {live} is now an alias of {target}")
+
+    def _create_alias(self, live, target, attempts=3):
+        for attempt in range(attempts):
+            try:
+                self.client.update_collection_aliases(change_aliases_operations=[
+                    models.CreateAliasOperation(create_alias=models.CreateAlias(
+                        collection_name=target, alias_name=live
+                    ))
+                ])
+                return
+            except Exception:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(1.0)
+
+    def _copy_points(self, source, target, ids=None):
+        """Copies points with their vectors and payloads (all of them, or ids)."""
+        offset = None
+        while True:
+            if ids is None:
+                points, offset = self.client.scroll(
+                    collection_name=source, limit=SCROLL_BATCH, offset=offset,
+                    with_payload=True, with_vectors=True,
+                )
+            else:
+                points = self.client.retrieve(
+                    collection_name=source, ids=ids[:SCROLL_BATCH], with_payload=True, with_vectors=True
+                )
+                ids = ids[SCROLL_BATCH:]
+                offset = ids or None
+            if points:
+                self.client.upsert(collection_name=target, points=[
+                    PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points
+                ])
+            if offset is None:
+                return
+
+    # -------------------------------------------------------------------------
+    # Catch-up, recall check and switch
+    # -------------------------------------------------------------------------
+    def _ids(self, collection_name, with_payload=False):
+        """{point id: payload} of a whole collection."""
+        found = {}
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name, limit=SCROLL_BATCH, offset=offset,
+                with_payload=with_payload, with_vectors=False,
+            )
+            found.update((point.id, point.payload) for point in points)
+            if offset is None:
+                return found
+
+    def _catch_up(self, source, shadow, reembed=True):
+        """
+        Brings shadow in line with source: re-embeds items added since they
+        were scrolled, copies listings merged into existing items, drops
+        items that are gone. reembed=False copies new and changed items
+        as they are instead. Returns how many items were added.
+        """
+        source_points = self._ids(source, with_payload=True)
+        shadow_points = self._ids(shadow, with_payload=True if not reembed else ["listings"])
+
+        missing = [point_id for point_id in source_points if point_id not in shadow_points]
+        if not reembed:
+            changed = [
+                point_id for point_id, payload in shadow_points.items()
+                if point_id in source_points and payload != source_points[point_id]
+            ]
+            if missing or changed:
+                self._copy_points(source, shadow, ids=missing + changed)
+        elif missing:
+            with httpx.Client(timeout=60.0) as http:
+                new_points, _ = self._reembed_all(http, [
+                    models.Record(id=point_id, payload=source_points[point_id]) for point_id in missing
+                ])
+            if new_points:
+                self.client.upsert(collection_name=shadow, points=new_points)
+
+        operations = []
+        if reembed:
+            operations = [
+                models.SetPayloadOperation(set_payload=models.SetPayload(
+                    payload={"listings": source_points[point_id].get("listings")}, points=[point_id]
+                ))
+                for point_id, payload in shadow_points.items()
+                if point_id in source_points
+                and payload.get("listings") != source_points[point_id].get("listings")
+            ]
+        gone = [point_id for point_id in shadow_points if point_id not in source_points]
+        if gone:
+            operations.append(models.DeleteOperation(delete=models.PointIdsList(points=gone)))
+        for start in range(0, len(operations), SCROLL_BATCH):
+            self.client.batch_update_points(
+                collection_name=shadow, update_operations=operations[start:start + SCROLL_BATCH]
+            )
+        return len(missing)
+
+    def _recall(self, live, shadow, sample_size, k):
+        """Mean top-k overlap between live and shadow for a sample of shared items."""
+        ids = list(self._ids(shadow))
+        sample = random.sample(ids, min(sample_size, len(ids)))
+        if not sample:
+            return None
+        old = {p.id: p.vector for p in self.client.retrieve(collection_name=live, ids=sample, with_vectors=True)}
+        new = {p.id: p.vector for p in self.client.retrieve(collection_name=shadow, ids=sample, with_vectors=True)}
+        sample = [point_id for point_id in sample if point_id in old and point_id in new]
+        if not sample:
+            return None
+
+        def neighbours(collection_name, vectors):
+            batch = self.client.search_batch(
+                collection_name=collection_name,
+                requests=[models.SearchRequest(vector=vectors[point_id], limit=k + 1) for point_id in sample],
+            )
+            return [
+                {hit.id for hit in hits if hit.id != point_id}
+                for point_id, hits in zip(sample, batch)
+            ]
+
+        overlaps = [
+            len(before & after) / max(1, min(k, len(before)))
+            for before, after in zip(neighbours(live, old), neighbours(shadow, new))
+        ]
+        return sum(overlaps) / len(overlaps)
+
+    def verify(self, sample_size=REINDEX_RECALL_SAMPLE, k=RECALL_K):
+        """Recall of every new generation against its live collection."""
+        if self.state is None or self.state["phase"] not in ("ready", "copying", "switching"):
+            raise RuntimeError("No reindex to verify")
+        per_collection = {}
+        for live, job in self.state["collections"].items():
+            recall = self._recall(live, job["shadow"], sample_size, k)
+            per_collection[live] = None if recall is None else round(recall, 3)
+        measured = [r for r in per_collection.values() if r is not None]
+        self.state["verification"] = {
+            "recall": round(min(measured), 3) if measured else None,
+            "per_collection": per_collection,
+            "k": k,
+            "sampled": sample_size,
+            "checked_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self._save()
+        return self.state["verification"]
+
+    def switch(self, force=False, min_recall=REINDEX_MIN_RECALL):
+        """
+        Starts the switch in the background (catch-up, recall check, alias
+        swap); /reindex/status shows when it's done. Raises RuntimeError
+        if there's nothing to switch to.
+        """
+        with self._lock:
+            if self.running:
+                raise RuntimeError("Reindex is still running")
+            if self.state is None or self.state["phase"] != "ready":
+                raise RuntimeError("Nothing to switch to — run /reindex/start first")
+            self.state["phase"] = "switching"
+            self.state["error"] = None
+            self._save()
+            self._thread = threading.Thread(
+                target=self._run_switch, args=(force, min_recall), name="reindex-switch", daemon=True
+            )
+            self._thread.start()
+            return {"status": "switching", "generation": self.state["generation"]}
+
+    def _run_switch(self, force, min_recall):
+        try:
+            self._switch(force, min_recall)
+        except Exception as e:
+            # Nothing was swapped: the new generation stays ready
+            self.state["phase"] = "ready"
+            self.state["error"] = str(e)
+            self._save()
+            print(f"❌ Reindex switch refused: {e}")
+            return
+        if self.on_switch is not None:
+            try:
+                self.on_switch()
+            except Exception as e:
+                print(f"⚠️ After-switch update failed: {e}")
+
+    def _switch(self, force, min_recall):
+        jobs = self.state["collections"]
+        # Most of the catch-up, with writes still flowing
+        for live, job in jobs.items():
+            self._catch_up(live, job["shadow"])
+        verification = self.verify()
+        skipped = sum(len(job["skipped"]) for job in jobs.values())
+        if not force:
+            if verification["recall"] is not None and verification["recall"] < min_recall:
+                raise RuntimeError(
+                    f"Recall {verification['recall']} is below {min_recall} — use force=true to switch anyway"
+                )
+            if skipped:
+                raise RuntimeError(
+                    f"{skipped} items could not be re-embedded — use force=true to switch without them"
+                )
+
+        # Writes paused: nothing lands on the old generation after its last catch-up
+        with self.router.write_lock:
+            aliases = alias_targets(self.client)
+            unmigrated = [live for live in jobs if live not in aliases]
+            if unmigrated:
+                raise RuntimeError(f"{', '.join(unmigrated)} not behind an alias yet — run /reindex/start")
+            for live, job in jobs.items():
+                self._catch_up(live, job["shadow"])
+            previous = {live: aliases[live] for live in jobs}
+            operations = []
+            for live, job in jobs.items():
+                operations.append(models.DeleteAliasOperation(
+                    delete_alias=models.DeleteAlias(alias_name=live)
+                ))
+                operations.append(models.CreateAliasOperation(create_alias=models.CreateAlias(
+                    collection_name=job["shadow"], alias_name=live
+                )))
+            self.client.update_collection_aliases(change_aliases_operations=operations)
+        self._drop_old_generations(jobs, previous)
+
+        self.state["phase"] = "switched"
+        self.state["previous"] = previous
+        self.state["switched_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._save()
+        print(f"🔀 Switched to generation {self.state['generation']}")
+
+    def _drop_old_generations(self, jobs, previous):
+        """Keeps the new and the previous generation of each live collection."""
+        names = [c.name for c in self.client.get_collections().collections]
+        for live, job in jobs.items():
+            keep = {job["shadow"], previous[live]}
+            for name in names:
+                if generation_of(name, live) is not None and name not in keep:
+                    self.client.delete_collection(collection_name=name)
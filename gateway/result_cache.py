@@ -0,0 +1,113 @@
+# =============================================================================
+# result_cache.py
+# Bounded LRU cache of Qdrant query results
+#
+# The same screenshot searched twice (or the dashboard re-running after a
+# Streamlit rerender) produces the exact same query vector + filter, so the
+# Qdrant round trip can be skipped.
+#
+# Keys hash the query vector's float32 bytes together with the filter, the
+# limit and any rerank parameters — only a bit-identical query hits. Every
+# entry remembers the collection write version it was computed under; /add
+# bumps the version, so anything cached before a catalog write is treated
+# as a miss and dropped on access. Nothing stale is ever served.
+#
+# The version is the one taken *before* the query (version_snapshot()): a
+# result computed while a write landed is not stored at all, rather than
+# stored under the newer version it doesn't reflect.
+#
+# Env:
+#     RESULT_CACHE_MB   memory cap for cached results  (default 32, 0 disables)
+# =============================================================================
+
+import os
+import json
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+RESULT_CACHE_MB = float(os.getenv("RESULT_CACHE_MB", "32"))
+
+
+def query_key(vector, query_filter=None, limit=None, rerank=None):
+    """Hash of the exact query: vector as float32 + filter + limit + rerank params."""
+    digest = hashlib.sha1(struct.pack(f"{len(vector)}f", *vector))
+    digest.update(repr(query_filter).encode())
+    digest.update(repr(limit).encode())
+    digest.update(repr(rerank).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_bytes=int(RESULT_CACHE_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.version = 0
+        self.bytes = 0
+        self._entries = OrderedDict()   # key -> (version, value, size)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.evictions = 0
+
+    def get(self, key):
+        """Cached value for key, or None (missing or from an older write version)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            version, value, size = entry
+            if version != self.version:
+                del self._entries[key]
+                self.bytes -= size
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def version_snapshot(self):
+        """Write version to pass to put(); take it before running the query."""
+        with self._lock:
+            return self.version
+
+    def put(self, key, value, version):
+        """
+        Stores a JSON-serialisable value computed under `version`, evicting
+        least recently used entries. Skipped if a write happened since.
+        """
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (self.version, value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def bump_version(self):
+        """Call after every write to the collection."""
+        with self._lock:
+            self.version += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":   len(self._entries),
+                "bytes":     self.bytes,
+                "max_bytes": self.max_bytes,
+                "version":   self.version,
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "stale":     self.stale,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,241 @@
+# =============================================================================
+# routing.py
+# Collection routing — one collection per mall (SHARDING=mall)
+#
+# With everything in one collection, a search scoped to one mall still
+# walks an HNSW graph that holds every mall, with a mall_name filter on top.
+# In "mall" mode each mall gets its own collection (locus_items__<mall>):
+#
+#   mall-scoped search   → only that mall's collection
+#   cross-mall search    → every mall collection, queried concurrently,
+#                          top-k merged by score
+#   /add                 → routed from the mall form field (collection and
+#                          payload indexes created on first use)
+#   lookups by point id  → all collections (ids are UUIDs, unique overall)
+#
+# Qdrant's custom shard keys would do the same inside one collection but
+# need a distributed (cluster) deployment; docker-compose runs one node.
+#
+# "single" mode (default) keeps the one collection and turns a mall scope
+# into a mall_name filter, so every caller can use the router either way.
+#
+# The names above are the *live* names. Each is a Qdrant alias pointing at
+# a physical generation (locus_items-v1, locus_items__<mall>-v2, ...), so
+# reindex.py can build a new generation and swap the alias atomically.
+# Collections created before aliases existed are used as they are until
+# their first reindex.
+#
+# With a fitted projection (projection.py) set as router.projection, each
+# collection it covers is searched compact-first and rescored in full.
+#
+# Env:
+#     SHARDING               "single" or "mall"                  (default single)
+#     SHARD_FANOUT_WORKERS   concurrent per-collection queries   (default 8)
+# =============================================================================
+
+import os
+import re
+import heapq
+import threading
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+
+from qdrant_client.http import models
+
+SHARDING             = os.getenv("SHARDING", "single")
+SHARD_FANOUT_WORKERS = int(os.getenv("SHARD_FANOUT_WORKERS", "8"))
+
+
+def mall_slug(mall):
+    """'ABC Achrafieh' → 'abc_achrafieh' (safe in a collection name)."""
+    return re.sub(r"[^a-z0-9]+", "_", mall.lower()).strip("_") or "default"
+
+
+def shard_name(base_name, mall):
+    return f"{base_name}__{mall_slug(mall)}"
+
+
+def generation_name(live_name, generation):
+    """Physical collection behind a live name. Slugs never contain "-"."""
+    return f"{live_name}-v{generation}"
+
+
+def generation_of(name, live_name):
+    """Generation number if name is a generation of live_name, else None."""
+    match = re.fullmatch(re.escape(live_name) + r"-v(\d+)", name)
+    return int(match.group(1)) if match else None
+
+
+def alias_targets(client):
+    """{alias name: collection name} for every alias."""
+    return {a.alias_name: a.collection_name for a in client.get_aliases().aliases}
+
+
+class CollectionRouter:
+    """
+    setup_fn(collection_name) must create the collection and its payload
+    indexes if they don't exist yet (idempotent).
+    """
+
+    def __init__(self, client, base_name, setup_fn, mode=SHARDING):
+        self.client = client
+        self.base_name = base_name
+        self.setup_fn = setup_fn
+        self.sharded = mode == "mall"
+        self.projection = None     # projection.Projection, if one is loaded
+        # Held by every ingest write; reindex.py holds it to move a live name
+        # to another collection without a write landing on the old one
+        self.write_lock = threading.RLock()
+        self._known = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=SHARD_FANOUT_WORKERS)
+
+    # -------------------------------------------------------------------------
+    # Which collection(s)
+    # -------------------------------------------------------------------------
+    def collection_for(self, mall):
+        """Write target for an item of this mall (created on first use)."""
+        if not self.sharded:
+            name = self.base_name
+        else:
+            name = shard_name(self.base_name, mall)
+        with self._lock:
+            if name in self._known:
+                return name
+        self.setup_fn(name)
+        with self._lock:
+            self._known.add(name)
+        return name
+
+    def collections(self):
+        """Every live collection (alias or pre-alias collection) that holds catalog items."""
+        if not self.sharded:
+            return [self.base_name]
+        prefix = self.base_name + "__"
+        names = {
+            c.name for c in self.client.get_collections().collections
+            if c.name.startswith(prefix) and "-" not in c.name
+        }
+        names.update(alias for alias in alias_targets(self.client) if alias.startswith(prefix))
+        names = sorted(names)
+        with self._lock:
+            self._known.update(names)
+        return names
+
+    def search_collections(self, mall=None):
+        """Collections a search has to touch: one for a mall scope, else all."""
+        if not self.sharded:
+            return [self.base_name]
+        if mall is None:
+            return self.collections()
+        name = shard_name(self.base_name, mall)
+        return [name] if name in self._known or name in self.collections() else []
+
+    def scope_filter(self, query_filter, mall=None):
+        """
+        Adds the mall scope to a filter. Only needed in single mode — in
+        mall mode the collection itself is the scope.
+        """
+        if mall is None or self.sharded:
+            return query_filter
+        condition = models.FieldCondition(key="mall_name", match=models.MatchValue(value=mall))
+        if query_filter is None:
+            return models.Filter(must=[condition])
+        return models.Filter(
+            must=list(query_filter.must or []) + [condition],
+            should=query_filter.should,
+            must_not=query_filter.must_not,
+        )
+
+    # -------------------------------------------------------------------------
+    # Queries
+    # -------------------------------------------------------------------------
+    def _fan_out(self, names, fn):
+        if len(names) == 1:
+            return [fn(names[0])]
+        return list(self._pool.map(fn, names))
+
+    def _projected(self, name):
+        projection = self.projection
+        return projection if projection is not None and projection.covers(self.client, name) else None
+
+    def _search_one(self, name, **kwargs):
+        projection = self._projected(name)
+        if projection is not None:
+            return projection.search(self.client, name, **kwargs)
+        return self.client.search(collection_name=name, **kwargs)
+
+    def _search_batch_one(self, name, requests):
+        projection = self._projected(name)
+        if projection is not None:
+            return projection.search_batch(self.client, name, requests)
+        return self.client.search_batch(collection_name=name, requests=requests)
+
+    def _search_groups_one(self, name, **kwargs):
+        projection = self._projected(name)
+        if projection is not None:
+            return projection.search_groups(self.client, name, **kwargs)
+        return self.client.search_groups(collection_name=name, **kwargs).groups
+
+    def search(self, query_vector, query_filter=None, limit=10, mall=None, **kwargs):
+        """client.search over the mall's collection, or all of them merged by score."""
+        names = self.search_collections(mall)
+        query_filter = self.scope_filter(query_filter, mall)
+        results = self._fan_out(names, lambda name: self._search_one(
+            name, query_vector=query_vector, query_filter=query_filter, limit=limit, **kwargs
+        ))
+        if len(results) == 1:
+            return results[0]
+        return heapq.nlargest(limit, chain.from_iterable(results), key=lambda hit: hit.score)
+
+    def search_groups(self, query_vector, group_by, query_filter=None, limit=10, group_size=1,
+                      mall=None, **kwargs):
+        """
+        client.search_groups (one group per group_by value, ranked by its
+        best hit) over the mall's collection, or all of them merged.
+        Returns the list of groups.
+        """
+        names = self.search_collections(mall)
+        query_filter = self.scope_filter(query_filter, mall)
+        results = self._fan_out(names, lambda name: self._search_groups_one(
+            name, query_vector=query_vector, group_by=group_by, query_filter=query_filter,
+            limit=limit, group_size=group_size, **kwargs
+        ))
+        if len(results) == 1:
+            return results[0]
+        return heapq.nlargest(limit, chain.from_iterable(results), key=lambda group: group.hits[0].score)
+
+    def search_batch(self, requests, mall=None):
+        """client.search_batch with per-request top-k merged across collections."""
+        if not requests:
+            return []
+        names = self.search_collections(mall)
+        if mall is not None and not self.sharded:
+            requests = [
+                request.copy(update={"filter": self.scope_filter(request.filter, mall)})
+                for request in requests
+            ]
+        per_collection = self._fan_out(names, lambda name: self._search_batch_one(name, requests))
+        if not per_collection:
+            return [[] for _ in requests]
+        if len(per_collection) == 1:
+            return per_collection[0]
+        return [
+            heapq.nlargest(request.limit, chain.from_iterable(hits), key=lambda hit: hit.score)
+            for request, hits in zip(requests, zip(*per_collection))
+        ]
+
+    def locate(self, point_id, **kwargs):
+        """(collection_name, point) for a point id, or (None, None)."""
+        names = self.collections()
+
+        def retrieve(name):
+            try:
+                return self.client.retrieve(collection_name=name, ids=[point_id], **kwargs)
+            except Exception:
+                return []
+
+        for name, points in zip(names, self._fan_out(names, retrieve) if names else []):
+            if points:
+                return name, points[0]
+        return None, None
@@ -0,0 +1,241 @@
+# =============================================================================
+# similarity.py
+# Precomputed "similar items" graph over the catalog
+#
+# Every catalog point stores its top-k neighbours in its own payload
+# ("similar_items"), so "more like this" is one retrieve() by point id —
+# no rembg, no CLIP, no vector search.
+#
+# Neighbours are restricted to the same category_tag and mall_name.
+#
+#   rebuild()   scrolls every vector out of Qdrant, groups them by
+#               (category, mall) and computes each group's top-k with
+#               blocked matrix products in numpy (vectors are already
+#               L2-normalised, so dot product == cosine similarity).
+#   add_point() keeps the graph current after /add: one filtered search for
+#               the new item's neighbours, and the new item is inserted
+#               into any neighbour list it now belongs in.
+#
+# Both write under router.write_lock (ingest holds it around add_point), so
+# a rebuild that scrolled before an ingest batch re-links the new points
+# instead of overwriting their links.
+#
+# Neighbour entries carry the fields the dashboard shows, so /similar never
+# needs a second lookup.
+#
+# Env:
+#     SIMILAR_K   neighbours stored per item   (default 12)
+# =============================================================================
+
+import os
+import time
+import threading
+from collections import defaultdict
+
+import numpy as np
+from qdrant_client.http import models
+
+SIMILAR_K = int(os.getenv("SIMILAR_K", "12"))
+
+PAYLOAD_KEY = "similar_items"
+SUMMARY_FIELDS = ("name", "store_name", "floor_level", "mall_name", "filename", "thumbnails")
+
+BLOCK_ROWS = 1024      # rows per matrix-product block (bounds peak memory)
+SCROLL_BATCH = 256
+WRITE_BATCH = 256
+
+
+def neighbour_entry(point_id, payload, score):
+    """What is stored per neighbour: id, score and the display fields."""
+    entry = {"id": str(point_id), "score": round(float(score), 4)}
+    entry.update({field: payload.get(field) for field in SUMMARY_FIELDS})
+    return entry
+
+
+def group_filter(category, mall):
+    """Same category_tag and mall_name (a missing category matches missing)."""
+    if category:
+        category_condition = models.FieldCondition(key="category_tag", match=models.MatchValue(value=category))
+        return models.Filter(must=[
+            category_condition,
+            models.FieldCondition(key="mall_name", match=models.MatchValue(value=mall)),
+        ])
+    return models.Filter(
+        must=[models.FieldCondition(key="mall_name", match=models.MatchValue(value=mall))],
+        should=[models.IsNullCondition(is_null=models.PayloadField(key="category_tag")),
+                models.IsEmptyCondition(is_empty=models.PayloadField(key="category_tag"))],
+    )
+
+
+def top_k_neighbours(vectors, k):
+    """
+    Row-wise top-k of vectors @ vectors.T, excluding each row itself.
+    Returns (indices, scores), both (n, min(k, n-1)), best first.
+    """
+    n = len(vectors)
+    k = min(k, n - 1)
+    if k <= 0:
+        return np.empty((n, 0), dtype=np.int64), np.empty((n, 0), dtype=np.float32)
+
+    indices = np.empty((n, k), dtype=np.int64)
+    scores = np.empty((n, k), dtype=np.float32)
+    for start in range(0, n, BLOCK_ROWS):
+        block = vectors[start:start + BLOCK_ROWS] @ vectors.T
+        rows = np.arange(block.shape[0])
+        block[rows, start + rows] = -np.inf
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        indices[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+    return indices, scores
+
+
+class SimilarityGraph:
+    """Works per collection of a routing.CollectionRouter (one per mall when sharded)."""
+
+    def __init__(self, router, k=SIMILAR_K):
+        self.router = router
+        self.client = router.client
+        self.k = k
+        self._rebuild_lock = threading.Lock()
+        self.last_rebuild = None
+
+    @property
+    def rebuilding(self):
+        return self._rebuild_lock.locked()
+
+    # -------------------------------------------------------------------------
+    # Full rebuild
+    # -------------------------------------------------------------------------
+    def rebuild(self):
+        """
+        Recomputes every item's neighbour list. Returns a summary dict, or
+        None if a rebuild is already running.
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            return None
+        try:
+            t0 = time.time()
+            items = groups = 0
+            for collection_name in self.router.collections():
+                collection_groups = self._rebuild_collection(collection_name)
+                items += sum(len(points) for points in collection_groups.values())
+                groups += len(collection_groups)
+
+            self.last_rebuild = {
+                "items": items,
+                "groups": groups,
+                "seconds": round(time.time() - t0, 2),
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            print(f"Similarity graph rebuilt: {self.last_rebuild}")
+            return self.last_rebuild
+        finally:
+            self._rebuild_lock.release()
+
+    def _rebuild_collection(self, collection_name):
+        groups = defaultdict(list)
+        for point in self._scroll_all(collection_name):
+            key = (point.payload.get("category_tag"), point.payload.get("mall_name"))
+            groups[key].append(point)
+
+        operations = {}
+        for points in groups.values():
+            vectors = np.asarray([p.vector for p in points], dtype=np.float32)
+            indices, scores = top_k_neighbours(vectors, self.k)
+            for point, row_idx, row_scores in zip(points, indices, scores):
+                neighbours = [
+                    neighbour_entry(points[j].id, points[j].payload, s)
+                    for j, s in zip(row_idx, row_scores)
+                ]
+                operations[str(point.id)] = models.SetPayloadOperation(set_payload=models.SetPayload(
+                    payload={PAYLOAD_KEY: neighbours}, points=[point.id]
+                ))
+
+        # Ingest links new points in with add_point() under the write lock, so
+        # the lists computed above miss anything stored since the scroll.
+        # Writing them under the same lock, then linking those points in,
+        # keeps their links (and skips points deleted meanwhile).
+        with self.router.write_lock:
+            current = {str(p.id) for p in self._scroll_all(collection_name, with_vectors=False, with_payload=False)}
+            writes = [operation for point_id, operation in operations.items() if point_id in current]
+            for start in range(0, len(writes), WRITE_BATCH):
+                self.client.batch_update_points(
+                    collection_name=collection_name,
+                    update_operations=writes[start:start + WRITE_BATCH]
+                )
+            arrived = [point_id for point_id in current if point_id not in operations]
+            if arrived:
+                for point in self.client.retrieve(
+                    collection_name=collection_name, ids=arrived,
+                    with_vectors=True, with_payload=["category_tag", *SUMMARY_FIELDS],
+                ):
+                    self.add_point(point.id, point.vector, point.payload)
+        return groups
+
+    def _scroll_all(self, collection_name, with_vectors=True, with_payload=("category_tag", *SUMMARY_FIELDS)):
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=SCROLL_BATCH,
+                offset=offset,
+                with_vectors=with_vectors,
+                with_payload=list(with_payload) if with_payload else False,
+            )
+            yield from points
+            if offset is None:
+                break
+
+    # -------------------------------------------------------------------------
+    # Incremental update
+    # -------------------------------------------------------------------------
+    def add_point(self, point_id, vector, payload):
+        """
+        Links a freshly upserted point into the graph: stores its own
+        neighbours and inserts it into each neighbour's list where it ranks
+        within the top k.
+        """
+        collection_name = self.router.collection_for(payload.get("mall_name"))
+        hits = self.client.search(
+            collection_name=collection_name,
+            query_vector=vector,
+            query_filter=group_filter(payload.get("category_tag"), payload.get("mall_name")),
+            limit=self.k + 1,
+            with_payload=[PAYLOAD_KEY, *SUMMARY_FIELDS],
+        )
+        hits = [hit for hit in hits if str(hit.id) != str(point_id)][:self.k]
+
+        operations = [models.SetPayloadOperation(set_payload=models.SetPayload(
+            payload={PAYLOAD_KEY: [neighbour_entry(hit.id, hit.payload, hit.score) for hit in hits]},
+            points=[point_id]
+        ))]
+
+        new_entry_fields = {field: payload.get(field) for field in SUMMARY_FIELDS}
+        for hit in hits:
+            neighbours = [n for n in hit.payload.get(PAYLOAD_KEY) or [] if n["id"] != str(point_id)]
+            if len(neighbours) >= self.k and hit.score <= neighbours[-1]["score"]:
+                continue
+            neighbours.append({"id": str(point_id), "score": round(float(hit.score), 4), **new_entry_fields})
+            neighbours.sort(key=lambda n: n["score"], reverse=True)
+            operations.append(models.SetPayloadOperation(set_payload=models.SetPayload(
+                payload={PAYLOAD_KEY: neighbours[:self.k]}, points=[hit.id]
+            )))
+
+        self.client.batch_update_points(
+            collection_name=collection_name, update_operations=operations
+        )
+
+    # -------------------------------------------------------------------------
+    # Lookup
+    # -------------------------------------------------------------------------
+    def similar(self, point_id):
+        """Stored neighbour list for point_id, or None if the point doesn't exist."""
+        _, point = self.router.locate(point_id, with_payload=[PAYLOAD_KEY])
+        if point is None:
+            return None
+        return point.payload.get(PAYLOAD_KEY) or []
+
+    def stats(self):
+        return {"k": self.k, "rebuilding": self.rebuilding, "last_rebuild": self.last_rebuild}
@@ -0,0 +1,161 @@
+# =============================================================================
+# taste_profiles.py
+# Per-user taste-profile vectors for persona recommendations
+#
+# Instead of replaying a user's history (one ANN query per past item, slower
+# as the history grows), each user keeps a handful of running centroids of
+# the CLIP embeddings they searched for or clicked. Updating is O(1) and a
+# recommendation is a single Qdrant request, however long the history.
+#
+# Each centroid is an exponentially decayed weighted mean: before an update
+# all weights are multiplied by 0.5 ** (elapsed / PROFILE_HALF_LIFE_DAYS),
+# so old interests fade. A new embedding joins its closest centroid when
+# the cosine similarity is >= PROFILE_MERGE_SIMILARITY; otherwise it starts
+# a new centroid (up to PROFILE_MAX_CENTROIDS, after which the closest one
+# absorbs it anyway). Users with one style end up with one centroid; users
+# with diverse tastes get a few.
+#
+# Profiles are stored one .npz per user (float16 centroids, ~1 KB per centroid).
+#
+# Env:
+#     PROFILE_DIR               where profile files live     (default ./profiles)
+#     PROFILE_MAX_CENTROIDS     centroids per user           (default 3)
+#     PROFILE_MERGE_SIMILARITY  join threshold (cosine)      (default 0.75)
+#     PROFILE_HALF_LIFE_DAYS    interest half-life           (default 14)
+# =============================================================================
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+PROFILE_DIR              = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MAX_CENTROIDS    = int(os.getenv("PROFILE_MAX_CENTROIDS", "3"))
+PROFILE_MERGE_SIMILARITY = float(os.getenv("PROFILE_MERGE_SIMILARITY", "0.75"))
+PROFILE_HALF_LIFE_DAYS   = float(os.getenv("PROFILE_HALF_LIFE_DAYS", "14"))
+
+# How much one event moves the profile
+INTERACTION_WEIGHTS = {"search": 0.5, "click": 1.0, "save": 2.0}
+
+LOADED_PROFILES_MAX = 10000   # profiles kept in memory (least recently used dropped)
+USER_LOCKS = 64               # striped per user id
+
+
+class TasteProfile:
+    """Up to max_centroids decayed running means of one user's embeddings."""
+
+    def __init__(self, centroids=None, weights=None, updated_at=None):
+        self.centroids = centroids if centroids is not None else np.zeros((0, 0), dtype=np.float32)
+        self.weights = weights if weights is not None else np.zeros(0, dtype=np.float32)
+        self.updated_at = updated_at or time.time()
+
+    def decayed_weights(self, now=None):
+        elapsed_days = ((now or time.time()) - self.updated_at) / 86400.0
+        return self.weights * 0.5 ** (max(elapsed_days, 0.0) / PROFILE_HALF_LIFE_DAYS)
+
+    def update(self, vector, weight=1.0, now=None):
+        now = now or time.time()
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        self.weights = self.decayed_weights(now)
+        self.updated_at = now
+
+        if len(self.weights) == 0:
+            self.centroids = vector[None, :].copy()
+            self.weights = np.array([weight], dtype=np.float32)
+            return
+
+        similarity = self.centroids @ vector
+        best = int(np.argmax(similarity))
+        if similarity[best] < PROFILE_MERGE_SIMILARITY and len(self.weights) < PROFILE_MAX_CENTROIDS:
+            self.centroids = np.vstack([self.centroids, vector])
+            self.weights = np.append(self.weights, np.float32(weight))
+            return
+
+        total = self.weights[best] + weight
+        merged = (self.weights[best] * self.centroids[best] + weight * vector) / total
+        self.centroids[best] = merged / (np.linalg.norm(merged) or 1.0)
+        self.weights[best] = total
+
+    def query_vectors(self, now=None):
+        """[(unit vector, share of the total weight)], strongest interest first."""
+        weights = self.decayed_weights(now)
+        total = float(weights.sum())
+        if total <= 0:
+            return []
+        order = np.argsort(-weights)
+        return [(self.centroids[i].tolist(), float(weights[i]) / total) for i in order]
+
+
+class TasteProfileStore:
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self._profiles = OrderedDict()   # user_id -> TasteProfile
+        self._lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(USER_LOCKS)]
+
+    def _path(self, user_id):
+        name = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.npz")
+
+    def get(self, user_id):
+        """The user's profile, or None if they have no history yet."""
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is not None:
+                self._profiles.move_to_end(user_id)
+                return profile
+        path = self._path(user_id)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            profile = TasteProfile(
+                centroids=data["centroids"].astype(np.float32),
+                weights=data["weights"].astype(np.float32),
+                updated_at=float(data["updated_at"]),
+            )
+        return self._remember(user_id, profile)
+
+    def record(self, user_id, vector, kind="click"):
+        """Folds one searched/clicked embedding into the user's profile and saves it."""
+        weight = INTERACTION_WEIGHTS.get(kind, 1.0)
+        # Get-or-create, update and save are one step per user: two events
+        # for a user who isn't loaded would otherwise each build a profile
+        # and one of the updates would be lost
+        with self._user_locks[hash(user_id) % USER_LOCKS]:
+            profile = self.get(user_id) or self._remember(user_id, TasteProfile())
+            with self._lock:
+                profile.update(vector, weight)
+                centroids = profile.centroids.astype(np.float16)
+                weights = profile.weights.copy()
+                updated_at = profile.updated_at
+            self._save(user_id, centroids, weights, updated_at)
+        return profile
+
+    def _remember(self, user_id, profile):
+        """Caches the profile unless one is cached already; returns the cached one."""
+        with self._lock:
+            profile = self._profiles.setdefault(user_id, profile)
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > LOADED_PROFILES_MAX:
+                self._profiles.popitem(last=False)
+            return profile
+
+    def _save(self, user_id, centroids, weights, updated_at):
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(user_id)
+            # Unique temp name: a fixed one could be overwritten by another save mid-write
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp.npz", dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, centroids=centroids, weights=weights, updated_at=np.float64(updated_at))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ Could not save taste profile: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
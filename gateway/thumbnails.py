@@ -0,0 +1,87 @@
+# =============================================================================
+# thumbnails.py
+# Small derivatives of catalog images, made once at ingest
+#
+# The dashboard's results grid used to load every match's full-size image.
+# Now the ingest worker writes two thumbnails per new point, THUMB_SIZE px
+# on the long side, next to the kept originals:
+#
+#   <THUMBS_DIR>/<point id>.webp   what the dashboard shows
+#   <THUMBS_DIR>/<point id>.jpg    for clients without WebP
+#
+# and records their URLs in the point's "thumbnails" payload. /thumbs serves
+# them with a one-year immutable Cache-Control: a point's image never
+# changes (duplicates merge into the first point, reindexing keeps ids).
+# Points ingested before this existed get theirs made on first request,
+# from the same source images a reindex uses.
+#
+# Env:
+#     THUMBS_DIR     where thumbnails are written    (default ./originals/thumbs)
+#     THUMB_SIZE     long side, px                   (default 256)
+#     THUMB_QUALITY  WebP / JPEG quality             (default 80)
+# =============================================================================
+
+import io
+import os
+import re
+
+from PIL import Image
+
+THUMBS_DIR    = os.getenv("THUMBS_DIR", "./originals/thumbs")
+THUMB_SIZE    = int(os.getenv("THUMB_SIZE", "256"))
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "80"))
+
+# extension -> (Pillow format, media type)
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpg":  ("JPEG", "image/jpeg"),
+}
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Qdrant point ids: UUIDs or unsigned integers
+POINT_ID = re.compile(r"^[0-9a-fA-F-]{1,36}$")
+
+
+def thumbnail_path(point_id, ext):
+    return os.path.join(THUMBS_DIR, f"{point_id}.{ext}")
+
+
+def thumbnail_urls(point_id, payload=None):
+    """The "thumbnails" payload of a point (gateway-relative URLs)."""
+    stored = (payload or {}).get("thumbnails")
+    if stored:
+        return stored
+    return {ext: f"/thumbs/{point_id}.{ext}" for ext in FORMATS}
+
+
+def make_thumbnails(point_id, image_bytes):
+    """
+    Writes the WebP and JPEG thumbnails of an image. Returns the
+    "thumbnails" payload, or None if the image couldn't be decoded.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("RGB", (THUMB_SIZE, THUMB_SIZE))
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+    except Exception as e:
+        print(f"⚠️ Could not make thumbnails for {point_id}: {e}")
+        return None
+
+    # JPEG has no alpha: cut-outs go on white
+    flat = image
+    if image.mode == "RGBA":
+        flat = Image.new("RGB", image.size, "white")
+        flat.paste(image, mask=image.getchannel("A"))
+
+    try:
+        os.makedirs(THUMBS_DIR, exist_ok=True)
+        for ext, (fmt, _) in FORMATS.items():
+            path = thumbnail_path(point_id, ext)
+            with open(path + ".tmp", "wb") as f:
+                (image if fmt == "WEBP" else flat).save(f, format=fmt, quality=THUMB_QUALITY)
+            os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"⚠️ Could not write thumbnails for {point_id}: {e}")
+        return None
+    return thumbnail_urls(point_id)
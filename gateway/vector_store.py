@@ -0,0 +1,103 @@
+# =============================================================================
+# vector_store.py
+# Pluggable vector store: Qdrant, or an embedded memory-mapped backend
+#
+# Everything that reads or writes the catalog (the gateway, bulk_upload.py,
+# repair_db.py) gets its client from connect() instead of constructing a
+# QdrantClient. VectorStore is a typing.Protocol listing the part of the
+# QdrantClient API the codebase uses — same method names, arguments and
+# qdrant_client models — so a backend only has to implement that subset
+# (structurally: QdrantClient and EmbeddedStore both satisfy it without
+# inheriting from it; tests/test_embedded_store.py checks both):
+#
+#   VECTOR_STORE=qdrant    QdrantClient against the qdrant service (default)
+#   VECTOR_STORE=embedded  embedded_store.EmbeddedStore: files under
+#                          VECTOR_STORE_PATH, no service to run. Meant for
+#                          tests and small single-node deployments, and for
+#                          comparing against Qdrant on the same workload.
+#
+# The embedded store has one writer: run the gateway *or* a script that
+# writes, not both, on the same directory.
+#
+# Env:
+#     VECTOR_STORE       "qdrant" or "embedded"      (default qdrant)
+#     VECTOR_STORE_PATH  embedded store directory    (default ./vector_store)
+# =============================================================================
+
+import os
+from typing import Protocol, runtime_checkable
+
+VECTOR_STORE      = os.getenv("VECTOR_STORE", "qdrant")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./vector_store")
+
+
+@runtime_checkable
+class VectorStore(Protocol):
+    """
+    The QdrantClient methods Locus relies on. QdrantClient satisfies this
+    as is; other backends implement the same methods. Filters, points and
+    results are qdrant_client.http.models objects either way.
+    """
+
+    # Collections and aliases
+    def get_collections(self):
+        ...
+
+    def collection_exists(self, collection_name):
+        ...
+
+    def create_collection(self, collection_name, vectors_config):
+        ...
+
+    def delete_collection(self, collection_name):
+        ...
+
+    def create_payload_index(self, collection_name, field_name, field_schema=None):
+        ...
+
+    def get_aliases(self):
+        ...
+
+    def update_collection_aliases(self, change_aliases_operations):
+        ...
+
+    # Points
+    def upsert(self, collection_name, points):
+        ...
+
+    def set_payload(self, collection_name, payload, points):
+        ...
+
+    def batch_update_points(self, collection_name, update_operations):
+        ...
+
+    def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False):
+        ...
+
+    def scroll(self, collection_name, scroll_filter=None, limit=10, offset=None,
+               with_payload=True, with_vectors=False):
+        ...
+
+    def count(self, collection_name, count_filter=None, exact=True):
+        ...
+
+    # Search
+    def search(self, collection_name, query_vector, query_filter=None, limit=10, offset=0,
+               with_payload=True, with_vectors=False, score_threshold=None):
+        ...
+
+    def search_batch(self, collection_name, requests):
+        ...
+
+    def search_groups(self, collection_name, query_vector, group_by, query_filter=None, limit=10,
+                      group_size=1, with_payload=True, with_vectors=False, score_threshold=None):
+        ...
+
+
+def connect(host="qdrant", port=6333) -> VectorStore:
+    """The configured backend (host/port only matter for Qdrant)."""
+    if VECTOR_STORE == "embedded":
+        from embedded_store import EmbeddedStore
+        return EmbeddedStore(VECTOR_STORE_PATH)
+    from qdrant_client import QdrantClient
+    return QdrantClient(host=host, port=port)
@@ -0,0 +1,413 @@
+# LOCUS: ann_index.py
+# Approximate nearest-neighbour index (IVF-PQ + exact refine) for large candidate sets
+#
+# LocusRanker scores every candidate it is sent, so its cost grows linearly
+# with the candidate set. For million-scale candidate matrices the ranking
+# engine can keep an IVF-PQ index instead:
+#
+#   IVF     a k-means coarse quantizer splits the vectors into `nlist` lists.
+#           A query only scans the `nprobe` lists whose centroids score best.
+#   PQ      each vector's residual to its list centroid is stored as `m` one-
+#           byte codes (one per sub-space, 256 centroids each). Scores come
+#           from a per-query lookup table: centroid score + m table entries.
+#   refine  PQ scores are coarse, so the best k * refine candidates are
+#           re-scored exactly against the float16 vectors kept on disk.
+#
+# nprobe and refine are the recall/latency knobs (per request, or
+# ANN_NPROBE / ANN_REFINE). Vectors are L2-normalised on the way in, so
+# scores are cosine similarities.
+#
+# Persistence: a directory. The inverted lists are stored CSR-style (codes
+# and row numbers sorted by list + list offsets) as .npy; the float16
+# vectors and the ids live in append-only files indexed by row number. All
+# of them are opened memory-mapped, so loading is instant and pages are read
+# on demand. Inserts append rows and go to a small "tail" (saved with every
+# add) that is scanned alongside the lists and merged into them at TAIL_MAX.
+#
+# Concurrency: add() and merges never modify an array, they build new ones
+# and swap them in under the lock. search() copies the references under the
+# same lock, so it always sees one consistent state (never a half-merged
+# tail), then scores without holding it. add() encodes outside the lock.
+# build() trains and fills a staged index in <dir>.build and swaps it in at
+# the end, so searches keep answering from the old index during a rebuild.
+#
+# Env:
+#     ANN_NLIST         lists built by /index/build           (default 1024)
+#     ANN_M             PQ sub-spaces (must divide the dim)    (default 64)
+#     ANN_NPROBE        lists scanned per query                (default 16)
+#     ANN_REFINE        candidates re-scored exactly, x k      (default 16, 0 = off)
+#     ANN_TRAIN_SAMPLE  vectors k-means is trained on          (default 65536)
+
+import os
+import json
+import shutil
+import threading
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+ANN_NLIST        = int(os.getenv("ANN_NLIST", "1024"))
+ANN_M            = int(os.getenv("ANN_M", "64"))
+ANN_NPROBE       = int(os.getenv("ANN_NPROBE", "16"))
+ANN_REFINE       = int(os.getenv("ANN_REFINE", "16"))
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "65536"))
+
+# Everything build() swaps in from the staged index
+STATE = ("centroids", "codebooks", "offsets", "codes", "rows", "tail_codes",
+         "tail_rows", "tail_lists", "vectors", "row_ids", "count")
+
+KSUB = 256            # centroids per PQ sub-space (one byte per code)
+TAIL_MAX = 65536      # inserted rows kept outside the lists before a merge
+BLOCK_ROWS = 16384    # rows assigned / encoded per matrix product
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(data, k, seed=0):
+    """Cluster centres of data (MiniBatchKMeans, good enough for quantizers)."""
+    k = min(k, len(data))
+    model = MiniBatchKMeans(n_clusters=k, n_init=1, max_iter=20, batch_size=4096, random_state=seed)
+    return model.fit(data).cluster_centers_.astype(np.float32)
+
+
+class IVFPQIndex:
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.centroids = None      # (nlist, dim)
+        self.codebooks = None      # (m, ksub, dim / m)
+        self.offsets = None        # (nlist + 1,) start of each list in codes / rows
+        self.codes = None          # (n, m) uint8, sorted by list
+        self.rows = None           # (n,) row numbers, sorted by list
+        self.tail_codes = None     # inserted since the last merge
+        self.tail_rows = None
+        self.tail_lists = None
+        self.vectors = None        # (count, dim) float16, by row number
+        self.row_ids = None        # (count,) int64 id of each row
+        self.count = 0
+        self.nprobe = ANN_NPROBE
+        self.refine = ANN_REFINE
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()   # one /index/build at a time
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return self.count
+
+    # -------------------------------------------------------------------------
+    # Build
+    # -------------------------------------------------------------------------
+    def train(self, vectors, nlist=ANN_NLIST, m=ANN_M, seed=0):
+        """
+        Learns the coarse centroids and PQ codebooks. Empties the index and
+        truncates its row files, so only call it on an index nobody is
+        searching: build() trains a staged copy and swaps it in.
+        """
+        n, dim = np.shape(vectors)
+        if dim % m:
+            raise ValueError(f"m={m} must divide the vector dimension {dim}")
+        rng = np.random.default_rng(seed)
+        sample = normalize(vectors[np.sort(rng.choice(n, min(n, ANN_TRAIN_SAMPLE), replace=False))])
+
+        centroids = kmeans(sample, nlist, seed)
+        residuals = sample - centroids[self._assign(sample, centroids)]
+        dsub = dim // m
+        codebooks = np.stack([
+            kmeans(residuals[:, j * dsub:(j + 1) * dsub], KSUB, seed) for j in range(m)
+        ])
+
+        with self._lock:
+            self.centroids, self.codebooks = centroids, codebooks
+            self.offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+            self.codes = np.empty((0, m), dtype=np.uint8)
+            self.rows = np.empty(0, dtype=np.int64)
+            self._clear_tail()
+            self.vectors = np.empty((0, dim), dtype=np.float16)
+            self.row_ids = np.empty(0, dtype=np.int64)
+            self.count = 0
+            if self.directory:
+                # Drop the old rows, then write the new quantizers
+                os.makedirs(self.directory, exist_ok=True)
+                for name in ("vectors.f16", "ids.i64"):
+                    open(os.path.join(self.directory, name), "wb").close()
+                self.save(self.directory)
+
+    def build(self, vectors, ids, nlist=ANN_NLIST, m=ANN_M):
+        """
+        train() + add() + merge on a staged index (in <directory>.build),
+        then swaps it in. Searches keep using the old index until then.
+        """
+        with self._build_lock:
+            staging_dir = self.directory + ".build" if self.directory else None
+            if staging_dir:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            staged = IVFPQIndex(staging_dir)
+            staged.nprobe, staged.refine = self.nprobe, self.refine
+            staged.train(vectors, nlist=nlist, m=m)
+            staged.add(vectors, ids)
+            staged._merge_tail()
+            if staging_dir:
+                staged.save(staging_dir)
+
+            with self._lock:
+                if self.directory:
+                    # Directories are renamed, never truncated: searches still
+                    # reading the old row files through their mmaps are fine
+                    old_dir = self.directory + ".old"
+                    shutil.rmtree(old_dir, ignore_errors=True)
+                    if os.path.exists(self.directory):
+                        os.replace(self.directory, old_dir)
+                    os.replace(staging_dir, self.directory)
+                for name in STATE:
+                    setattr(self, name, getattr(staged, name))
+            if self.directory:
+                shutil.rmtree(old_dir, ignore_errors=True)
+
+    def _clear_tail(self):
+        self.tail_codes = np.empty((0, self.codebooks.shape[0]), dtype=np.uint8)
+        self.tail_rows = np.empty(0, dtype=np.int64)
+        self.tail_lists = np.empty(0, dtype=np.int32)
+
+    @staticmethod
+    def _assign(x, centroids):
+        lists = np.empty(len(x), dtype=np.int32)
+        for start in range(0, len(x), BLOCK_ROWS):
+            lists[start:start + BLOCK_ROWS] = np.argmax(x[start:start + BLOCK_ROWS] @ centroids.T, axis=1)
+        return lists
+
+    @staticmethod
+    def _encode(residuals, codebooks):
+        m, ksub, dsub = codebooks.shape
+        codes = np.empty((len(residuals), m), dtype=np.uint8)
+        sq_norms = (codebooks ** 2).sum(axis=2)               # (m, ksub)
+        for j in range(m):
+            sub = residuals[:, j * dsub:(j + 1) * dsub]
+            # argmin ||r - c||^2 == argmax (2 r.c - ||c||^2)
+            codes[:, j] = np.argmax(2 * sub @ codebooks[j].T - sq_norms[j], axis=1)
+        return codes
+
+    def _check_dim(self, shape):
+        dim = self.centroids.shape[1]
+        if len(shape) < 1 or shape[-1] != dim:
+            raise ValueError(f"Vectors must have {dim} dimensions (got shape {tuple(shape)})")
+
+    def add(self, vectors, ids):
+        """Inserts vectors under integer ids (no retraining). vectors may be an mmap."""
+        if not self.trained:
+            raise RuntimeError("Index is not trained — call /index/build first")
+        ids = np.asarray(ids, dtype=np.int64)
+        centroids, codebooks = self.centroids, self.codebooks
+        self._check_dim(np.shape(vectors))
+        lists = np.empty(len(ids), dtype=np.int32)
+        codes = np.empty((len(ids), codebooks.shape[0]), dtype=np.uint8)
+        halves = []
+        # Block by block, so a large .npy never has to be in memory as float32 at once
+        for start in range(0, len(ids), BLOCK_ROWS):
+            x = normalize(vectors[start:start + BLOCK_ROWS])
+            block_lists = self._assign(x, centroids)
+            lists[start:start + len(x)] = block_lists
+            codes[start:start + len(x)] = self._encode(x - centroids[block_lists], codebooks)
+            halves.append(x.astype(np.float16))
+
+        with self._lock:
+            if self.centroids is not centroids:
+                raise RuntimeError("Index was rebuilt during the add — send the vectors again")
+            first_row = self.count
+            self._append_rows(halves, ids)
+
+            self.tail_codes = np.concatenate([self.tail_codes, codes])
+            self.tail_rows = np.concatenate([self.tail_rows, np.arange(first_row, self.count)])
+            self.tail_lists = np.concatenate([self.tail_lists, lists])
+            merge = len(self.tail_rows) >= TAIL_MAX
+            if merge:
+                self._merge_tail()
+            if self.directory:
+                self.save(self.directory, tail_only=not merge)
+
+    def _append_rows(self, halves, ids):
+        """Appends to the row files (or to memory when the index has no directory)."""
+        if not self.directory:
+            self.vectors = np.concatenate([self.vectors] + halves)
+            self.row_ids = np.concatenate([self.row_ids, ids])
+            self.count = len(self.row_ids)
+            return
+        with open(os.path.join(self.directory, "vectors.f16"), "ab") as f:
+            for half in halves:
+                f.write(half.tobytes())
+        with open(os.path.join(self.directory, "ids.i64"), "ab") as f:
+            f.write(ids.tobytes())
+        self.count += len(ids)
+        self._map_rows()
+
+    def _map_rows(self):
+        dim = self.centroids.shape[1]
+        path = lambda name: os.path.join(self.directory, name)
+        if self.count == 0:
+            self.vectors = np.empty((0, dim), dtype=np.float16)
+            self.row_ids = np.empty(0, dtype=np.int64)
+            return
+        self.vectors = np.memmap(path("vectors.f16"), dtype=np.float16, mode="r", shape=(self.count, dim))
+        self.row_ids = np.memmap(path("ids.i64"), dtype=np.int64, mode="r", shape=(self.count,))
+
+    def _merge_tail(self):
+        """Folds the tail into the sorted lists (rewrites codes / rows)."""
+        sizes = np.diff(self.offsets)
+        lists = np.concatenate([np.repeat(np.arange(len(sizes), dtype=np.int32), sizes), self.tail_lists])
+        order = np.argsort(lists, kind="stable")
+        self.codes = np.concatenate([self.codes, self.tail_codes])[order]
+        self.rows = np.concatenate([self.rows, self.tail_rows])[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=len(sizes)))])
+        self._clear_tail()
+
+    # -------------------------------------------------------------------------
+    # Query
+    # -------------------------------------------------------------------------
+    def search(self, query_vector, k=10, nprobe=None, refine=None):
+        """Approximate top-k: (ids, scores), best first. ValueError on a bad query."""
+        if not self.trained:
+            raise RuntimeError("Index is not trained — call /index/build first")
+        # Snapshot under the lock: add() and merges replace these arrays
+        # (never mutate them), always all of them together
+        with self._lock:
+            centroids, codebooks, offsets = self.centroids, self.codebooks, self.offsets
+            codes, rows = self.codes, self.rows
+            tail_codes, tail_rows, tail_lists = self.tail_codes, self.tail_rows, self.tail_lists
+            vectors, row_ids = self.vectors, self.row_ids
+
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        if nprobe is not None and nprobe < 1:
+            raise ValueError("nprobe must be at least 1")
+        if refine is not None and refine < 0:
+            raise ValueError("refine must be 0 or more")
+        q = normalize(query_vector)
+        if q.shape != (centroids.shape[1],):
+            raise ValueError(f"query_vector must have {centroids.shape[1]} dimensions (got shape {q.shape})")
+        m, ksub, dsub = codebooks.shape
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        refine = self.refine if refine is None else refine
+
+        # 1. Which lists to scan
+        coarse = centroids @ q
+        probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+
+        # 2. Candidates from those lists (+ the tail)
+        parts_codes, parts_rows, parts_base = [], [], []
+        for l in probe:
+            start, end = offsets[l], offsets[l + 1]
+            if end > start:
+                parts_codes.append(codes[start:end])
+                parts_rows.append(rows[start:end])
+                parts_base.append(np.full(end - start, coarse[l], dtype=np.float32))
+        if len(tail_rows):
+            in_probe = np.isin(tail_lists, probe)
+            parts_codes.append(tail_codes[in_probe])
+            parts_rows.append(tail_rows[in_probe])
+            parts_base.append(coarse[tail_lists[in_probe]])
+        if not parts_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        cand_codes = np.concatenate(parts_codes)
+        cand_rows = np.concatenate(parts_rows)
+
+        # 3. PQ score: centroid score + residual score from the lookup table
+        lut = np.einsum("jkd,jd->jk", codebooks, q.reshape(m, dsub)).ravel()
+        table_rows = cand_codes.astype(np.intp) + np.arange(m, dtype=np.intp) * ksub
+        scores = np.concatenate(parts_base) + lut[table_rows].sum(axis=1)
+
+        # 4. Shortlist, and re-score it exactly
+        shortlist = min(k * max(refine, 1), len(scores))
+        top = np.argpartition(-scores, shortlist - 1)[:shortlist]
+        if refine:
+            picked = np.sort(cand_rows[top])           # sorted reads are kinder to the mmap
+            exact = vectors[picked].astype(np.float32) @ q
+            cand_rows, scores, top = picked, exact, np.arange(len(picked))
+
+        k = min(k, len(top))
+        best = top[np.argpartition(-scores[top], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return np.asarray(row_ids[cand_rows[best]]), scores[best]
+
+    def stats(self):
+        if not self.trained:
+            return {"trained": False, "count": 0}
+        m = self.codebooks.shape[0]
+        dim = self.centroids.shape[1]
+        return {
+            "trained": True,
+            "count": len(self),
+            "tail": len(self.tail_rows),
+            "nlist": len(self.centroids),
+            "m": m,
+            "dim": dim,
+            "nprobe": self.nprobe,
+            "refine": self.refine,
+            # codes + row number in the lists, float16 vector + id in the row files
+            "bytes_per_vector": m + 8 + dim * 2 + 8,
+        }
+
+    # -------------------------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------------------------
+    def save(self, directory, tail_only=False):
+        """Writes each array to a temp file and renames it (safe while mmap'd)."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"tail_codes": self.tail_codes, "tail_rows": self.tail_rows, "tail_lists": self.tail_lists}
+        if not tail_only:
+            arrays.update(centroids=self.centroids, codebooks=self.codebooks,
+                          offsets=self.offsets, codes=self.codes, rows=self.rows)
+        for name, array in arrays.items():
+            tmp_path = os.path.join(directory, name + ".tmp.npy")
+            np.save(tmp_path, np.asarray(array))
+            os.replace(tmp_path, os.path.join(directory, name + ".npy"))
+        # Written last: rows past this count (an add that crashed midway) are ignored
+        tmp_path = os.path.join(directory, "meta.tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump({"count": self.count, "nprobe": self.nprobe, "refine": self.refine}, f)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+    @classmethod
+    def load(cls, directory):
+        """Opens a saved index; lists and rows stay on disk (mmap)."""
+        index = cls(directory)
+        path = lambda name: os.path.join(directory, name)
+        old_dir = directory + ".old"
+        if not os.path.exists(path("meta.json")) and os.path.exists(os.path.join(old_dir, "meta.json")):
+            # Crashed between the two renames of a build swap
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(old_dir, directory)
+        if not os.path.exists(path("meta.json")):
+            return index
+        try:
+            with open(path("meta.json")) as f:
+                meta = json.load(f)
+            index.centroids = np.load(path("centroids.npy"))
+            index.codebooks = np.load(path("codebooks.npy"))
+            index.offsets = np.load(path("offsets.npy"))
+            index.codes = np.load(path("codes.npy"), mmap_mode="r")
+            index.rows = np.load(path("rows.npy"), mmap_mode="r")
+            index.tail_codes = np.load(path("tail_codes.npy"))
+            index.tail_rows = np.load(path("tail_rows.npy"))
+            index.tail_lists = np.load(path("tail_lists.npy"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ ANN index in {directory} unreadable ({e}) — rebuild it with /index/build")
+            return cls(directory)
+
+        index.count = meta["count"]
+        index.nprobe = meta.get("nprobe", ANN_NPROBE)
+        index.refine = meta.get("refine", ANN_REFINE)
+        keep = index.tail_rows < index.count
+        index.tail_codes, index.tail_rows, index.tail_lists = (
+            index.tail_codes[keep], index.tail_rows[keep], index.tail_lists[keep])
+        # Cut off a half-written add so the next one appends at the right row
+        dim = index.centroids.shape[1]
+        for name, row_bytes in (("vectors.f16", dim * 2), ("ids.i64", 8)):
+            with open(path(name), "r+b") as f:
+                f.truncate(index.count * row_bytes)
+        index._map_rows()
+        return index
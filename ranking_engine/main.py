@@ -1,17 +1,44 @@
 # LOCUS: main.py
-from fastapi import FastAPI
+import os
+import numpy as np
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from ranker import LocusRanker
+from ann_index import IVFPQIndex, ANN_NLIST, ANN_M
+
+# Where the approximate index lives (loaded at startup if present)
+ANN_INDEX_DIR = os.getenv("ANN_INDEX_DIR", "./ann_data")
 
 app = FastAPI()
 ranker = LocusRanker()
+index = IVFPQIndex.load(ANN_INDEX_DIR)
+if index.trained:
+    print(f"✅ ANN index loaded: {len(index)} vectors from {ANN_INDEX_DIR}")
 
 # Define the data format we expect to receive
 class RankRequest(BaseModel):
     query_vector: List[float]
     candidate_vectors: List[List[float]]
 
+class BuildRequest(BaseModel):
+    # Either the vectors inline, or an .npy matrix on the engine's disk
+    vectors: Optional[List[List[float]]] = None
+    npy_path: Optional[str] = None
+    ids: Optional[List[int]] = None
+    nlist: int = ANN_NLIST
+    m: int = ANN_M
+
+class AddRequest(BaseModel):
+    vectors: List[List[float]]
+    ids: List[int]
+
+class SearchRequest(BaseModel):
+    query_vector: List[float]
+    k: int = 10
+    nprobe: Optional[int] = None   # more lists = better recall, slower
+    refine: Optional[int] = None   # k * refine candidates re-scored exactly (0 = off)
+
 @app.get("/")
 def read_root():
     return {"status": "online", "service": "Locus Ranking Engine"}
@@ -25,4 +52,51 @@ def rank_vectors(payload: RankRequest):
     # 2. Run the math logic
     results = ranker.predict(query, candidates)
     
-    return {"matches": results}
\ No newline at end of file
+    return {"matches": results}
+
+@app.post("/index/build")
+def build_index(payload: BuildRequest):
+    # 1. Load the vectors
+    if payload.npy_path:
+        vectors = np.load(payload.npy_path, mmap_mode="r")
+    elif payload.vectors:
+        vectors = np.asarray(payload.vectors, dtype=np.float32)
+    else:
+        raise HTTPException(status_code=400, detail="Send vectors or npy_path")
+    ids = np.arange(len(vectors)) if payload.ids is None else np.asarray(payload.ids)
+    if len(ids) != len(vectors):
+        raise HTTPException(status_code=400, detail="ids and vectors differ in length")
+
+    # 2. Train the quantizers, then encode everything (replaces the old index)
+    try:
+        index.build(vectors, ids, nlist=payload.nlist, m=payload.m)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "built", **index.stats()}
+
+@app.post("/index/add")
+def add_to_index(payload: AddRequest):
+    if len(payload.ids) != len(payload.vectors):
+        raise HTTPException(status_code=400, detail="ids and vectors differ in length")
+    try:
+        index.add(payload.vectors, payload.ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "added", "count": len(index)}
+
+@app.post("/index/search")
+def search_index(payload: SearchRequest):
+    try:
+        ids, scores = index.search(payload.query_vector, k=payload.k,
+                                   nprobe=payload.nprobe, refine=payload.refine)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"matches": [{"id": int(i), "score": float(s)} for i, s in zip(ids, scores)]}
+
+@app.get("/index/stats")
+def index_stats():
+    return index.stats()
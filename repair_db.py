@@ -1,8 +1,14 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams, Distance
+import os
+import sys
+from qdrant_client.http.models import VectorParams, Distance, PayloadSchemaType
 
-# Connect to local Qdrant
-client = QdrantClient("localhost", port=6333)
+# Same vector store selection as the gateway (VECTOR_STORE / VECTOR_STORE_PATH)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "gateway"))
+from vector_store import connect
+from products import backfill_product_ids, PRODUCT_KEY
+
+# Connect to local Qdrant (or the embedded store)
+client = connect("localhost", 6333)
 COLLECTION_NAME = "locus_items"
 
 print(f"🔧 Attempting to repair: {COLLECTION_NAME}...")
@@ -19,4 +25,21 @@ if not client.collection_exists(collection_name=COLLECTION_NAME):
 else:
     print(f"⚠️ Collection '{COLLECTION_NAME}' already exists. No action needed.")
 
+# Searches group by product_id and skip items without one: give items
+# stored before multi-view products existed their own point id, in every
+# catalog collection (mall collections, generations, compact companions)
+for collection in client.get_collections().collections:
+    if not collection.name.startswith(COLLECTION_NAME):
+        continue
+    try:
+        client.create_payload_index(
+            collection_name=collection.name, field_name=PRODUCT_KEY,
+            field_schema=PayloadSchemaType.KEYWORD
+        )
+        updated = backfill_product_ids(client, collection.name)
+        if updated:
+            print(f"♻️ {collection.name}: {updated} items given a product_id")
+    except Exception as e:
+        print(f"❌ Error backfilling product_id in {collection.name}: {e}")
+
 print("🚀 Database is ready. You can run bulk_upload.py now.")
\ No newline at end of file
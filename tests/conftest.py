@@ -0,0 +1,10 @@
+# LOCUS: conftest.py
+# The gateway and ranking engine run with their own folder as the working
+# directory (flat imports), so their modules are importable the same way here.
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for service in ("gateway", "ranking_engine"):
+    sys.path.insert(0, os.path.join(ROOT, service))
@@ -0,0 +1,108 @@
+# LOCUS: test_ann_index.py
+# IVF-PQ index: recall against brute force, inserts, persistence, validation
+
+import numpy as np
+import pytest
+
+from ann_index import IVFPQIndex, normalize
+
+DIM = 32
+
+
+def clustered(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(20, DIM))
+    return (centres[rng.integers(0, 20, n)] + 0.3 * rng.normal(size=(n, DIM))).astype(np.float32)
+
+
+@pytest.fixture(scope="module")
+def data():
+    return clustered(3000)
+
+
+@pytest.fixture
+def index(data, tmp_path):
+    index = IVFPQIndex(str(tmp_path))
+    index.build(data, np.arange(len(data)) + 1000, nlist=16, m=8)
+    return index
+
+
+def recall(index, data, queries, k=10, **knobs):
+    exact = np.argsort(-(normalize(queries) @ normalize(data).T), axis=1)[:, :k] + 1000
+    found = 0
+    for query, truth in zip(queries, exact):
+        ids, _ = index.search(query, k=k, **knobs)
+        found += len(set(ids.tolist()) & set(truth.tolist()))
+    return found / exact.size
+
+
+def test_refined_search_matches_brute_force(index, data):
+    queries = clustered(50, seed=1)
+    assert recall(index, data, queries, nprobe=16, refine=16) >= 0.95
+    assert recall(index, data, queries, nprobe=16, refine=16) >= recall(index, data, queries, nprobe=2, refine=0)
+
+
+def test_scores_are_sorted_cosines(index, data):
+    ids, scores = index.search(data[7], k=5)
+    assert ids[0] == 1007
+    assert scores[0] == pytest.approx(1.0, abs=1e-2)
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_added_vectors_are_found(index):
+    extra = clustered(5, seed=2)
+    index.add(extra, [1, 2, 3, 4, 5])
+    assert len(index) == 3005
+    assert index.stats()["tail"] == 5
+    for point_id, vector in zip([1, 2, 3, 4, 5], extra):
+        ids, _ = index.search(vector, k=1)
+        assert ids[0] == point_id
+
+
+def test_save_load_round_trip(index, data, tmp_path):
+    index.add(clustered(3, seed=3), [7, 8, 9])
+    loaded = IVFPQIndex.load(str(tmp_path))
+    assert len(loaded) == len(index)
+    assert loaded.stats() == index.stats()
+    for query in data[:5]:
+        expected_ids, expected_scores = index.search(query, k=10)
+        ids, scores = loaded.search(query, k=10)
+        assert ids.tolist() == expected_ids.tolist()
+        assert np.allclose(scores, expected_scores)
+
+
+def test_empty_directory_loads_untrained(tmp_path):
+    index = IVFPQIndex.load(str(tmp_path / "missing"))
+    assert not index.trained
+    assert index.stats() == {"trained": False, "count": 0}
+    with pytest.raises(RuntimeError):
+        index.search(np.ones(DIM), k=1)
+
+
+@pytest.mark.parametrize("knobs", [{"k": 0}, {"nprobe": 0}, {"refine": -1}])
+def test_bad_knobs_are_rejected(index, knobs):
+    with pytest.raises(ValueError):
+        index.search(np.ones(DIM), **knobs)
+
+
+def test_wrong_dimension_is_rejected(index):
+    with pytest.raises(ValueError):
+        index.search(np.ones(DIM + 1), k=1)
+    with pytest.raises(ValueError):
+        index.add(np.ones((2, DIM - 1)), [1, 2])
+    with pytest.raises(ValueError):
+        IVFPQIndex().build(np.ones((300, DIM)), np.arange(300), nlist=4, m=5)
+
+
+def test_rebuild_keeps_serving_the_old_index(index, data, tmp_path):
+    # A search snapshot taken before the rebuild stays readable after it
+    old_vectors = index.vectors
+    ids_before, _ = index.search(data[0], k=3)
+    index.build(data[:1000], np.arange(1000) + 5000, nlist=8, m=8)
+    assert old_vectors[:10].astype(np.float32).sum() != 0
+    assert len(index) == 1000
+    ids, _ = index.search(data[0], k=1)
+    assert ids[0] == 5000
+    assert ids_before[0] == 1000
+    assert not (tmp_path.parent / (tmp_path.name + ".build")).exists()
+    assert len(IVFPQIndex.load(str(tmp_path))) == 1000
@@ -0,0 +1,26 @@
+# LOCUS: test_cursors.py
+# Search pagination over a cached candidate list
+
+from cursors import CursorStore
+
+
+def test_cursor_pages_through_the_list():
+    cursors = CursorStore()
+    page, cursor = cursors.first_page(list(range(7)), page_size=3)
+    pages = [page]
+    while cursor is not None:
+        page, cursor = cursors.page(cursor, page_size=3)
+        pages.append(page)
+    assert pages == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_single_page_needs_no_cursor():
+    assert CursorStore().first_page([1, 2], page_size=3) == ([1, 2], None)
+
+
+def test_bad_or_expired_cursors():
+    cursors = CursorStore(ttl=0.0)
+    _, cursor = cursors.first_page(list(range(10)), page_size=3)
+    assert cursors.page(cursor) is None
+    assert cursors.page("not-a-cursor") is None
+    assert cursors.page(None) is None
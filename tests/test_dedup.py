@@ -0,0 +1,82 @@
+# LOCUS: test_dedup.py
+# Near-duplicate detection: hash bands, colour check, candidate lookup
+
+import io
+import uuid
+
+import numpy as np
+from PIL import Image, ImageDraw
+from qdrant_client.http import models
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from dedup import Deduplicator, hash_bands, hamming, pixel_match, PHASH_BANDS, SCROLL_BATCH
+from embedded_store import EmbeddedStore
+from imaging import dhash, tiny_rgb
+
+MALL = "ABC Achrafieh"
+
+
+def photo(fill, fmt="PNG"):
+    image = Image.new("RGB", (200, 200), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([50, 40, 150, 170], fill=fill)
+    draw.ellipse([80, 60, 120, 100], fill="black")
+    data = io.BytesIO()
+    image.save(data, fmt)
+    return data.getvalue()
+
+
+def test_close_hashes_share_a_band():
+    value = 0x0123456789ABCDEF
+    flipped = value ^ (1 << 3) ^ (1 << 20) ^ (1 << 41)      # 3 bits < PHASH_BANDS
+    assert hamming(value, flipped) == 3
+    assert len(hash_bands(value)) == PHASH_BANDS
+    assert set(hash_bands(value)) & set(hash_bands(flipped))
+
+
+def test_dhash_survives_reencoding():
+    assert hamming(dhash(photo("red")), dhash(photo("red", "JPEG"))) <= 2
+
+
+def test_pixel_match_tells_colour_variants_apart():
+    red, red_jpeg, blue = photo("red"), photo("red", "JPEG"), photo("blue")
+    # Grayscale hash can't tell red from blue, the colour check can
+    assert hamming(dhash(red), dhash(blue)) <= 6
+    assert pixel_match(tiny_rgb(red), tiny_rgb(red_jpeg)) > 0.97
+    assert pixel_match(tiny_rgb(red), tiny_rgb(blue)) < 0.9
+
+
+# -----------------------------------------------------------------------------
+# Candidate lookup
+# -----------------------------------------------------------------------------
+class OneCollection:
+    """The bits of routing.CollectionRouter the Deduplicator uses."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def collection_for(self, mall):
+        return "items"
+
+
+def test_duplicate_found_behind_many_common_band_matches(tmp_path):
+    client = EmbeddedStore(str(tmp_path / "store"))
+    client.create_collection("items", vectors_config=VectorParams(size=4, distance=Distance.COSINE))
+    client.create_payload_index("items", field_name="phash_bands", field_schema=models.PayloadSchemaType.KEYWORD)
+    dedup = Deduplicator(OneCollection(client))
+
+    upload = 0x00000000000000FF
+    # White backgrounds: lots of items share the all-zero bands, far in Hamming distance
+    others = [0x00000000FFFFFF00 ^ (i << 40) for i in range(2 * SCROLL_BATCH)]
+    duplicate = upload ^ 0b11           # 2 bits off, stored last
+    points = [
+        PointStruct(id=str(uuid.UUID(int=i + 1)), vector=[1.0, 0.0, 0.0, 0.0],
+                    payload={"mall_name": MALL, **dedup.hash_payload(value)})
+        for i, value in enumerate(others + [duplicate])
+    ]
+    client.upsert("items", points=points)
+
+    found = dedup.candidates(upload, MALL)
+    assert [p.id for p in found] == [points[-1].id]
+    assert found[0].vector is not None
+    assert dedup.candidates(upload, "City Centre") == []
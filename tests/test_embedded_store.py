@@ -0,0 +1,158 @@
+# LOCUS: test_embedded_store.py
+# EmbeddedStore against the Qdrant semantics the gateway relies on
+# (QdrantClient(":memory:") is the reference where results are compared)
+
+import uuid
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from embedded_store import EmbeddedStore
+from vector_store import VectorStore
+
+DIM = 16
+MALLS = ("ABC Achrafieh", "City Centre")
+CATEGORIES = ("shirt", "jeans", "shoes")
+
+
+def catalog(n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        PointStruct(
+            id=str(uuid.UUID(int=i + 1)),
+            vector=rng.normal(size=DIM).tolist(),
+            payload={
+                "name": f"item {i}",
+                "mall_name": MALLS[i % 2],
+                "category_tag": CATEGORIES[i % 3],
+                "style_tags": ["casual"] if i % 4 else ["formal", "casual"],
+                "price": float(i),
+                "location": {"lat": 33.89 + 0.01 * (i % 5), "lon": 35.5},
+                "product_id": f"p{i // 3}",
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def fill(client, points):
+    client.create_collection("items", vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+    for field in ("mall_name", "category_tag", "style_tags", "product_id"):
+        client.create_payload_index("items", field_name=field, field_schema=models.PayloadSchemaType.KEYWORD)
+    client.upsert("items", points=points)
+    return client
+
+
+@pytest.fixture
+def store(tmp_path):
+    return fill(EmbeddedStore(str(tmp_path / "store")), catalog())
+
+
+@pytest.fixture
+def reference():
+    return fill(QdrantClient(":memory:"), catalog())
+
+
+FILTERS = [
+    None,
+    models.Filter(must=[models.FieldCondition(key="mall_name", match=models.MatchValue(value="City Centre"))]),
+    models.Filter(must=[
+        models.FieldCondition(key="category_tag", match=models.MatchAny(any=["shirt", "shoes"])),
+        models.FieldCondition(key="style_tags", match=models.MatchValue(value="formal")),
+    ]),
+    models.Filter(must=[models.FieldCondition(key="price", range=models.Range(gte=10, lt=30))],
+                  must_not=[models.FieldCondition(key="category_tag", match=models.MatchValue(value="jeans"))]),
+    models.Filter(should=[
+        models.FieldCondition(key="name", match=models.MatchText(text="item 1")),
+        models.FieldCondition(key="mall_name", match=models.MatchValue(value="ABC Achrafieh")),
+    ]),
+    models.Filter(must=[models.FieldCondition(key="location", geo_radius=models.GeoRadius(
+        center=models.GeoPoint(lat=33.89, lon=35.5), radius=1500.0))]),
+]
+
+
+def test_both_backends_satisfy_the_protocol(store, reference):
+    assert isinstance(store, VectorStore)
+    assert isinstance(reference, VectorStore)
+
+
+@pytest.mark.parametrize("query_filter", FILTERS)
+def test_search_matches_qdrant(store, reference, query_filter):
+    query = np.random.default_rng(1).normal(size=DIM).tolist()
+    ours = store.search("items", query_vector=query, query_filter=query_filter, limit=10)
+    theirs = reference.search("items", query_vector=query, query_filter=query_filter, limit=10)
+    assert [str(hit.id) for hit in ours] == [str(hit.id) for hit in theirs]
+    assert [hit.score for hit in ours] == pytest.approx([hit.score for hit in theirs], abs=1e-5)
+
+
+@pytest.mark.parametrize("query_filter", FILTERS)
+def test_count_and_filtered_scroll_match_qdrant(store, reference, query_filter):
+    assert store.count("items", count_filter=query_filter).count == reference.count(
+        "items", count_filter=query_filter).count
+    ours, _ = store.scroll("items", scroll_filter=query_filter, limit=100)
+    theirs, _ = reference.scroll("items", scroll_filter=query_filter, limit=100)
+    assert {str(p.id) for p in ours} == {str(p.id) for p in theirs}
+
+
+def test_scroll_pages_through_everything_once(store):
+    seen, offset = [], None
+    while True:
+        points, offset = store.scroll("items", limit=7, offset=offset, with_payload=False)
+        seen += [str(p.id) for p in points]
+        if offset is None:
+            break
+    assert len(seen) == 60
+    assert len(set(seen)) == 60
+
+
+def test_payload_selectors_and_vectors(store):
+    point_id = str(uuid.UUID(int=5))
+    [point] = store.retrieve("items", ids=[point_id], with_payload=["name", "price"], with_vectors=True)
+    assert point.payload == {"name": "item 4", "price": 4.0}
+    assert np.linalg.norm(point.vector) == pytest.approx(1.0, abs=1e-5)   # cosine: stored unit length
+    [point] = store.retrieve("items", ids=[point_id],
+                             with_payload=models.PayloadSelectorExclude(exclude=["location", "style_tags"]))
+    assert "location" not in point.payload
+    assert point.payload["product_id"] == "p1"
+
+
+def test_set_payload_delete_and_is_empty(store):
+    missing = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="on_sale"))])
+    assert store.count("items", count_filter=missing).count == 60
+    first = str(uuid.UUID(int=1))
+    store.set_payload("items", payload={"on_sale": True}, points=[first])
+    assert store.count("items", count_filter=missing).count == 59
+    store.delete("items", points_selector=models.PointIdsList(points=[first]))
+    assert store.retrieve("items", ids=[first]) == []
+    assert store.count("items").count == 59
+
+
+def test_search_groups_one_hit_per_product(store, reference):
+    query = np.random.default_rng(2).normal(size=DIM).tolist()
+    ours = store.search_groups("items", query_vector=query, group_by="product_id", limit=5, group_size=1).groups
+    theirs = reference.search_groups("items", query_vector=query, group_by="product_id",
+                                     limit=5, group_size=1).groups
+    assert [g.id for g in ours] == [g.id for g in theirs]
+    assert all(len(g.hits) == 1 for g in ours)
+    assert [g.hits[0].score for g in ours] == sorted((g.hits[0].score for g in ours), reverse=True)
+
+
+def test_aliases_swap_and_survive_reopening(tmp_path):
+    path = str(tmp_path / "store")
+    store = EmbeddedStore(path)
+    for name in ("items-v1", "items-v2"):
+        store.create_collection(name, vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+    store.upsert("items-v2", points=catalog(3))
+    store.update_collection_aliases(change_aliases_operations=[
+        models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name="items-v1", alias_name="items"))
+    ])
+    store.update_collection_aliases(change_aliases_operations=[
+        models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name="items")),
+        models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name="items-v2", alias_name="items")),
+    ])
+    reopened = EmbeddedStore(path)
+    assert {a.alias_name: a.collection_name for a in reopened.get_aliases().aliases} == {"items": "items-v2"}
+    assert reopened.count("items").count == 3
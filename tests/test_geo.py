@@ -0,0 +1,39 @@
+# LOCUS: test_geo.py
+# Store nearness: distances, similarity + nearness rerank, prefilter radius
+
+import numpy as np
+import pytest
+from qdrant_client.http.models import ScoredPoint
+
+from geo import geo_rerank, haversine_km, nearby_radius_km
+
+
+def hit(point_id, score, location=None):
+    payload = {"location": location} if location else {}
+    return ScoredPoint(id=point_id, version=0, score=score, payload=payload)
+
+
+def test_haversine_beirut_to_byblos():
+    distance = haversine_km(33.8938, 35.5018, np.array([34.1230]), np.array([35.6519]))
+    assert distance[0] == pytest.approx(29, abs=2)
+
+
+def test_nearness_can_outrank_similarity():
+    here = (33.89, 35.50)
+    near = hit(1, 0.80, {"lat": 33.89, "lon": 35.50})
+    far = hit(2, 0.85, {"lat": 34.40, "lon": 35.80})
+    unknown = hit(3, 0.90)
+    ranked = geo_rerank([far, unknown, near], *here, decay_km=5.0, geo_weight=0.3)
+    assert [h.id for h, _, _ in ranked] == [1, 3, 2]
+    by_id = {h.id: (fused, distance) for h, fused, distance in ranked}
+    assert by_id[1] == (pytest.approx(0.7 * 0.80 + 0.3), pytest.approx(0.0, abs=1e-6))
+    assert by_id[3] == (pytest.approx(0.7 * 0.90), None)
+
+
+def test_geo_weight_zero_keeps_similarity_order():
+    hits = [hit(1, 0.5, {"lat": 33.89, "lon": 35.50}), hit(2, 0.9, {"lat": 40.0, "lon": 40.0})]
+    assert [h.id for h, _, _ in geo_rerank(hits, 33.89, 35.50, geo_weight=0.0)] == [2, 1]
+
+
+def test_nearby_radius_scales_with_decay():
+    assert nearby_radius_km(2.0) == pytest.approx(2 * nearby_radius_km(1.0))
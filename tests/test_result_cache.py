@@ -0,0 +1,39 @@
+# LOCUS: test_result_cache.py
+# Exact-match result cache: keys, invalidation on write, LRU by size
+
+from result_cache import ResultCache, query_key
+
+
+def test_query_key_is_exact():
+    assert query_key([0.1, 0.2], None, 10) == query_key([0.1, 0.2], None, 10)
+    assert query_key([0.1, 0.2], None, 10) != query_key([0.1, 0.2000001], None, 10)
+    assert query_key([0.1, 0.2], None, 10) != query_key([0.1, 0.2], None, 20)
+
+
+def test_cache_hit_and_invalidation_on_write():
+    cache = ResultCache(max_bytes=10_000)
+    cache.put("k", [1, 2], cache.version_snapshot())
+    assert cache.get("k") == [1, 2]
+    cache.bump_version()
+    assert cache.get("k") is None
+    assert cache.stats()["stale"] == 1
+
+
+def test_result_computed_across_a_write_is_not_cached():
+    cache = ResultCache(max_bytes=10_000)
+    version = cache.version_snapshot()     # query starts
+    cache.bump_version()                   # /add lands meanwhile
+    cache.put("k", ["pre-write"], version)
+    assert cache.get("k") is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=30)     # room for two 12-byte entries
+    version = cache.version_snapshot()
+    cache.put("a", "x" * 10, version)
+    cache.put("b", "y" * 10, version)
+    cache.get("a")
+    cache.put("c", "z" * 10, version)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,72 @@
+# LOCUS: test_similarity.py
+# Similar-items graph: exact top-k, and rebuilds racing an ingest
+
+import uuid
+
+import numpy as np
+from qdrant_client.http import models
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+import similarity
+from embedded_store import EmbeddedStore
+from routing import CollectionRouter
+from similarity import SimilarityGraph, top_k_neighbours
+
+DIM = 8
+MALL = "ABC Achrafieh"
+
+
+def unit(rng):
+    vector = rng.normal(size=DIM)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def point(i, vector):
+    return PointStruct(id=str(uuid.UUID(int=i + 1)), vector=vector,
+                       payload={"name": f"item {i}", "mall_name": MALL, "category_tag": "shirt"})
+
+
+def make_graph(tmp_path, n=20):
+    client = EmbeddedStore(str(tmp_path / "store"))
+
+    def setup(name):
+        if not client.collection_exists(name):
+            client.create_collection(name, vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+            for field in ("mall_name", "category_tag"):
+                client.create_payload_index(name, field_name=field, field_schema=models.PayloadSchemaType.KEYWORD)
+
+    router = CollectionRouter(client, "items", setup, mode="single")
+    rng = np.random.default_rng(0)
+    client.upsert(router.collection_for(MALL), points=[point(i, unit(rng)) for i in range(n)])
+    return client, router, SimilarityGraph(router, k=3)
+
+
+def test_top_k_neighbours_matches_brute_force():
+    rng = np.random.default_rng(1)
+    vectors = np.asarray([unit(rng) for _ in range(50)], dtype=np.float32)
+    indices, scores = top_k_neighbours(vectors, 4)
+    sims = vectors @ vectors.T
+    np.fill_diagonal(sims, -np.inf)
+    assert indices.tolist() == np.argsort(-sims, axis=1)[:, :4].tolist()
+    assert np.allclose(scores, np.sort(sims, axis=1)[:, ::-1][:, :4])
+
+
+def test_rebuild_keeps_links_of_points_ingested_during_it(tmp_path, monkeypatch):
+    client, router, graph = make_graph(tmp_path)
+    twin_of = client.scroll("items", limit=1, with_vectors=True)[0][0]
+    newcomer = point(100, twin_of.vector)
+
+    compute = similarity.top_k_neighbours
+
+    def ingest_during_compute(vectors, k):
+        # An ingest batch lands after the rebuild's scroll, like store_jobs_locked
+        with router.write_lock:
+            client.upsert("items", points=[newcomer])
+            graph.add_point(newcomer.id, newcomer.vector, newcomer.payload)
+        return compute(vectors, k)
+
+    monkeypatch.setattr(similarity, "top_k_neighbours", ingest_during_compute)
+    assert graph.rebuild()["items"] == 20
+
+    assert graph.similar(newcomer.id)[0]["id"] == str(twin_of.id)
+    assert graph.similar(twin_of.id)[0]["id"] == str(newcomer.id)
@@ -0,0 +1,57 @@
+# LOCUS: test_taste_profiles.py
+# Taste profiles: decayed centroids, concurrent updates, persistence
+
+import threading
+
+import numpy as np
+import pytest
+
+import taste_profiles
+from taste_profiles import TasteProfile, TasteProfileStore, INTERACTION_WEIGHTS
+
+
+def test_similar_vectors_share_a_centroid():
+    profile = TasteProfile()
+    profile.update([1.0, 0.0, 0.0], now=1000.0)
+    profile.update([0.9, 0.1, 0.0], now=1000.0)
+    profile.update([0.0, 0.0, 1.0], now=1000.0)
+    shares = [share for _, share in profile.query_vectors(now=1000.0)]
+    assert shares == pytest.approx([2 / 3, 1 / 3])
+
+
+def test_weights_halve_every_half_life():
+    profile = TasteProfile()
+    profile.update([1.0, 0.0], now=1000.0)
+    later = 1000.0 + taste_profiles.PROFILE_HALF_LIFE_DAYS * 86400.0
+    assert profile.decayed_weights(now=later) == pytest.approx([0.5])
+
+
+def test_concurrent_events_for_a_new_user_are_all_kept(tmp_path):
+    store = TasteProfileStore(str(tmp_path))
+    barrier = threading.Barrier(16)
+
+    def event():
+        barrier.wait()
+        store.record("new-user", [1.0, 0.0, 0.0], kind="click")
+
+    threads = [threading.Thread(target=event) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = 16 * INTERACTION_WEIGHTS["click"]
+    assert store.get("new-user").weights.sum() == pytest.approx(expected, rel=1e-3)
+    reloaded = TasteProfileStore(str(tmp_path)).get("new-user")
+    assert reloaded.weights.sum() == pytest.approx(expected, rel=1e-3)
+    assert [p.name for p in tmp_path.iterdir()] == [store._path("new-user").rsplit("/", 1)[1]]
+
+
+def test_evicted_profile_is_reloaded_before_the_update(tmp_path, monkeypatch):
+    monkeypatch.setattr(taste_profiles, "LOADED_PROFILES_MAX", 1)
+    store = TasteProfileStore(str(tmp_path))
+    store.record("a", [1.0, 0.0], kind="save")
+    store.record("b", [0.0, 1.0], kind="save")      # evicts "a"
+    store.record("a", [1.0, 0.0], kind="save")
+    assert store.get("a").weights.sum() == pytest.approx(2 * INTERACTION_WEIGHTS["save"], rel=1e-3)
+    assert np.allclose(store.get("b").centroids, [[0.0, 1.0]])
@@ -0,0 +1,82 @@
+# =============================================================================
+# bench_cascade.py
+# Latency saved vs accessory recall of the detection cascade
+#
+# Runs every image in demo_images twice: once with the cascade disabled
+# (YOLOS always at full resolution — the reference) and once with it on.
+# Recall = share of the reference's accessory boxes that the cascade run
+# also found (same Fashionpedia label, IoU >= 0.5).
+#
+# Usage:  python bench_cascade.py [image_folder]
+# =============================================================================
+
+import os
+import sys
+import time
+from collections import Counter
+
+from vectorizer import LocusVisualizer
+
+IOU_MATCH = 0.5
+
+
+def iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def accessories(detections):
+    return [d for d in detections if d["source"] == "yolos_fashionpedia"]
+
+
+def timed_detect(visualizer, image_bytes, cascade):
+    t0 = time.time()
+    detections, _, _, summary = visualizer.detect_objects(image_bytes, cascade=cascade)
+    return detections, summary.get("cascade"), time.time() - t0
+
+
+def run(folder):
+    visualizer = LocusVisualizer()
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+
+    t_full = t_cascade = 0.0
+    reference_total = recalled = 0
+    paths = Counter()
+
+    print(f"{'image':<36}{'path':<10}{'full s':>8}{'cascade s':>11}{'recall':>9}")
+    for filename in files:
+        with open(os.path.join(folder, filename), "rb") as f:
+            image_bytes = f.read()
+
+        full, _, dt_full = timed_detect(visualizer, image_bytes, cascade=False)
+        fast, info, dt_fast = timed_detect(visualizer, image_bytes, cascade=True)
+        path = (info or {}).get("path", "error")
+
+        reference = accessories(full)
+        candidates = accessories(fast)
+        hits = sum(
+            1 for r in reference
+            if any(c["label"] == r["label"] and iou(c["bbox"], r["bbox"]) >= IOU_MATCH for c in candidates)
+        )
+
+        t_full += dt_full
+        t_cascade += dt_fast
+        reference_total += len(reference)
+        recalled += hits
+        paths[path] += 1
+        recall = f"{hits}/{len(reference)}" if reference else "-"
+        print(f"{filename:<36}{path:<10}{dt_full:>8.2f}{dt_fast:>11.2f}{recall:>9}")
+
+    print("=" * 74)
+    print(f"Paths taken:       {dict(paths)}")
+    print(f"Total time:        full {t_full:.1f}s, cascade {t_cascade:.1f}s "
+          f"({(1 - t_cascade / max(t_full, 1e-9)) * 100:.0f}% saved)")
+    print(f"Accessory recall:  {recalled}/{reference_total} "
+          f"({(recalled / reference_total * 100) if reference_total else 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else "../demo_images")
@@ -0,0 +1,63 @@
+# =============================================================================
+# cascade.py
+# Adaptive compute cascade for detection
+#
+# YOLOS-Fashionpedia (a ViT at up to 1333 px) costs several times more than
+# DeepFashion2's YOLOv8s, yet on a typical catalog shot — one dress, nothing
+# else — it finds no accessories at all. So the cheap model runs first, then
+# a single CLIP pass over the whole image estimates how likely accessories
+# are. That decides what YOLOS does:
+#
+#   "full"    — likely accessories: run YOLOS at its normal resolution
+#   "reduced" — unsure: run YOLOS at REDUCED_SHORTEST_EDGE (~2.4x fewer tokens)
+#   "skipped" — DeepFashion2 found a garment that fills the frame and CLIP
+#               puts almost no mass on accessory labels
+#
+# bench_cascade.py measures time saved vs accessory recall on demo_images.
+#
+# Off by default: latency saved and accessory recall have not been measured
+# yet (bench_cascade.py needs torch, ultralytics and the model weights), so
+# the thresholds below are unvalidated and "skipped" could drop accessories.
+# Run bench_cascade.py, record its numbers here, then enable it. What is
+# known (37 demo_images, 16 px ViT patches): the reduced size gives 1450
+# patch tokens per image on average against 3550 at full size.
+#
+# Env:
+#     CASCADE_ENABLED        1 enables the cascade, 0 = YOLOS always "full",
+#                            no whole-image CLIP pass              (default 0)
+#     CASCADE_SKIP_BELOW     accessory probability below which YOLOS may be skipped
+#     CASCADE_FULL_ABOVE     accessory probability above which YOLOS runs in full
+#     CASCADE_MIN_COVERAGE   garment box / image area needed to skip YOLOS
+# =============================================================================
+
+import os
+
+CASCADE_ENABLED      = os.getenv("CASCADE_ENABLED", "0") == "1"
+CASCADE_SKIP_BELOW   = float(os.getenv("CASCADE_SKIP_BELOW", "0.05"))
+CASCADE_FULL_ABOVE   = float(os.getenv("CASCADE_FULL_ABOVE", "0.25"))
+CASCADE_MIN_COVERAGE = float(os.getenv("CASCADE_MIN_COVERAGE", "0.35"))
+
+# YOLOS default is shortest_edge=800 / longest_edge=1333
+REDUCED_SHORTEST_EDGE = 512
+REDUCED_LONGEST_EDGE  = 853
+
+# LocusVisualizer.clip_labels that YOLOS is there to find
+ACCESSORY_LABELS = {"shoes", "sneakers", "bag", "handbag", "hat", "glasses", "watch"}
+
+
+def clothing_coverage(detections, width, height):
+    """Largest single garment box as a fraction of the image area."""
+    area = float(width * height) or 1.0
+    return max(
+        ((d["bbox"][2] - d["bbox"][0]) * (d["bbox"][3] - d["bbox"][1]) / area for d in detections),
+        default=0.0
+    )
+
+
+def choose_accessory_path(accessory_prob, coverage, enabled=CASCADE_ENABLED):
+    """Returns "full", "reduced" or "skipped" for the YOLOS pass."""
+    if not enabled or accessory_prob >= CASCADE_FULL_ABOVE:
+        return "full"
+    if accessory_prob < CASCADE_SKIP_BELOW and coverage >= CASCADE_MIN_COVERAGE:
+        return "skipped"
+    return "reduced"
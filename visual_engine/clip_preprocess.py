@@ -0,0 +1,129 @@
+# =============================================================================
+# clip_preprocess.py
+# Batched CLIP image preprocessing
+#
+# CLIPProcessor handles one image at a time through several numpy round
+# trips: PIL → float64 array → rescale → normalize → float32 → tensor, which
+# copies each image four or five times. This module does the same
+# resize → center-crop → normalize into one uint8 batch buffer, then one
+# uint8→float32 copy into the output tensor and a fused in-place
+# multiply-add for rescale + normalize.
+#
+# The resize is still PIL bicubic with the exact output-size rule of
+# CLIPImageProcessor, so the pixels match and the vectors already stored in
+# Qdrant stay valid. parity_check() verifies this against the HF processor;
+# run `python clip_preprocess.py` to check on the demo images.
+# =============================================================================
+
+import numpy as np
+import torch
+from PIL import Image
+
+OPENAI_CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+OPENAI_CLIP_STD  = (0.26862954, 0.26130258, 0.27577711)
+
+# Embeddings count as identical below this max abs pixel-tensor difference
+PARITY_TOLERANCE = 1e-4
+
+
+def _edge(size, key):
+    """Reads an edge length from an HF size setting (int, dict or SizeDict)."""
+    if isinstance(size, int):
+        return size
+    return int(size[key])
+
+
+class ClipPreprocessor:
+    def __init__(self, size=224, crop_size=224, mean=OPENAI_CLIP_MEAN,
+                 std=OPENAI_CLIP_STD, resample=Image.BICUBIC):
+        self.size = size
+        self.crop_size = crop_size
+        self.resample = resample
+
+        # (x / 255 - mean) / std  ==  x * scale + shift
+        std = np.asarray(std, dtype=np.float64)
+        mean = np.asarray(mean, dtype=np.float64)
+        self.scale = torch.tensor(1.0 / (255.0 * std), dtype=torch.float32).view(1, 3, 1, 1)
+        self.shift = torch.tensor(-mean / std, dtype=torch.float32).view(1, 3, 1, 1)
+
+    @classmethod
+    def from_clip_processor(cls, processor):
+        """Builds a preprocessor with the same settings as an HF CLIPProcessor."""
+        ip = getattr(processor, "image_processor", processor)
+        return cls(size=_edge(ip.size, "shortest_edge"), crop_size=_edge(ip.crop_size, "height"),
+                   mean=ip.image_mean, std=ip.image_std,
+                   resample=getattr(ip, "resample", None) or Image.BICUBIC)
+
+    def _resize_crop(self, image):
+        """PIL image or HxWx3 uint8 array → crop_size × crop_size × 3 uint8 array."""
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        # Shortest edge → size, long edge scaled with the same int() rounding
+        # as transformers' get_resize_output_image_size
+        w, h = image.size
+        if w <= h:
+            new_w, new_h = self.size, int(self.size * h / w)
+        else:
+            new_w, new_h = int(self.size * w / h), self.size
+        image = image.resize((new_w, new_h), resample=self.resample)
+
+        c = self.crop_size
+        top, left = (new_h - c) // 2, (new_w - c) // 2
+        return np.asarray(image.crop((left, top, left + c, top + c)))
+
+    def __call__(self, images):
+        """
+        images: list of PIL images and/or uint8 HxWx3 arrays (any sizes)
+        Returns: float32 tensor (N, 3, crop_size, crop_size), CLIP-normalized
+        """
+        c = self.crop_size
+        batch = np.empty((len(images), c, c, 3), dtype=np.uint8)
+        for i, image in enumerate(images):
+            batch[i] = self._resize_crop(image)
+
+        pixels = torch.empty((len(images), 3, c, c), dtype=torch.float32)
+        pixels.copy_(torch.from_numpy(batch).permute(0, 3, 1, 2))
+        pixels.mul_(self.scale).add_(self.shift)
+        return pixels
+
+
+def parity_check(preprocessor, clip_processor, images):
+    """
+    Max abs difference between our pixel tensor and CLIPProcessor's for the
+    same images. Anything under PARITY_TOLERANCE gives the same embeddings.
+    """
+    ours = preprocessor(images)
+    theirs = torch.cat([
+        clip_processor(images=image, return_tensors="pt")["pixel_values"] for image in images
+    ])
+    return float((ours - theirs).abs().max())
+
+
+# Parity check on the demo catalog
+if __name__ == "__main__":
+    import os
+    import sys
+    import time
+    from transformers import CLIPProcessor
+
+    folder = sys.argv[1] if len(sys.argv) > 1 else "../demo_images"
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    images = [Image.open(os.path.join(folder, f)).convert("RGB") for f in files]
+
+    processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch16")
+    preprocessor = ClipPreprocessor.from_clip_processor(processor)
+
+    t0 = time.time()
+    for image in images:
+        processor(images=image, return_tensors="pt")
+    t_hf = time.time() - t0
+    t0 = time.time()
+    preprocessor(images)
+    t_ours = time.time() - t0
+
+    diff = parity_check(preprocessor, processor, images)
+    print(f"{len(images)} images: CLIPProcessor {t_hf*1000:.0f}ms, batched {t_ours*1000:.0f}ms")
+    print(f"max abs diff {diff:.2e} -> {'OK' if diff < PARITY_TOLERANCE else 'MISMATCH'}")
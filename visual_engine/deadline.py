@@ -0,0 +1,75 @@
+# =============================================================================
+# deadline.py
+# Request deadlines and per-stage cost estimates
+#
+# The gateway sends the time left in its 15 s end-to-end budget as
+# X-Locus-Budget-Ms. The visual engine turns it into a local monotonic
+# deadline (no clock sync needed between containers) and, before each
+# expensive stage, compares the time left against a running estimate of
+# what that stage costs. If it won't fit, a cheaper path is taken and
+# recorded as a degradation in the response:
+#
+#   rembg_lite           u2netp instead of u2net            (~4x faster)
+#   rembg_skipped        no background removal at all
+#   accessories_reduced  YOLOS at reduced resolution
+#   accessories_skipped  no YOLOS pass
+#   detect_low_res       detection on a 640 px decode
+# =============================================================================
+
+import time
+import threading
+
+BUDGET_HEADER = "X-Locus-Budget-Ms"
+
+# Starting estimates (seconds, CPU) until real timings have been observed
+DEFAULT_COSTS = {
+    "decode":        0.05,
+    "rembg_u2net":   1.5,
+    "rembg_u2netp":  0.4,
+    "clip":          0.3,
+    "clothing":      0.5,
+    "yolos_full":    3.0,
+    "yolos_reduced": 1.2,
+}
+
+# Extra time kept back on top of the estimates (response encoding, network)
+SAFETY_MARGIN_S = 0.5
+
+
+class CostModel:
+    """Exponentially weighted moving average of observed stage durations."""
+
+    def __init__(self, defaults, alpha=0.2):
+        self.alpha = alpha
+        self._costs = dict(defaults)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            previous = self._costs.get(name, seconds)
+            self._costs[name] = previous + self.alpha * (seconds - previous)
+
+    def estimate(self, *names):
+        """Sum of the current estimates for the given stages (+ safety margin)."""
+        with self._lock:
+            return sum(self._costs.get(name, 0.0) for name in names) + SAFETY_MARGIN_S
+
+    def snapshot(self):
+        with self._lock:
+            return {name: round(cost, 3) for name, cost in self._costs.items()}
+
+
+costs = CostModel(DEFAULT_COSTS)
+
+
+def deadline_from_header(value):
+    """X-Locus-Budget-Ms header value → time.monotonic() deadline, or None."""
+    try:
+        return time.monotonic() + max(0.0, float(value)) / 1000.0
+    except (TypeError, ValueError):
+        return None
+
+
+def remaining(deadline):
+    """Seconds left before deadline (infinite when there is no deadline)."""
+    return float("inf") if deadline is None else deadline - time.monotonic()
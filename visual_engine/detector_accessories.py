@@ -18,6 +18,8 @@ import torch
 from PIL import Image
 from transformers import YolosForObjectDetection, YolosImageProcessor
 
+from model_cache import load_pretrained
+
 # Full list of 46 Fashionpedia categories (index = class id)
 FASHIONPEDIA_CATS = [
     'shirt, blouse',
@@ -101,37 +103,62 @@ class AccessoryDetector:
         print("Model size: ~123MB (downloads once, then cached)")
         print("=" * 50)
 
-        # Downloads ~123MB on first run, cached in HuggingFace cache after that
-        self.processor = YolosImageProcessor.from_pretrained(
-            "valentinafeve/yolos-fashionpedia"
+        # Downloads ~123MB on first run; after that a pre-converted
+        # safetensors copy is loaded from the local model cache
+        self.processor = load_pretrained(
+            YolosImageProcessor, "valentinafeve/yolos-fashionpedia"
         )
-        self.model = YolosForObjectDetection.from_pretrained(
-            "valentinafeve/yolos-fashionpedia"
+        self.model = load_pretrained(
+            YolosForObjectDetection, "valentinafeve/yolos-fashionpedia"
         )
         self.model.eval()   # Set to inference mode (disables dropout etc.)
         print("Model 2 ready.")
 
-    def detect(self, pil_image, classify_fn):
+    def warm_up(self):
+        """
+        One throwaway inference so the first real request doesn't pay for
+        lazy allocations and kernel selection.
+        """
+        inputs = self.processor(images=Image.new("RGB", (640, 640)), return_tensors="pt")
+        with torch.no_grad():
+            self.model(**inputs)
+
+    def detect(self, pil_image, classify_fn, size=None):
+        """
+        Runs YOLOS-Fashionpedia on a PIL image and returns all detections at once.
+        See iter_detect() for the arguments.
+        """
+        return list(self.iter_detect(pil_image, classify_fn, size))
+
+    def iter_detect(self, pil_image, classify_fn, size=None):
         """
         Runs YOLOS-Fashionpedia on a PIL image.
-        Only returns accessory detections — clothing is handled by DeepFashion2.
+        Only yields accessory detections — clothing is handled by DeepFashion2.
+        All accessory crops are labelled by CLIP in one batch.
 
         Args:
             pil_image:   PIL.Image — the full photo to scan
-            classify_fn: function(pil_image) -> (label, confidence)
-                         CLIP function passed in from the orchestrator.
+            classify_fn: function(list of PIL.Image) -> list of (label, confidence)
+                         Batched CLIP function passed in from the orchestrator.
                          Used to get a consistent search label from the
                          raw Fashionpedia label.
+            size:        optional processor size override, e.g.
+                         {"shortest_edge": 512, "longest_edge": 853}
+                         for a cheaper low-resolution pass (see cascade.py).
+                         Boxes are still returned in pil_image coordinates.
 
-        Returns:
-            list of dicts: bbox, label, search_label, score, source
+        Yields:
+            dicts: bbox, label, search_label, score, source
         """
-        detections = []
+        found = 0
         try:
             # ── Preprocess ───────────────────────────────────────────────────
             # YOLOS needs the image in a specific format.
             # The processor handles resizing and normalization automatically.
-            inputs = self.processor(images=pil_image, return_tensors="pt")
+            if size:
+                inputs = self.processor(images=pil_image, size=size, return_tensors="pt")
+            else:
+                inputs = self.processor(images=pil_image, return_tensors="pt")
             img_w, img_h = pil_image.size
 
             # ── Inference ────────────────────────────────────────────────────
@@ -149,6 +176,7 @@ class AccessoryDetector:
             )[0]
 
             # ── Filter and format results ─────────────────────────────────────
+            kept = []
             for score, label_id, box in zip(
                 results["scores"],
                 results["labels"],
@@ -174,23 +202,24 @@ class AccessoryDetector:
 
                 # Get the human-readable Fashionpedia label
                 fashionpedia_label = FASHIONPEDIA_CATS[class_id]
+                kept.append(([x1, y1, x2, y2], fashionpedia_label, conf))
 
-                # Use CLIP to get a consistent search label that matches
-                # what's indexed in Qdrant (e.g. "bag, wallet" → "bag")
-                crop       = pil_image.crop((x1, y1, x2, y2))
-                clip_label, _ = classify_fn(crop)
+            # Use CLIP to get a consistent search label that matches
+            # what's indexed in Qdrant (e.g. "bag, wallet" → "bag")
+            crops = [pil_image.crop(tuple(bbox)) for bbox, _, _ in kept]
+            clip_results = classify_fn(crops) if crops else []
 
-                detections.append({
-                    "bbox":         [x1, y1, x2, y2],
+            for (bbox, fashionpedia_label, conf), (clip_label, _) in zip(kept, clip_results):
+                found += 1
+                yield {
+                    "bbox":         bbox,
                     "label":        fashionpedia_label,  # shown to user: "bag, wallet"
                     "search_label": clip_label,          # used for Qdrant: "bag"
                     "score":        round(conf, 3),
                     "source":       "yolos_fashionpedia"
-                })
+                }
 
-            print(f"  YOLOS-Fashionpedia: {len(detections)} accessories found")
+            print(f"  YOLOS-Fashionpedia: {found} accessories found")
 
         except Exception as e:
-            print(f"  YOLOS-Fashionpedia error: {e}")
-
-        return detections
\ No newline at end of file
+            print(f"  YOLOS-Fashionpedia error: {e}")
\ No newline at end of file
@@ -35,30 +35,56 @@ class ClothingDetector:
         print("Loading Model 1: DeepFashion2 (Clothing)")
         print("Covers: shirts, pants, dresses, skirts, outwear")
         print("=" * 50)
-        model_path = hf_hub_download(
-            repo_id="Bingsu/adetailer",
-            filename="deepfashion2_yolov8s-seg.pt"
-        )
+        # Try the local HF cache first — skips the hub round-trip on restarts
+        try:
+            model_path = hf_hub_download(
+                repo_id="Bingsu/adetailer",
+                filename="deepfashion2_yolov8s-seg.pt",
+                local_files_only=True
+            )
+        except Exception:
+            model_path = hf_hub_download(
+                repo_id="Bingsu/adetailer",
+                filename="deepfashion2_yolov8s-seg.pt"
+            )
         self.model = YOLO(model_path)
         print("Model 1 ready.")
 
+    def warm_up(self):
+        """
+        One throwaway inference so the first real request doesn't pay for
+        model fusing and lazy allocations inside ultralytics.
+        """
+        self.model(Image.new("RGB", (640, 640)), verbose=False)
+
     def detect(self, pil_image, classify_fn):
+        """
+        Runs DeepFashion2 on a PIL image and returns all detections at once.
+        See iter_detect() for the arguments.
+        """
+        return list(self.iter_detect(pil_image, classify_fn))
+
+    def iter_detect(self, pil_image, classify_fn):
         """
         Runs DeepFashion2 on a PIL image.
+        All crops from this model are labelled by CLIP in one batch, then each
+        detection is yielded so the streaming /detect endpoint can forward it
+        without waiting for the accessory model.
 
         Args:
             pil_image:   PIL.Image — the full photo to scan
-            classify_fn: function(pil_image) -> (label, confidence)
-                         Provided by the orchestrator (CLIP).
+            classify_fn: function(list of PIL.Image) -> list of (label, confidence)
+                         Provided by the orchestrator (batched CLIP).
                          Used to map DeepFashion2 labels to search-friendly labels.
 
-        Returns:
-            list of dicts: bbox, label, search_label, score, source
+        Yields:
+            dicts: bbox, label, search_label, score, source
         """
-        detections = []
+        found = 0
         try:
             results = self.model(pil_image, conf=MIN_CONFIDENCE, verbose=False)[0]
 
+            kept = []
             for box in results.boxes:
                 class_id = int(box.cls[0])
                 conf = float(box.conf[0])
@@ -69,23 +95,24 @@ class ClothingDetector:
                     continue
 
                 df2_label = DEEPFASHION2_LABELS.get(class_id, "clothing")
+                kept.append(([x1, y1, x2, y2], df2_label, conf))
 
-                # Use CLIP (passed in as classify_fn) to get a consistent
-                # search label that matches the Qdrant index categories
-                crop = pil_image.crop((x1, y1, x2, y2))
-                clip_label, _ = classify_fn(crop)
+            # Use CLIP (passed in as classify_fn) to get a consistent
+            # search label that matches the Qdrant index categories
+            crops = [pil_image.crop(tuple(bbox)) for bbox, _, _ in kept]
+            clip_results = classify_fn(crops) if crops else []
 
-                detections.append({
-                    "bbox":         [x1, y1, x2, y2],
+            for (bbox, df2_label, conf), (clip_label, _) in zip(kept, clip_results):
+                found += 1
+                yield {
+                    "bbox":         bbox,
                     "label":        df2_label,   # shown to user
                     "search_label": clip_label,  # used for Qdrant filter
                     "score":        round(conf, 3),
                     "source":       "deepfashion2"
-                })
+                }
 
-            print(f"  DeepFashion2: {len(detections)} clothing items found")
+            print(f"  DeepFashion2: {found} clothing items found")
 
         except Exception as e:
             print(f"  DeepFashion2 error: {e}")
-
-        return detections
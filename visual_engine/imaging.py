@@ -0,0 +1,76 @@
+# =============================================================================
+# imaging.py
+# Resolution-aware image decoding
+#
+# Phone photos are 12+ MP, but every model here works at a few hundred
+# pixels: YOLOv8 at 640, YOLOS at ≤1333, rembg/CLIP at ≤512. Decoding the
+# full image and shrinking afterwards wastes most of the decode time and
+# ~36 MB of RGB buffer per request.
+#
+# For JPEGs, Image.draft() makes libjpeg decode at 1/2, 1/4 or 1/8 scale
+# directly from the DCT coefficients, so the full-size bitmap never exists.
+# Other formats fall back to a normal decode + thumbnail.
+# =============================================================================
+
+import io
+import time
+from PIL import Image
+
+# Longest side each consumer actually needs
+DETECT_MAX_SIDE    = 1333   # YOLOS image processor's longest edge
+VECTORIZE_MAX_SIDE = 512    # rembg + CLIP path
+
+
+def decode_image(image_bytes, max_side=None, mode="RGB"):
+    """
+    Decodes image bytes at (roughly) the resolution the caller needs.
+
+    Args:
+        image_bytes: raw upload bytes
+        max_side:    longest side wanted, or None for full resolution
+        mode:        PIL mode of the returned image ("RGB", "RGBA", ...)
+
+    Returns:
+        (image, original_size) — original_size is the (W, H) of the encoded
+        file, so callers can map coordinates back to the original image.
+    """
+    t0 = time.time()
+    image = Image.open(io.BytesIO(image_bytes))
+    original_size = image.size
+
+    if max_side and max(original_size) > max_side:
+        ratio = max(original_size) / max_side
+        # draft() only picks a scale whose result is still >= the requested
+        # size, so the thumbnail below never has to upscale
+        image.draft("RGB", (int(original_size[0] / ratio), int(original_size[1] / ratio)))
+        image = image.convert(mode)
+        image.thumbnail((max_side, max_side))
+        print(f"Decoded {original_size} -> {image.size} in {(time.time()-t0)*1000:.0f}ms")
+    else:
+        image = image.convert(mode)
+
+    return image, original_size
+
+
+def decode_for_crops(image_bytes, bboxes, crop_side=VECTORIZE_MAX_SIDE, mode="RGB"):
+    """
+    decode_image() at a resolution where even the smallest of bboxes
+    (original-image coordinates) is still crop_side on its long side, so
+    every box gets at least the pixels the gateway's decode_crop() gives it
+    on its own. Same return value.
+    """
+    W, H = Image.open(io.BytesIO(image_bytes)).size
+    smallest = min((max(x2 - x1, y2 - y1) for x1, y1, x2, y2 in bboxes), default=0)
+    ratio = smallest / crop_side
+    return decode_image(image_bytes, int(max(W, H) / ratio) if ratio > 1 else None, mode)
+
+
+def scale_bbox(bbox, sx, sy, width, height):
+    """Scales an [x1, y1, x2, y2] box by (sx, sy) and clamps it to width × height."""
+    x1, y1, x2, y2 = bbox
+    return [
+        max(0, min(width,  int(round(x1 * sx)))),
+        max(0, min(height, int(round(y1 * sy)))),
+        max(0, min(width,  int(round(x2 * sx)))),
+        max(0, min(height, int(round(y2 * sy)))),
+    ]
@@ -1,46 +1,214 @@
-from fastapi import FastAPI, UploadFile, File
-from vectorizer import LocusVisualizer
+import os
+import json
+import asyncio
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Form
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from vectorizer import LocusVisualizer, VECTORIZE_MODELS, DETECT_MODELS
+from procmem import memory_report
+from pipeline import StagedPipeline
+from deadline import deadline_from_header, costs
+from text_embedder import TextEmbedder
 
 app = FastAPI()
 
-# Initialize the logic class once
-visualizer = LocusVisualizer()
+# Initialize the logic class once. Models load in background threads so the
+# server answers health checks (and /vectorize) before the detectors are up.
+# prefork.py sets VISUAL_PRELOAD=1: it needs everything loaded before forking.
+visualizer = LocusVisualizer(background=os.getenv("VISUAL_PRELOAD") != "1")
+
+# Set by prefork.py in each forked worker; None when run by plain uvicorn
+WORKER_INDEX = None
+
+# rembg and CLIP run in separate worker pools so concurrent /vectorize
+# requests overlap instead of queueing behind each other
+pipeline = StagedPipeline(visualizer)
+
+# Free-text queries share CLIP text-tower passes and an LRU of embeddings
+text_embedder = TextEmbedder(visualizer.embed_texts)
+
+@app.on_event("startup")
+def startup_event():
+    pipeline.start()
+    text_embedder.start()
+
+def require_models(names):
+    if not visualizer.is_ready(*names):
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "Models still loading", "models": visualizer.model_status()}
+        )
 
 @app.get("/")
 def read_root():
-    return {"status": "online", "service": "Locus Visual Engine"}
+    return {
+        "status": "online",
+        "service": "Locus Visual Engine",
+        "ready": visualizer.is_ready(),
+        "vectorize_ready": visualizer.is_ready(*VECTORIZE_MODELS),
+        "detect_ready": visualizer.is_ready(*DETECT_MODELS),
+        "models": visualizer.model_status()
+    }
+
+@app.get("/memory")
+def memory():
+    """
+    Resident vs shared memory of the worker that handled this request.
+    In prefork mode shared_mb should hold most of the model weights.
+    """
+    return {"worker": WORKER_INDEX, **memory_report()}
+
+@app.get("/pipeline")
+def pipeline_stats():
+    """
+    Queue depths and per-stage timings of the rembg → CLIP pipeline, plus
+    the stage cost estimates used for deadline decisions.
+    """
+    return {
+        **pipeline.stats(),
+        "text": text_embedder.stats(),
+        "cost_estimates": costs.snapshot()
+    }
 
 @app.post("/detect")
-async def detect(file: UploadFile = File(...)):
+async def detect(
+    file: UploadFile = File(...),
+    x_locus_budget_ms: str = Header(None)
+):
     """
     NEW ENDPOINT: Detects all fashion objects in an image.
     Returns a list of bounding boxes with labels.
     The user will then pick which one to search for.
+    X-Locus-Budget-Ms (sent by the gateway) lets it take cheaper paths
+    when time is short; those are listed in "degradations".
     """
+    require_models(DETECT_MODELS)
+    deadline = deadline_from_header(x_locus_budget_ms)
     image_data = await file.read()
-    detections, img_width, img_height = visualizer.detect_objects(image_data)
+    detections, img_width, img_height, summary = await run_in_threadpool(
+        visualizer.detect_objects, image_data, deadline=deadline
+    )
     
     return {
         "detections": detections,
         "image_width": img_width,
-        "image_height": img_height
+        "image_height": img_height,
+        "cascade": summary.get("cascade"),
+        "degradations": summary.get("degradations", [])
     }
 
+@app.post("/detect_stream")
+async def detect_stream(
+    file: UploadFile = File(...),
+    x_locus_budget_ms: str = Header(None)
+):
+    """
+    Streaming variant of /detect (NDJSON, one event per line).
+    Each detection is sent as soon as it is ready, so clothing results
+    arrive before the slower YOLOS accessory pass has finished.
+    The last line is always a {"type": "done"} summary event.
+    """
+    require_models(DETECT_MODELS)
+    deadline = deadline_from_header(x_locus_budget_ms)
+    image_data = await file.read()
+
+    # Plain (sync) generator: Starlette iterates it in a worker thread,
+    # so the model calls never block the event loop.
+    def ndjson_events():
+        for event in visualizer.iter_detection_events(image_data, deadline=deadline):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson_events(), media_type="application/x-ndjson")
+
 @app.post("/vectorize")
-async def vectorize(file: UploadFile = File(...)):
+async def vectorize(
+    file: UploadFile = File(...),
+    x_locus_budget_ms: str = Header(None)
+):
     """
     Existing endpoint: vectorizes a single (pre-cropped) image.
     Called AFTER the user selects an object from /detect results.
+    Only needs CLIP + rembg, so it serves while the detectors are still loading.
+    With X-Locus-Budget-Ms set, background removal gets lighter (or is
+    skipped) when the budget is short — see "degradations".
     """
+    require_models(VECTORIZE_MODELS)
+    deadline = deadline_from_header(x_locus_budget_ms)
     image_data = await file.read()
-    vector, category, debug_image = visualizer.process_image(image_data)
+
+    # submit() may block while the pipeline is saturated, so keep it off the loop
+    degradations = []
+    future = await run_in_threadpool(pipeline.submit, image_data, deadline, degradations)
+    vector, category, debug_image, style_tags = await asyncio.wrap_future(future)
 
     if vector:
         return {
             "filename": file.filename, 
             "vector": vector,
             "category": category,
-            "processed_image": debug_image
+            "style_tags": style_tags,
+            "processed_image": debug_image,
+            "degradations": degradations
         }
     else:
-        return {"error": "Failed to process image"}
\ No newline at end of file
+        return {"error": "Failed to process image"}
+
+@app.post("/vectorize_batch")
+async def vectorize_batch(
+    file: UploadFile = File(...),
+    bboxes: str = Form(...),
+    x_locus_budget_ms: str = Header(None)
+):
+    """
+    Vectorizes several regions of one photo in one call.
+    bboxes is a JSON list of [x1, y1, x2, y2] in the uploaded image's pixels.
+    Every crop gets background removal, then all of them share one batched
+    CLIP forward pass. Results come back in the same order as bboxes.
+    """
+    require_models(VECTORIZE_MODELS)
+    deadline = deadline_from_header(x_locus_budget_ms)
+    try:
+        boxes = [[int(v) for v in box] for box in json.loads(bboxes)]
+        if any(len(box) != 4 for box in boxes):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="bboxes must be a JSON list of [x1, y1, x2, y2]")
+    image_data = await file.read()
+
+    degradations = []
+    vectorized = await run_in_threadpool(
+        visualizer.vectorize_crops, image_data, boxes, deadline, degradations
+    )
+
+    results = []
+    for index, (vector, category, debug_image, style_tags) in enumerate(vectorized):
+        if vector:
+            results.append({
+                "index": index,
+                "vector": vector,
+                "category": category,
+                "style_tags": style_tags,
+                "processed_image": debug_image
+            })
+        else:
+            results.append({"index": index, "error": "Failed to process region"})
+
+    return {"results": results, "degradations": sorted(set(degradations))}
+
+@app.post("/embed_text")
+async def embed_text(text: str = Form(...)):
+    """
+    CLIP embedding of a free-text query ("red satin slip dress"), in the
+    same space as /vectorize, plus the category it names (if any).
+    Concurrent queries are batched into one text-encoder pass; repeated
+    queries come from an LRU without touching the model.
+    """
+    require_models(("clip",))
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Empty query")
+    vector, cached = await asyncio.wrap_future(text_embedder.embed(text))
+    return {
+        "vector": vector,
+        "category": visualizer.text_category(text),
+        "cached": cached
+    }
@@ -0,0 +1,80 @@
+# =============================================================================
+# model_cache.py
+# Local on-disk cache for model weights and precomputed tensors
+#
+# from_pretrained("org/model") resolves the repo against the HuggingFace hub
+# and may have to convert legacy pytorch_model.bin checkpoints every start.
+# The first load saves a local safetensors copy under MODEL_CACHE_DIR; every
+# later start loads that copy directly (memory-mapped, no hub round-trip).
+#
+# Small derived tensors (e.g. CLIP text embeddings for the label list) are
+# stored next to it, keyed by a fingerprint of their inputs.
+# =============================================================================
+
+import os
+import shutil
+import hashlib
+import torch
+
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "/root/.cache/locus")
+
+
+def _local_dir(repo_id):
+    return os.path.join(MODEL_CACHE_DIR, "models", repo_id.replace("/", "--"))
+
+
+def load_pretrained(cls, repo_id):
+    """
+    Drop-in replacement for cls.from_pretrained(repo_id) that keeps a
+    pre-serialized safetensors copy in MODEL_CACHE_DIR.
+    Works for models and processors alike (anything with save_pretrained).
+    """
+    local_dir = _local_dir(repo_id)
+    marker = os.path.join(local_dir, cls.__name__ + ".ok")
+
+    if os.path.exists(marker):
+        try:
+            return cls.from_pretrained(local_dir, local_files_only=True)
+        except Exception as e:
+            print(f"  Cached copy of {repo_id} unusable ({e}). Re-downloading.")
+
+    obj = cls.from_pretrained(repo_id)
+    try:
+        # Save into a temp dir and move it in place, so a crash mid-write
+        # never leaves a half-written cache that the next start would trust.
+        tmp_dir = f"{local_dir}.tmp-{os.getpid()}"
+        obj.save_pretrained(tmp_dir)
+        os.makedirs(local_dir, exist_ok=True)
+        for name in os.listdir(tmp_dir):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(local_dir, name))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        open(marker, "w").close()
+    except Exception as e:
+        print(f"  Could not cache {repo_id} locally: {e}")
+    return obj
+
+
+def cached_tensor(name, fingerprint, compute_fn):
+    """
+    Returns compute_fn() but stores the result on disk the first time.
+    The fingerprint (any string) must change whenever the inputs change,
+    e.g. model id + label list, so stale tensors are never reused.
+    """
+    digest = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(MODEL_CACHE_DIR, "tensors", f"{name}-{digest}.pt")
+
+    if os.path.exists(path):
+        try:
+            return torch.load(path)
+        except Exception as e:
+            print(f"  Cached tensor {name} unreadable ({e}). Recomputing.")
+
+    tensor = compute_fn()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        torch.save(tensor, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"  Could not cache tensor {name}: {e}")
+    return tensor
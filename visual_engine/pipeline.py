@@ -0,0 +1,168 @@
+# =============================================================================
+# pipeline.py
+# Stage-pipelined execution of /vectorize across concurrent requests
+#
+#   submit() ──► [bg queue] ──► rembg workers ──► [embed queue] ──► CLIP workers ──► Future
+#
+# Each stage has its own worker pool, connected by bounded queues. While
+# request N is in CLIP, request N+1 can already be in u2net. onnxruntime and
+# torch both release the GIL during inference, so plain threads overlap fine.
+#
+# Bounded queues give backpressure: when CLIP falls behind, rembg workers
+# block on put() instead of piling up decoded images in memory, and submit()
+# blocks once the first queue is full.
+#
+# The CLIP stage also drains whatever is already waiting in its queue (up to
+# PIPELINE_CLIP_BATCH items) into one batched forward pass.
+#
+# Env:
+#     PIPELINE_REMBG_WORKERS  background-removal workers   (default 2)
+#     PIPELINE_CLIP_WORKERS   CLIP embedding workers       (default 1)
+#     PIPELINE_CLIP_BATCH     max images per CLIP batch    (default 8)
+#     PIPELINE_QUEUE_DEPTH    max items waiting per stage  (default 8)
+# =============================================================================
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+REMBG_WORKERS = int(os.getenv("PIPELINE_REMBG_WORKERS", "2"))
+CLIP_WORKERS  = int(os.getenv("PIPELINE_CLIP_WORKERS", "1"))
+CLIP_BATCH    = int(os.getenv("PIPELINE_CLIP_BATCH", "8"))
+QUEUE_DEPTH   = int(os.getenv("PIPELINE_QUEUE_DEPTH", "8"))
+
+
+class _Stage:
+    """
+    One worker pool + its input queue + counters.
+    batch_fn maps a list of items to a list of results; each worker takes up
+    to max_batch items that are already queued (never waits to fill a batch).
+    """
+
+    def __init__(self, name, workers, queue_depth, batch_fn, max_batch=1):
+        self.name = name
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.busy = 0
+        self.processed = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Blocks for one item, then grabs up to max_batch - 1 more without waiting."""
+        jobs = [self.queue.get()]
+        while len(jobs) < self.max_batch:
+            try:
+                jobs.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def stats(self):
+        with self.lock:
+            done = max(self.processed, 1)
+            return {
+                "workers":       self.workers,
+                "queue_depth":   self.queue.qsize(),
+                "queue_max":     self.queue.maxsize,
+                "busy_workers":  self.busy,
+                "processed":     self.processed,
+                "avg_batch":     round(self.processed / max(self.batches, 1), 2),
+                "avg_service_s": round(self.busy_seconds / done, 4),
+                "avg_wait_s":    round(self.wait_seconds / done, 4),
+            }
+
+
+class StagedPipeline:
+    def __init__(self, visualizer, rembg_workers=REMBG_WORKERS,
+                 clip_workers=CLIP_WORKERS, queue_depth=QUEUE_DEPTH):
+        self.visualizer = visualizer
+        self.bg_stage = _Stage(
+            "rembg", rembg_workers, queue_depth,
+            lambda requests: [visualizer.remove_background(*request) for request in requests]
+        )
+        self.embed_stage = _Stage(
+            "clip", clip_workers, queue_depth, visualizer.embed_products, max_batch=CLIP_BATCH
+        )
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts the worker threads. Called from the app's startup event, so in
+        prefork mode every forked worker gets its own threads (threads do not
+        survive fork()).
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            for stage, next_stage in ((self.bg_stage, self.embed_stage), (self.embed_stage, None)):
+                for i in range(stage.workers):
+                    threading.Thread(
+                        target=self._work, args=(stage, next_stage),
+                        name=f"pipeline-{stage.name}-{i}", daemon=True
+                    ).start()
+            self._started = True
+            print(f"Pipeline started: {self.bg_stage.workers} rembg / "
+                  f"{self.embed_stage.workers} CLIP workers, queue depth {self.bg_stage.queue.maxsize}")
+
+    def submit(self, image_bytes, deadline=None, degradations=None):
+        """
+        Queues an image for background removal + embedding.
+        Returns a concurrent.futures.Future resolving to the same
+        (vector, category, debug_image_b64, style_tags) tuple as process_image().
+        Blocks while the first stage's queue is full.
+
+        deadline / degradations are handed to remove_background(); time spent
+        waiting in the queue counts against the deadline, so a backed-up
+        pipeline degrades instead of timing out.
+        """
+        self.start()
+        future = Future()
+        self.bg_stage.queue.put((future, (image_bytes, deadline, degradations), time.time()))
+        return future
+
+    def _work(self, stage, next_stage):
+        while True:
+            jobs = stage.take()
+            started = time.time()
+            with stage.lock:
+                stage.busy += 1
+                stage.wait_seconds += sum(started - enqueued_at for _, _, enqueued_at in jobs)
+            try:
+                results = stage.batch_fn([item for _, item, _ in jobs])
+            except Exception as e:
+                results = [e] * len(jobs)
+            finally:
+                with stage.lock:
+                    stage.busy -= 1
+                    stage.batches += 1
+                    stage.processed += len(jobs)
+                    stage.busy_seconds += time.time() - started
+
+            for (future, _, _), result in zip(jobs, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                elif next_stage is None:
+                    future.set_result(result)
+                elif result is None:
+                    # Rejected in stage 1 (invalid file / ghost image)
+                    future.set_result((None, None, None, None))
+                else:
+                    # Blocks when the next stage is saturated — that's the backpressure
+                    next_stage.queue.put((future, result, time.time()))
+
+    def stats(self):
+        """Per-stage queue depths and timings, for balancing worker counts."""
+        return {
+            "stages": {
+                self.bg_stage.name:    self.bg_stage.stats(),
+                self.embed_stage.name: self.embed_stage.stats(),
+            }
+        }
@@ -0,0 +1,141 @@
+# =============================================================================
+# prefork.py
+# Pre-fork launcher: load the models once, then fork N uvicorn workers
+#
+# `uvicorn main:app` runs one process, so one GIL. `uvicorn --workers N`
+# imports the app in every worker, i.e. N full copies of CLIP, YOLOS,
+# DeepFashion2 and u2net. Here the parent imports main (which builds
+# LocusVisualizer) and only then forks, so the workers share the read-only
+# weight pages copy-on-write.
+#
+# Usage (instead of the uvicorn CMD):
+#     python prefork.py
+#
+# Env:
+#     VISUAL_WORKERS            number of worker processes        (default 2)
+#     VISUAL_THREADS_PER_WORKER torch threads per worker  (default cores // workers)
+#     VISUAL_PORT               listen port                        (default 8001)
+#     MEMORY_REPORT_INTERVAL    seconds between memory reports, 0 = off (default 60)
+# =============================================================================
+
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+
+WORKERS = int(os.getenv("VISUAL_WORKERS", "2"))
+PORT = int(os.getenv("VISUAL_PORT", "8001"))
+THREADS_PER_WORKER = int(os.getenv("VISUAL_THREADS_PER_WORKER", "0")) or max(1, (os.cpu_count() or 1) // WORKERS)
+MEMORY_REPORT_INTERVAL = float(os.getenv("MEMORY_REPORT_INTERVAL", "60"))
+
+# Must be set before torch / onnxruntime are imported:
+#  - the parent never spins up an OpenMP thread team, which is not fork-safe
+#  - rembg sizes its onnxruntime session from OMP_NUM_THREADS, and a session
+#    with a single thread has no pool threads to lose across fork()
+os.environ["OMP_NUM_THREADS"] = "1"
+os.environ["VISUAL_PRELOAD"] = "1"   # main.py loads models in the foreground
+
+import uvicorn
+from procmem import memory_report
+
+
+def run_worker(index, sock):
+    import torch
+    import main as app_module
+
+    # Each worker gets its share of the cores, so N workers never run
+    # more than cpu_count intra-op threads in total
+    torch.set_num_threads(THREADS_PER_WORKER)
+    app_module.WORKER_INDEX = index
+    print(f"[worker {index}] pid={os.getpid()} threads={THREADS_PER_WORKER}")
+
+    config = uvicorn.Config(app_module.app, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def print_memory_table(children):
+    print("-" * 62)
+    print(f"{'worker':<8}{'pid':>8}{'rss MB':>12}{'shared MB':>12}{'private MB':>12}{'pss MB':>10}")
+    for index, pid in sorted(children.items()):
+        report = memory_report(pid)
+        if "error" in report:
+            print(f"{index:<8}{pid:>8}  {report['error']}")
+            continue
+        print(f"{index:<8}{pid:>8}{report['rss_mb']:>12}{report['shared_mb']:>12}"
+              f"{report['private_mb']:>12}{report['pss_mb']:>10}")
+    print("-" * 62)
+
+
+def main():
+    t0 = time.time()
+    print(f"Prefork: loading models once in parent (pid={os.getpid()})...")
+    import main as app_module
+    if not app_module.visualizer.is_ready():
+        print(f"Model loading failed: {app_module.visualizer.model_status()}")
+        sys.exit(1)
+    print(f"Models loaded in {(time.time()-t0):.1f}s")
+
+    # Move everything allocated so far out of the GC's generations: otherwise
+    # the first collection in each worker writes to every object header and
+    # un-shares those pages
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = {}   # worker index -> pid
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                run_worker(index, sock)
+            finally:
+                os._exit(0)
+        children[index] = pid
+
+    def shutdown(signum, frame):
+        print("Prefork: stopping workers...")
+        for pid in children.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children.values():
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sys.exit(0)
+
+    for index in range(WORKERS):
+        spawn(index)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    print(f"Prefork: {WORKERS} workers on :{PORT}, {THREADS_PER_WORKER} threads each")
+
+    # Supervise: respawn crashed workers, print memory periodically
+    last_report = time.time()
+    while True:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            for index, child_pid in list(children.items()):
+                if child_pid == pid:
+                    print(f"[worker {index}] exited ({status}). Respawning.")
+                    spawn(index)
+        if MEMORY_REPORT_INTERVAL and time.time() - last_report >= MEMORY_REPORT_INTERVAL:
+            print_memory_table(children)
+            last_report = time.time()
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
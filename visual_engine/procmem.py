@@ -0,0 +1,42 @@
+# =============================================================================
+# procmem.py
+# Resident vs shared memory of a process (Linux /proc only)
+#
+# In prefork mode the model weights are loaded once in the parent and shared
+# copy-on-write by every worker. RSS alone counts those shared pages in every
+# worker, so it overstates the real cost; PSS splits shared pages evenly
+# between the processes that map them, and Private_* is what a worker owns.
+# =============================================================================
+
+import os
+
+_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory_report(pid="self"):
+    """
+    Returns memory usage in MB:
+        {"pid", "rss_mb", "pss_mb", "shared_mb", "private_mb"}
+    or {"pid", "error"} when /proc is unavailable (e.g. macOS dev machines).
+    """
+    values = {}
+    try:
+        # smaps_rollup is the cheap pre-summed version of smaps (Linux 4.14+)
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(":") in _FIELDS:
+                    values[parts[0].rstrip(":")] = int(parts[1])   # kB
+    except OSError as e:
+        return {"pid": os.getpid() if pid == "self" else pid, "error": str(e)}
+
+    def mb(*keys):
+        return round(sum(values.get(k, 0) for k in keys) / 1024, 1)
+
+    return {
+        "pid":        os.getpid() if pid == "self" else pid,
+        "rss_mb":     mb("Rss"),
+        "pss_mb":     mb("Pss"),
+        "shared_mb":  mb("Shared_Clean", "Shared_Dirty"),
+        "private_mb": mb("Private_Clean", "Private_Dirty"),
+    }
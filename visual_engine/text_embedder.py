@@ -0,0 +1,144 @@
+# =============================================================================
+# text_embedder.py
+# Free-text → CLIP embedding, micro-batched and cached (/embed_text)
+#
+#   embed() ──► LRU hit? ──► vector
+#                  │ miss
+#                  ▼
+#             [queue] ──► encoder thread ──► one text-tower pass per batch
+#
+# Concurrent queries that arrive within TEXT_BATCH_WINDOW_MS of each other
+# share one forward pass (up to TEXT_MAX_BATCH). Normalized embeddings are
+# kept in an LRU keyed on the normalized query text, so popular queries
+# never touch the model.
+#
+# Env:
+#     TEXT_MAX_BATCH        max queries per forward pass          (default 32)
+#     TEXT_BATCH_WINDOW_MS  how long to wait for more queries     (default 5)
+#     TEXT_CACHE_SIZE       embeddings kept in the LRU            (default 4096)
+# =============================================================================
+
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+TEXT_MAX_BATCH       = int(os.getenv("TEXT_MAX_BATCH", "32"))
+TEXT_BATCH_WINDOW_MS = float(os.getenv("TEXT_BATCH_WINDOW_MS", "5"))
+TEXT_CACHE_SIZE      = int(os.getenv("TEXT_CACHE_SIZE", "4096"))
+
+
+def normalize_query(text):
+    """Cache key: lower-case, single-spaced."""
+    return " ".join(text.lower().split())
+
+
+class TextEmbedder:
+    """
+    encode_fn maps a list of strings to a (N, D) tensor of L2-normalized
+    embeddings (LocusVisualizer._encode_texts).
+    """
+
+    def __init__(self, encode_fn, max_batch=TEXT_MAX_BATCH,
+                 window_ms=TEXT_BATCH_WINDOW_MS, cache_size=TEXT_CACHE_SIZE):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self.cache_size = cache_size
+        self.queue = queue.Queue()
+        self._cache = OrderedDict()   # normalized text -> list[float]
+        self._lock = threading.Lock()
+        self._started = False
+        self.hits = self.misses = self.batches = self.encoded = 0
+
+    def start(self):
+        """Starts the encoder thread (once per process, see StagedPipeline.start)."""
+        with self._lock:
+            if self._started:
+                return
+            threading.Thread(target=self._work, name="text-embedder", daemon=True).start()
+            self._started = True
+
+    def embed(self, text):
+        """
+        Returns a Future resolving to (vector, cached). Cache hits resolve
+        immediately; misses wait for the next batch.
+        """
+        key = normalize_query(text)
+        future = Future()
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                future.set_result((vector, True))
+                return future
+            self.misses += 1
+        self.start()
+        self.queue.put((key, future))
+        return future
+
+    def _take(self):
+        """Blocks for one query, then collects more for up to the batch window."""
+        jobs = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(jobs) < self.max_batch:
+            left = deadline - time.monotonic()
+            try:
+                jobs.append(self.queue.get(timeout=left) if left > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _work(self):
+        while True:
+            jobs = self._take()
+            # Same text queued twice in one window is encoded once
+            texts = list(dict.fromkeys(key for key, _ in jobs))
+            vectors, errors = self._encode(texts)
+
+            with self._lock:
+                self.batches += 1
+                self.encoded += len(texts)
+                for key, vector in vectors.items():
+                    self._cache[key] = vector
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for key, future in jobs:
+                if key in errors:
+                    future.set_exception(errors[key])
+                else:
+                    future.set_result((vectors[key], False))
+
+    def _encode(self, texts):
+        """
+        ({text: vector}, {text: exception}). If the batch fails, its texts
+        are retried one by one so a bad query only fails its own future.
+        """
+        try:
+            return dict(zip(texts, self.encode_fn(texts).tolist())), {}
+        except Exception as e:
+            if len(texts) == 1:
+                return {}, {texts[0]: e}
+        vectors, errors = {}, {}
+        for text in texts:
+            try:
+                vectors[text] = self.encode_fn([text]).tolist()[0]
+            except Exception as e:
+                errors[text] = e
+        return vectors, errors
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cached":    len(self._cache),
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "batches":   self.batches,
+                "avg_batch": round(self.encoded / max(self.batches, 1), 2),
+            }
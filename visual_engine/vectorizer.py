@@ -2,111 +2,352 @@
 # vectorizer.py
 # Orchestrator — loads all models and coordinates the pipeline
 #
-# Detection models (run independently, results merged):
+# Detection models (results merged):
 #   detector_clothing.py    — DeepFashion2 (shirts, pants, dresses, skirts...)
-#   detector_accessories.py — YOLOv8 COCO (shoes, bags, ties...)
+#   detector_accessories.py — YOLOS-Fashionpedia (shoes, bags, hats...)
+#                             run in full, reduced or skipped — see cascade.py
 #
 # Shared utilities:
 #   CLIP  — vectorization + category classification
 #   rembg — background removal
+#
+# All four models load in parallel and report readiness individually, so
+# /vectorize can serve as soon as CLIP and rembg are up (model_cache.py keeps
+# pre-serialized weights and the CLIP text embeddings on disk).
 # =============================================================================
 
 import torch
 import io
+import re
 import base64
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
 from rembg import remove, new_session
 
 from detector_clothing import ClothingDetector
 from detector_accessories import AccessoryDetector
+from model_cache import load_pretrained, cached_tensor
+from clip_preprocess import ClipPreprocessor, parity_check, PARITY_TOLERANCE
+from imaging import decode_image, decode_for_crops, scale_bbox, DETECT_MAX_SIDE, VECTORIZE_MAX_SIDE
+from deadline import costs, remaining
+from cascade import (
+    choose_accessory_path, clothing_coverage, CASCADE_ENABLED, ACCESSORY_LABELS,
+    REDUCED_SHORTEST_EDGE, REDUCED_LONGEST_EDGE
+)
+
+CLIP_MODEL_ID = "openai/clip-vit-base-patch16"
+
+# Style tags: a style is tagged when its share of the softmax over all
+# STYLE_PROMPTS reaches STYLE_TAG_MIN_PROB (at most STYLE_TAGS_MAX, best first)
+STYLE_TAG_MIN_PROB = 0.2
+STYLE_TAGS_MAX     = 3
+
+# Models that each endpoint needs before it can serve
+VECTORIZE_MODELS = ("clip", "rembg")
+DETECT_MODELS    = ("clip", "clothing", "accessories")
 
 
 class LocusVisualizer:
-    def __init__(self):
+    def __init__(self, background=False):
+        """
+        Loads all four models in parallel (they are independent).
+
+        background=False: blocks until everything is loaded (scripts, prefork).
+        background=True:  returns immediately so uvicorn can start serving;
+                          check is_ready() / model_status() before using a model.
+        """
+
+        # ── CLIP labels ───────────────────────────────────────────────────────
+        self.clip_labels = [
+            "dress", "pants", "jeans", "shirt", "t-shirt",
+            "jacket", "coat", "shoes", "sneakers", "bag",
+            "handbag", "skirt", "shorts", "hat", "glasses", "watch"
+        ]
+
+        # ── Style anchors (outfit completion) ─────────────────────────────────
+        # Scored against every product embedding at ingest; stored as tags
+        self.style_prompts = {
+            "casual":     "a photo of casual everyday clothing",
+            "formal":     "a photo of formal office wear",
+            "evening":    "a photo of elegant evening wear",
+            "streetwear": "a photo of urban streetwear",
+            "sporty":     "a photo of sporty athletic wear",
+            "boho":       "a photo of bohemian boho style clothing",
+            "minimalist": "a photo of minimalist neutral-toned clothing",
+            "vintage":    "a photo of vintage retro style clothing",
+            "summer":     "a photo of light summer beachwear",
+        }
+        self.style_names = list(self.style_prompts)
+
+        # ── Per-model readiness ───────────────────────────────────────────────
+        loaders = {
+            "clip":        self._load_clip,
+            "rembg":       self._load_rembg,
+            "clothing":    self._load_clothing_detector,
+            "accessories": self._load_accessory_detector,
+        }
+        self._ready  = {name: threading.Event() for name in loaders}
+        self._errors = {}
+
+        self._loader_pool = ThreadPoolExecutor(max_workers=len(loaders))
+        for name, loader in loaders.items():
+            self._loader_pool.submit(self._run_loader, name, loader)
+        self._loader_pool.shutdown(wait=not background)
+
+    # =========================================================================
+    # Model loading
+    # =========================================================================
+    def _run_loader(self, name, loader):
+        t0 = time.time()
+        try:
+            loader()
+            self._ready[name].set()
+            print(f"[{name}] ready in {(time.time()-t0):.1f}s")
+        except Exception as e:
+            self._errors[name] = str(e)
+            print(f"[{name}] failed to load: {e}")
+
+        if all(event.is_set() for event in self._ready.values()):
+            print("=" * 50)
+            print("LOCUS VISUAL ENGINE READY")
+            print("=" * 50)
 
+    def _load_clothing_detector(self):
         # ── Detection Model 1 ─────────────────────────────────────────────────
         self.clothing_detector = ClothingDetector()
+        self.clothing_detector.warm_up()
 
+    def _load_accessory_detector(self):
         # ── Detection Model 2 ─────────────────────────────────────────────────
         self.accessory_detector = AccessoryDetector()
+        self.accessory_detector.warm_up()
 
+    def _load_clip(self):
         # ── CLIP ──────────────────────────────────────────────────────────────
         print("Loading CLIP (Vectorization & Classification)")
-        self.clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch16")
-        self.clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch16")
+        clip_model = load_pretrained(CLIPModel, CLIP_MODEL_ID)
+        clip_model.eval()
+        self.clip_processor = load_pretrained(CLIPProcessor, CLIP_MODEL_ID)
+        self.clip_model = clip_model
+
+        # Batched tensor preprocessing — must match CLIPProcessor exactly, or
+        # new query vectors would drift from the ones already in Qdrant.
+        # If it doesn't (e.g. a torchvision "fast" processor is configured),
+        # keep using CLIPProcessor itself.
+        self.clip_preprocess = ClipPreprocessor.from_clip_processor(self.clip_processor)
+        probe = Image.effect_noise((301, 173), 64).convert("RGB")
+        diff = parity_check(self.clip_preprocess, self.clip_processor, [probe])
+        if diff > PARITY_TOLERANCE:
+            print(f"CLIP preprocessing parity check failed (max diff {diff:.2e}). "
+                  "Falling back to CLIPProcessor.")
+            self.clip_preprocess = lambda images: self.clip_processor(
+                images=images, return_tensors="pt"
+            )["pixel_values"]
+
+        # Text embeddings depend only on the model and the label list,
+        # so they are computed once and then read back from disk
+        self.text_features = cached_tensor(
+            "clip_text_features",
+            CLIP_MODEL_ID + "|" + "|".join(self.clip_labels),
+            lambda: self._encode_texts(self.clip_labels),
+        )
+        self.style_features = cached_tensor(
+            "clip_style_features",
+            CLIP_MODEL_ID + "|" + "|".join(f"{k}={v}" for k, v in self.style_prompts.items()),
+            lambda: self._encode_texts(list(self.style_prompts.values())),
+        )
+
+        # Warm-up: one image forward pass before reporting ready
+        self._classify_crops([Image.new("RGB", (224, 224), (255, 255, 255))])
 
+    def _load_rembg(self):
         # ── rembg ─────────────────────────────────────────────────────────────
         print("Loading rembg (Background Removal)")
-        self.rembg_session = new_session("u2net")
-
-        # ── CLIP labels ───────────────────────────────────────────────────────
-        self.clip_labels = [
-            "dress", "pants", "jeans", "shirt", "t-shirt",
-            "jacket", "coat", "shoes", "sneakers", "bag",
-            "handbag", "skirt", "shorts", "hat", "glasses", "watch"
-        ]
-
-        # Pre-compute text embeddings once at startup
-        print("Pre-computing CLIP text embeddings...")
+        session = new_session("u2net")
+        # u2netp (~4 MB) is the fallback when a request's deadline is tight
+        lite_session = new_session("u2netp")
+        for warm_session in (session, lite_session):
+            remove(Image.new("RGBA", (64, 64), (255, 255, 255, 255)), session=warm_session)
+        self.rembg_session = session
+        self.rembg_lite_session = lite_session
+
+    def _encode_texts(self, texts):
+        """Normalized CLIP text embeddings for a list of strings."""
+        # Longer than CLIP's context window (77 tokens) would raise in the text model
         text_inputs = self.clip_processor(
-            text=self.clip_labels, return_tensors="pt", padding=True
+            text=texts, return_tensors="pt", padding=True, truncation=True,
+            max_length=self.clip_processor.tokenizer.model_max_length
         )
         with torch.no_grad():
-            self.text_features = self.clip_model.get_text_features(**text_inputs)
-            self.text_features /= self.text_features.norm(p=2, dim=-1, keepdim=True)
+            features = self.clip_model.get_text_features(**text_inputs)
+        return features / features.norm(p=2, dim=-1, keepdim=True)
 
-        print("=" * 50)
-        print("LOCUS VISUAL ENGINE READY")
-        print("=" * 50)
+    # =========================================================================
+    # Readiness
+    # =========================================================================
+    def is_ready(self, *names):
+        """True when every named model (default: all of them) is loaded."""
+        names = names or tuple(self._ready)
+        return all(self._ready[name].is_set() for name in names)
+
+    def model_status(self):
+        """{"clip": "ready" | "loading" | "error", ...}"""
+        status = {}
+        for name, event in self._ready.items():
+            if event.is_set():
+                status[name] = "ready"
+            elif name in self._errors:
+                status[name] = "error"
+            else:
+                status[name] = "loading"
+        return status
 
     # =========================================================================
     # PUBLIC METHOD 1: detect_objects()
     # =========================================================================
-    def detect_objects(self, image_bytes):
+    def detect_objects(self, image_bytes, cascade=CASCADE_ENABLED, deadline=None):
         """
-        Runs both detection models independently on the same image.
+        Runs both detection models on the same image.
         Merges their results into a single list for the user to pick from.
 
+        Thin wrapper that drains iter_detection_events() — see there for the flow.
+        Returns (detections, image_width, image_height, summary) where summary
+        is the final "done" event (cascade path, degradations, timing).
+        """
+        detections, W, H, summary = [], 0, 0, {}
+        for event in self.iter_detection_events(image_bytes, cascade, deadline):
+            if event["type"] == "image":
+                W, H = event["image_width"], event["image_height"]
+            elif event["type"] == "detection":
+                detections.append(event["detection"])
+            elif event["type"] == "done":
+                summary = event
+        return detections, W, H, summary
+
+    # =========================================================================
+    # PUBLIC METHOD 1b: iter_detection_events()
+    # =========================================================================
+    def iter_detection_events(self, image_bytes, cascade=CASCADE_ENABLED, deadline=None):
+        """
+        Streaming version of detect_objects().
+        Yields one event dict at a time so callers can forward each detection
+        the moment it is ready instead of waiting for the slowest model.
+
         Flow:
-            1. ClothingDetector  → finds shirts, pants, dresses, etc.
-            2. AccessoryDetector → finds shoes, bags, etc.
-            3. Results merged (simple concatenation, no cross-model logic)
-            4. Fallback to full-image CLIP if both models find nothing
+            1. ClothingDetector  → finds shirts, pants, dresses, etc.  (fast)
+            2. CLIP gate on the whole image → how likely are accessories?
+            3. AccessoryDetector → full, reduced resolution, or skipped
+               depending on step 1 + 2 (see cascade.py)
+            4. Results merged (simple concatenation, no cross-model logic)
+            5. Fallback to full-image CLIP if both models find nothing
+
+        deadline: optional time.monotonic() deadline. When the estimated cost
+        of a step doesn't fit, a cheaper path is taken and listed in the done
+        event's "degradations" (see deadline.py).
+
+        Events (in order):
+            {"type": "image",     "image_width": W, "image_height": H}
+            {"type": "detection", "index": i, "detection": {...}}   0..n times
+            {"type": "error",     "detail": "..."}                  only on failure
+            {"type": "done",      "count": n, "elapsed": seconds,
+                                  "cascade": {"path", "accessory_prob", "clothing_coverage"},
+                                  "degradations": [...]}
         """
         t0 = time.time()
+        count = 0
+        cascade_info = None
+        degradations = []
         try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            W, H = image.size
+            # Decode at the detectors' working resolution (JPEG draft mode),
+            # then map boxes back to original-image coordinates
+            max_side = DETECT_MAX_SIDE
+            if remaining(deadline) < costs.estimate("decode", "clothing", "clip", "yolos_reduced"):
+                max_side = 640
+                degradations.append("detect_low_res")
+            image, (W, H) = decode_image(image_bytes, max_side)
+            sx, sy = W / image.width, H / image.height
+            yield {"type": "image", "image_width": W, "image_height": H}
 
             # Both detectors receive the same image and the same classify_fn.
-            # They run completely independently.
-            clothing    = self.clothing_detector.detect(image, self._classify_crop)
-            accessories = self.accessory_detector.detect(image, self._classify_crop)
-
-            # Merge — simple concatenation, no shared logic
-            all_detections = clothing + accessories
+            # Clothing goes first because DeepFashion2 is much faster than
+            # the YOLOS ViT.
+            clothing = []
+            t_stage = time.time()
+            for detection in self.clothing_detector.iter_detect(image, self._classify_crops):
+                clothing.append(dict(detection))
+                detection["bbox"] = scale_bbox(detection["bbox"], sx, sy, W, H)
+                yield {"type": "detection", "index": count, "detection": detection}
+                count += 1
+            costs.record("clothing", time.time() - t_stage)
+
+            # With the cascade on, one CLIP pass over the whole image gates
+            # YOLOS and doubles as the fallback classification below
+            whole_probs = accessory_prob = None
+            coverage = clothing_coverage(clothing, image.width, image.height)
+            if cascade:
+                whole_probs = self._label_probs([image])[0]
+                accessory_prob = sum(
+                    float(p) for label, p in zip(self.clip_labels, whole_probs) if label in ACCESSORY_LABELS
+                )
+            path = choose_accessory_path(accessory_prob, coverage, enabled=cascade)
+
+            # Deadline overrides: step down while the chosen path doesn't fit
+            if path == "full" and remaining(deadline) < costs.estimate("yolos_full"):
+                path = "reduced"
+                degradations.append("accessories_reduced")
+            if path == "reduced" and remaining(deadline) < costs.estimate("yolos_reduced"):
+                path = "skipped"
+                degradations.append("accessories_skipped")
+
+            cascade_info = {
+                "path":              path,
+                "accessory_prob":    None if accessory_prob is None else round(accessory_prob, 3),
+                "clothing_coverage": round(coverage, 3),
+            }
+            if cascade:
+                print(f"  Cascade: YOLOS {path} (accessory p={accessory_prob:.2f}, coverage={coverage:.2f})")
+
+            if path != "skipped":
+                size = None
+                if path == "reduced":
+                    size = {"shortest_edge": REDUCED_SHORTEST_EDGE, "longest_edge": REDUCED_LONGEST_EDGE}
+                t_stage = time.time()
+                for detection in self.accessory_detector.iter_detect(image, self._classify_crops, size):
+                    detection["bbox"] = scale_bbox(detection["bbox"], sx, sy, W, H)
+                    yield {"type": "detection", "index": count, "detection": detection}
+                    count += 1
+                costs.record(f"yolos_{path}", time.time() - t_stage)
 
             # Fallback if both models found nothing
-            if not all_detections:
+            if count == 0:
                 print("Both models found nothing. Running full-image CLIP fallback.")
-                clip_label, clip_conf = self._classify_crop(image)
+                if whole_probs is None:
+                    whole_probs = self._label_probs([image])[0]
+                clip_conf, top_idx = whole_probs.max(dim=-1)
+                clip_label, clip_conf = self.clip_labels[int(top_idx)], float(clip_conf)
                 if clip_conf >= 0.35:
-                    all_detections.append({
+                    yield {"type": "detection", "index": 0, "detection": {
                         "bbox":         [0, 0, W, H],
                         "label":        clip_label,
                         "search_label": clip_label,
                         "score":        round(clip_conf, 3),
                         "source":       "clip_fallback"
-                    })
-
-            print(f"Total: {len(all_detections)} detections in {(time.time()-t0):.2f}s")
-            return all_detections, W, H
+                    }}
+                    count = 1
 
         except Exception as e:
             print(f"detect_objects() error: {e}")
-            return [], 0, 0
+            yield {"type": "error", "detail": str(e)}
+
+        elapsed = time.time() - t0
+        print(f"Total: {count} detections in {elapsed:.2f}s")
+        yield {
+            "type": "done", "count": count, "elapsed": round(elapsed, 3),
+            "cascade": cascade_info, "degradations": degradations
+        }
 
     # =========================================================================
     # PUBLIC METHOD 2: process_image()
@@ -119,27 +360,66 @@ class LocusVisualizer:
         3. Smart crop to content bounding box
         4. CLIP vectorization (512-dim vector for Qdrant)
         5. Category classification with 45% confidence threshold
+
+        Runs both stages back to back. Under concurrent load the API uses
+        pipeline.StagedPipeline instead, which overlaps stage 1 of one
+        request with stage 2 of another.
         """
         t0 = time.time()
-        try:
-            try:
-                input_image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
-                original_size = input_image.size
-            except Exception:
-                print("Not a valid image file.")
-                return None, None, None
+        white_bg = self.remove_background(image_bytes)
+        if white_bg is None:
+            return None, None, None, None
+        result = self.embed_product(white_bg)
+        print(f"process_image() done in {(time.time()-t0):.2f}s")
+        return result
 
-            if max(input_image.size) > 512:
-                input_image.thumbnail((512, 512))
-                print(f"Resized {original_size} -> {input_image.size}")
+    # =========================================================================
+    # PIPELINE STAGE 1: remove_background()
+    # =========================================================================
+    def remove_background(self, image_bytes, deadline=None, degradations=None):
+        """
+        Decode → rembg → ghost check → smart crop → paste on white.
+        Returns an RGB PIL image ready for CLIP, or None if rejected.
+
+        deadline: optional time.monotonic() deadline. If u2net + CLIP won't
+        fit in the time left, u2netp is used instead, and if even that won't
+        fit the background is kept. The choice is appended to degradations.
+        """
+        try:
+            # Reduced-size decode straight to ≤512 px (no full-res bitmap)
+            input_image, _ = decode_image(image_bytes, VECTORIZE_MAX_SIDE, mode="RGBA")
+        except Exception:
+            print("Not a valid image file.")
+            return None
+        return self._cut_out(input_image, deadline, degradations)
+
+    def _cut_out(self, input_image, deadline=None, degradations=None):
+        """remove_background() on an already decoded RGBA image."""
+        if degradations is None:
+            degradations = []
+        try:
+            left = remaining(deadline)
+            if left >= costs.estimate("rembg_u2net", "clip"):
+                session, cost_name = self.rembg_session, "rembg_u2net"
+            elif left >= costs.estimate("rembg_u2netp", "clip"):
+                session, cost_name = self.rembg_lite_session, "rembg_u2netp"
+                degradations.append("rembg_lite")
+            else:
+                # Out of time: embed the product with its background
+                degradations.append("rembg_skipped")
+                white_bg = Image.new("RGB", input_image.size, (255, 255, 255))
+                white_bg.paste(input_image, mask=input_image.split()[3])
+                return white_bg
 
             print("Removing background...")
-            output_image = remove(input_image, session=self.rembg_session)
+            t_stage = time.time()
+            output_image = remove(input_image, session=session)
+            costs.record(cost_name, time.time() - t_stage)
 
             alpha_max = output_image.getextrema()[3][1]
             if alpha_max == 0:
                 print("Ghost image detected. Rejecting.")
-                return None, None, None
+                return None
 
             bbox = output_image.getbbox()
             if bbox:
@@ -147,18 +427,106 @@ class LocusVisualizer:
 
             white_bg = Image.new("RGB", output_image.size, (255, 255, 255))
             white_bg.paste(output_image, mask=output_image.split()[3])
+            return white_bg
 
-            clip_inputs = self.clip_processor(images=white_bg, return_tensors="pt")
-            with torch.no_grad():
-                image_features = self.clip_model.get_image_features(**clip_inputs)
+        except Exception as e:
+            print(f"remove_background() error: {e}")
+            return None
 
-            image_features /= image_features.norm(p=2, dim=-1, keepdim=True)
-            vector = image_features[0].tolist()
+    # =========================================================================
+    # PUBLIC METHOD 3: vectorize_crops()
+    # =========================================================================
+    def vectorize_crops(self, image_bytes, bboxes, deadline=None, degradations=None):
+        """
+        process_image() for several boxes of the same photo (/search_all).
+        The photo is decoded once, each box goes through rembg, and all
+        cut-outs are embedded in a single batched CLIP pass.
 
+        Returns one (vector, category, debug_image_b64, style_tags) per box,
+        in order; all None for boxes that are empty or rejected.
+        """
+        t0 = time.time()
+        try:
+            # Only the resolution the smallest box needs, like /search's crop
+            image, (W, H) = decode_for_crops(image_bytes, bboxes, VECTORIZE_MAX_SIDE, mode="RGBA")
+        except Exception:
+            print("Not a valid image file.")
+            return [(None, None, None, None)] * len(bboxes)
+
+        sx, sy = image.width / W, image.height / H
+        cut_outs = []
+        for bbox in bboxes:
+            x1, y1, x2, y2 = scale_bbox(bbox, sx, sy, image.width, image.height)
+            if x2 <= x1 or y2 <= y1:
+                cut_outs.append(None)
+                continue
+            crop = image.crop((x1, y1, x2, y2))
+            crop.thumbnail((VECTORIZE_MAX_SIDE, VECTORIZE_MAX_SIDE))
+            cut_outs.append(self._cut_out(crop, deadline, degradations))
+
+        kept = [white_bg for white_bg in cut_outs if white_bg is not None]
+        embedded = iter(self.embed_products(kept) if kept else [])
+        results = [
+            next(embedded) if white_bg is not None else (None, None, None, None)
+            for white_bg in cut_outs
+        ]
+        print(f"vectorize_crops() {len(bboxes)} boxes in {(time.time()-t0):.2f}s")
+        return results
+
+    # =========================================================================
+    # PUBLIC METHOD 4: embed_texts() / text_category()
+    # =========================================================================
+    def embed_texts(self, texts):
+        """
+        L2-normalized CLIP text embeddings, (N, 512) — the same space as the
+        product vectors, so they can query Qdrant directly (/embed_text).
+        """
+        return self._encode_texts(texts)
+
+    def text_category(self, text):
+        """
+        The clip_label a text query names ("red satin slip dresses" → "dress"),
+        or None. Longest label first, so "t-shirt" wins over "shirt".
+        """
+        words = set(re.findall(r"[a-z-]+", text.lower()))
+        for label in sorted(self.clip_labels, key=len, reverse=True):
+            if label in words or label + "s" in words or label + "es" in words:
+                return label
+        return None
+
+    # =========================================================================
+    # PIPELINE STAGE 2: embed_products()
+    # =========================================================================
+    def embed_product(self, white_bg):
+        """Single-image version of embed_products()."""
+        return self.embed_products([white_bg])[0]
+
+    def embed_products(self, white_bgs):
+        """
+        CLIP vectorization + category classification of background-removed
+        images, in one batched forward pass.
+        Style tags reuse the same image embeddings against the precomputed
+        style prompt embeddings (no extra forward pass).
+        Returns [(vector, category, debug_image_b64, style_tags), ...].
+        """
+        try:
+            t_stage = time.time()
+            image_features = self._image_features(white_bgs)
             similarity = (100.0 * image_features @ self.text_features.T).softmax(dim=-1)
-            top_score, top_idx = similarity[0].topk(1)
-            confidence = top_score[0].item()
-            best_label = self.clip_labels[top_idx[0]]
+            top_scores, top_idx = similarity.max(dim=-1)
+            style_probs = (100.0 * image_features @ self.style_features.T).softmax(dim=-1)
+            costs.record("clip", (time.time() - t_stage) / len(white_bgs))
+        except Exception as e:
+            print(f"embed_products() error: {e}")
+            return [(None, None, None, None)] * len(white_bgs)
+
+        results = []
+        for white_bg, features, score, idx, styles in zip(
+            white_bgs, image_features, top_scores, top_idx, style_probs
+        ):
+            vector = features.tolist()
+            confidence = score.item()
+            best_label = self.clip_labels[int(idx)]
 
             if confidence < 0.45:
                 print(f"Low confidence ({confidence:.2f}) for '{best_label}'. No category filter.")
@@ -171,28 +539,46 @@ class LocusVisualizer:
             white_bg.save(buf, format="PNG")
             debug_img_b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
 
-            print(f"process_image() done in {(time.time()-t0):.2f}s")
-            return vector, detected_category, debug_img_b64
+            results.append((vector, detected_category, debug_img_b64, self._style_tags(styles)))
+        return results
 
-        except Exception as e:
-            print(f"process_image() error: {e}")
-            return None, None, None
+    def _style_tags(self, style_probs):
+        """Style names whose probability reaches STYLE_TAG_MIN_PROB (best first, always ≥ 1)."""
+        probs, order = style_probs.sort(descending=True)
+        tags = [
+            self.style_names[int(i)]
+            for p, i in zip(probs[:STYLE_TAGS_MAX], order[:STYLE_TAGS_MAX])
+            if float(p) >= STYLE_TAG_MIN_PROB
+        ]
+        return tags or [self.style_names[int(order[0])]]
 
     # =========================================================================
-    # PRIVATE: _classify_crop()
-    # Shared CLIP utility — passed into both detectors as classify_fn
+    # PRIVATE: _image_features() / _classify_crops()
+    # Shared CLIP utilities — _classify_crops is passed into both detectors
     # =========================================================================
-    def _classify_crop(self, pil_image):
+    def _image_features(self, pil_images):
         """
-        Runs CLIP zero-shot classification on a PIL image.
-        Returns (best_label, confidence) from self.clip_labels.
+        L2-normalized CLIP embeddings for a list of PIL images, computed in
+        one batched forward pass. Returns a (N, 512) tensor.
         """
-        clip_inputs = self.clip_processor(images=pil_image, return_tensors="pt")
+        pixel_values = self.clip_preprocess(pil_images)
         with torch.no_grad():
-            image_features = self.clip_model.get_image_features(**clip_inputs)
-        image_features /= image_features.norm(p=2, dim=-1, keepdim=True)
+            image_features = self.clip_model.get_image_features(pixel_values=pixel_values)
+        return image_features / image_features.norm(p=2, dim=-1, keepdim=True)
 
-        similarity = (100.0 * image_features @ self.text_features.T).softmax(dim=-1)
-        top_score, top_idx = similarity[0].topk(1)
+    def _label_probs(self, pil_images):
+        """Softmax over self.clip_labels for each image — a (N, labels) tensor."""
+        image_features = self._image_features(pil_images)
+        return (100.0 * image_features @ self.text_features.T).softmax(dim=-1)
 
-        return self.clip_labels[top_idx[0]], top_score[0].item()
\ No newline at end of file
+    def _classify_crops(self, pil_images):
+        """
+        Runs CLIP zero-shot classification on a list of PIL images.
+        Returns [(best_label, confidence), ...] from self.clip_labels.
+        """
+        top_score, top_idx = self._label_probs(pil_images).max(dim=-1)
+
+        return [
+            (self.clip_labels[int(i)], float(score))
+            for score, i in zip(top_score, top_idx)
+        ]